@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+sys.path.insert(0, os.path.join(REPO_DIR, 'tn_prepper'))
+
+# The tests write nothing to output/: no LLM cache and no shared rate-limit state
+os.environ.setdefault('OPENAI_API_KEY', 'unused')
+os.environ.setdefault('LLM_CACHE', '0')
+os.environ.setdefault('LLM_RATE_LIMIT_SHARED', '0')
+
+
+@pytest.fixture(scope='session')
+def prepper(tmp_path_factory):
+    for module in ['bs4', 'openai', 'dotenv', 'tiktoken', 'requests']:
+        pytest.importorskip(module)
+
+    # The tokenizer encoding is downloaded the first time, which fails offline
+    try:
+        from TNPrepper import TNPrepper
+        prepper = TNPrepper()
+    except Exception as e:
+        pytest.skip(f'TNPrepper could not be constructed: {e}')
+    prepper.output_base_dir = str(tmp_path_factory.mktemp('output'))
+    prepper.verse_range = None
+    return prepper
+
+
+@pytest.fixture(scope='session')
+def prepper_and_book(prepper):
+    # TEST_BOOK_NAME (e.g. "Ruth") tests a whole book downloaded from door43; by default a few verses
+    # of Ruth in tests/data are parsed
+    book_name = os.getenv('TEST_BOOK_NAME')
+    if not book_name:
+        book_name = 'Ruth'
+        with open(os.path.join(DATA_DIR, 'ruth_sample.usfm'), 'r', encoding='utf-8') as file:
+            usfm = file.read()
+        prepper._get_book_usfm = lambda book_name, version: usfm
+
+    try:
+        parsed_book = prepper._load_parsed_book(book_name, 'ult')
+    except Exception as e:
+        pytest.skip(f'{book_name} could not be loaded: {e}')
+    return prepper, parsed_book, book_name
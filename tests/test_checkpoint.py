@@ -0,0 +1,22 @@
+from Checkpoint import Checkpoint
+
+
+def test_resume_finished_units(tmp_path):
+    path = str(tmp_path / 'Doublets.jsonl')
+    checkpoint = Checkpoint(path, resume=False, name='Doublets')
+    checkpoint.add('1', 'chapter one', 'response one')
+
+    resumed = Checkpoint(path, resume=True, name='Doublets')
+    assert resumed.get('1', 'chapter one') == (True, 'response one')
+    assert resumed.get('1', 'chapter one changed') == (False, None)
+    assert resumed.get('2', 'chapter two') == (False, None)
+    assert resumed.resumed == 1
+
+
+# Two scripts that once wrote the same file (as Kinship.py and RQuestion.py did) never resume each other's responses
+def test_resume_only_the_records_of_the_same_script(tmp_path):
+    path = str(tmp_path / 'RQuestion.jsonl')
+    Checkpoint(path, resume=False, name='RQuestion').add('1', 'chapter one', 'rhetorical questions')
+
+    assert Checkpoint(path, resume=True, name='Kinship').get('1', 'chapter one') == (False, None)
+    assert Checkpoint(path, resume=True).get('1', 'chapter one') == (True, 'rhetorical questions')
@@ -0,0 +1,78 @@
+import re
+from itertools import groupby
+
+import pytest
+
+
+# The text-based version of _figs_abstractnouns that the single-pass merge replaced: the glosses of the
+    # same word are merged, and repeated rows deleted, by re-running regexes until nothing changes
+def old_figs_abstractnouns(verse_data, ab_nouns):
+    from Lexicon_Matcher import LexiconMatcher
+
+    search_pattern = r'([^\n]*\d+:\d+)\t([^\n]+?)\t([^\n]+?)\t(.+?)\n(\1\t)([^\n]+?)(\t\3[^\n]+)'
+    replace_with = r'\1\t\2…\6\t\3\t\4'
+    combined_data = '\n'.join(['\t'.join(verse) for verse in verse_data])
+    while True:
+        new_text = re.sub(search_pattern, replace_with, combined_data, flags=re.DOTALL)
+        if new_text == combined_data:
+            break
+        combined_data = new_text
+    combined_data = combined_data.split('\n')
+
+    found_instances = []
+    matcher = LexiconMatcher(ab_nouns)
+    for line in combined_data:
+        first_tab = line.find('\t', 1)
+        last_tab = line.rfind('\t', 0, len(line) - 1)
+        if first_tab == -1 or last_tab <= first_tab:
+            continue
+        for ab_noun in matcher.find(line[first_tab + 1:last_tab]):
+            found_instances.append(f'{line}\t{ab_noun}\n')
+
+    pattern = r'([^\n]+?\d)(\t)([^\n\t]+)(\t)([^\n\t]+\t[^\n\t]+)(\t)([^\n\t]+)\n(\1\2\3\4\5\t[^\n\t]+)'
+    text = ''.join(found_instances)
+    while True:
+        new_text = re.sub(pattern, r'\8', text)
+        if new_text == text:
+            break
+        text = new_text
+    modified_verse_data = text.split('\n')
+
+    abstract_noun_counts = {}
+    for line in modified_verse_data:
+        parts = line.split('\t')
+        if line and len(parts) == 5:
+            abstract_noun_counts[parts[4]] = abstract_noun_counts.get(parts[4], 0) + 1
+    sorted_counts = sorted(abstract_noun_counts.items(), key=lambda x: x[1], reverse=True)
+
+    return modified_verse_data, sorted_counts
+
+
+# Whether a lexeme of the verse is a longer form of an earlier or later one. Only in such verses did the
+    # old version's result depend on the order its passes reached the rows.
+def has_prefix_lexemes(rows):
+    lexemes = {row[2] for row in rows}
+    return any(lexeme != other and lexeme.startswith(other) for lexeme in lexemes for other in lexemes)
+
+
+@pytest.fixture(scope='module')
+def ab_nouns(prepper):
+    from AbstractNouns import ab_nouns
+    return ab_nouns
+
+
+def test_figs_abstractnouns_matches_old_version(prepper_and_book, ab_nouns):
+    prepper, parsed_book, book_name = prepper_and_book
+    verse_data = prepper._create_verse_data(parsed_book, book_name, prepper.identification_patterns['abstract nouns'])
+    verse_data = [row for reference, rows in groupby(verse_data, key=lambda row: row[0])
+                  for rows in [list(rows)] if not has_prefix_lexemes(rows) for row in rows]
+    assert verse_data
+    assert prepper._figs_abstractnouns(verse_data, ab_nouns) == old_figs_abstractnouns(verse_data, ab_nouns)
+
+
+def test_figs_abstractnouns_merges_into_first_row_of_the_word(prepper):
+    verse_data = [['Ruth 1:1', 'the', 'אהבת', 'He,Ncfsc'], ['Ruth 1:1', 'love', 'אהבת', 'He,Ncfsc'],
+                  ['Ruth 1:1', 'of', 'אהב', 'He,Ncmsa'], ['Ruth 1:1', 'faithful', 'אהבת', 'He,Ncfsc']]
+    modified_verse_data, sorted_counts = prepper._figs_abstractnouns(verse_data, ['love'])
+    assert modified_verse_data == ['Ruth 1:1\tthe…love…faithful\tאהבת\tHe,Ncfsc\tlove', '']
+    assert sorted_counts == [('love', 1)]
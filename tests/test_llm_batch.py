@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from LLM_Batch import LLMBatch
+from Local_Batch_Client import LocalBatchClient
+
+
+# Answers with the chapter and the prompt, and fails for the chapters that contain "fail"
+def respond(body):
+    chapter = body['messages'][1]['content'].split('\n', 1)[-1]
+    prompt = body['messages'][-1]['content'].split('\n', 1)[-1]
+    if 'fail' in chapter:
+        raise ValueError(f'cannot answer about {chapter}')
+    return f'{chapter}: {prompt}'
+
+
+def body(chapter, prompt):
+    return {'model': 'test', 'messages': [{'role': 'system', 'content': 'system'},
+                                          {'role': 'user', 'content': f'Chapter:\n{chapter}'},
+                                          {'role': 'user', 'content': f'Prompt:\n{prompt}'}]}
+
+
+@pytest.fixture
+def llm_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr('LLM_Batch.atexit.register', lambda function: None)
+    llm_batch = LLMBatch(client=LocalBatchClient(respond), enabled=True)
+    llm_batch.batch_dir = str(tmp_path)
+    llm_batch.poll_seconds = 0
+    return llm_batch
+
+
+# Runs "process_chapter" for every chapter as a prompt chain, and returns the response (or exception) of each
+def run_chains(llm_batch, chapters, process_chapter):
+    results = {}
+
+    def __chain(chapter):
+        with llm_batch.chain():
+            try:
+                results[chapter] = process_chapter(chapter)
+            except Exception as e:
+                results[chapter] = e
+
+    llm_batch.expect_chains(len(chapters))
+    threads = [threading.Thread(target=__chain, args=(chapter,)) for chapter in chapters]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    return results
+
+
+# Two prompts per chapter, the second built from the answer to the first
+def two_prompts(llm_batch):
+    def __process_chapter(chapter):
+        first = llm_batch.request(body(chapter, 'first'))
+        return llm_batch.request(body(chapter, f'second after "{first}"'))
+    return __process_chapter
+
+
+def test_each_round_of_the_chains_is_one_batch(llm_batch):
+    chapters = ['1', '2', '3']
+    results = run_chains(llm_batch, chapters, two_prompts(llm_batch))
+
+    assert results == {chapter: f'{chapter}: second after "{chapter}: first"' for chapter in chapters}
+    assert llm_batch.batches == 2
+    assert llm_batch.requests == 6
+    assert llm_batch.failed == 0
+
+
+def test_failed_requests_are_counted(llm_batch):
+    results = run_chains(llm_batch, ['1', 'fail', '3'], two_prompts(llm_batch))
+
+    assert isinstance(results['fail'], RuntimeError)
+    assert 'cannot answer about fail' in str(results['fail'])
+    assert results['1'] == '1: second after "1: first"'
+    assert results['3'] == '3: second after "3: first"'
+    # The failed chain stops after its first request, so the second round has one request less
+    assert llm_batch.batches == 2
+    assert llm_batch.requests == 5
+    assert llm_batch.failed == 1
+
+
+# With _dispatch_chapters, the chapters whose chain failed are not checkpointed, so a resumed run asks about them again
+def test_dispatch_chapters_checkpoints_the_finished_chapters(prepper, llm_batch, monkeypatch):
+    monkeypatch.setattr(prepper, 'llm_batch', llm_batch)
+    monkeypatch.setattr(prepper, 'structured_output', False)
+    monkeypatch.setenv('BOOK_NAME', 'Batch Test')
+    chapters = {chapter: [{'Reference': f'{chapter}:1', 'Verse': verse}] for chapter, verse in [(1, 'one'), (2, 'fail'), (3, 'three')]}
+
+    def __process_prompt(chapter_content):
+        first = prepper._query_openai(chapter_content, 'first')
+        return first and prepper._query_openai(chapter_content, f'second after "{first}"')
+
+    monkeypatch.setenv('RESUME', '0')
+    responses = prepper._dispatch_chapters(chapters, __process_prompt, checkpoint_name='BatchTest')
+    assert responses == ['1:1 one: second after "1:1 one: first"', None, '3:1 three: second after "3:1 three: first"']
+    assert (llm_batch.batches, llm_batch.requests, llm_batch.failed) == (2, 5, 1)
+
+    monkeypatch.setenv('RESUME', '1')
+    responses = prepper._dispatch_chapters(chapters, __process_prompt, checkpoint_name='BatchTest')
+    assert responses[0] == '1:1 one: second after "1:1 one: first"'
+    assert responses[1] is None
+    # Only the failed chapter was sent again
+    assert (llm_batch.batches, llm_batch.requests, llm_batch.failed) == (3, 6, 2)
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from LLM_Cache import LLMCache
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    monkeypatch.setattr('LLM_Cache.atexit.register', lambda function: None)
+    return str(tmp_path / 'llm_cache.sqlite')
+
+
+def test_cached_response_is_reused(cache_path):
+    key = LLMCache.key('openai', 'model', 'system', {'1:1 verse'}, 'prompt', 0.4)
+    assert key == LLMCache.key('openai', 'model', 'system', {'1:1 verse'}, 'prompt', 0.4)
+    assert key != LLMCache.key('openai', 'model', 'system', {'1:1 verse'}, 'another prompt', 0.4)
+
+    assert LLMCache(cache_path, enabled=True).fetch(key, lambda: 'response') == ('response', False)
+
+    # Another run (e.g. another script) finds the response in the same file
+    cache = LLMCache(cache_path, enabled=True)
+    assert cache.fetch(key, lambda: pytest.fail('the response is cached')) == ('response', True)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_failed_response_is_not_cached(cache_path):
+    cache = LLMCache(cache_path, enabled=True)
+    assert cache.fetch('key', lambda: None) == (None, False)
+    assert cache.fetch('key', lambda: 'response') == ('response', False)
+    assert cache.misses == 2
+
+
+def test_refresh_replaces_cached_responses_once(cache_path):
+    LLMCache(cache_path, enabled=True).fetch('key', lambda: 'old response')
+
+    cache = LLMCache(cache_path, refresh=True, enabled=True)
+    assert cache.fetch('key', lambda: 'new response') == ('new response', False)
+    assert cache.fetch('key', lambda: pytest.fail('the response was refreshed')) == ('new response', True)
+
+
+def test_least_recently_used_responses_are_evicted(cache_path):
+    cache = LLMCache(cache_path, max_mb=2500 / (1024 * 1024), enabled=True)
+    cache.fetch('first', lambda: 'a' * 1000)
+    cache.fetch('second', lambda: 'b' * 1000)
+    cache.fetch('first', lambda: pytest.fail('the response is cached'))
+    cache.fetch('third', lambda: 'c' * 1000)
+
+    assert cache.fetch('first', lambda: 'new')[1]
+    assert cache.fetch('second', lambda: 'new') == ('new', False)
+
+
+def test_identical_requests_are_sent_once(cache_path):
+    cache = LLMCache(cache_path, enabled=True)
+    started = threading.Event()
+    release = threading.Event()
+    requests = []
+
+    def __request():
+        requests.append(1)
+        started.set()
+        release.wait(timeout=10)
+        return 'response'
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.fetch('key', __request)))
+    owner.start()
+    started.wait(timeout=10)
+    waiter = threading.Thread(target=lambda: results.append(cache.fetch('key', __request)))
+    waiter.start()
+    while not cache.coalesced and waiter.is_alive():
+        waiter.join(timeout=0.01)
+    release.set()
+    owner.join(timeout=10)
+    waiter.join(timeout=10)
+
+    assert len(requests) == 1
+    assert sorted(results) == [('response', False), ('response', True)]
+    assert cache.coalesced == 1
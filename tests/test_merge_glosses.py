@@ -0,0 +1,56 @@
+import re
+
+GO_FORMS = r'go|goes|gone|going|went|come|comes|coming|came|take|takes|taken|taking|took|bring|brings|bringing|brought'
+PASSIVE_FORMS = (r'arisen|awoke|been|borne|beaten|become|begun|bent|bet|bound|bitten|bled|blown|broken|brought|built|burst|bought|caught|chosen|come|'
+                 r'cost|crept|cut|dealt|dug|dived|done|drawn|dreamed|dreamt|drunk|driven|eaten|fallen|fed|felt|fought|found|fitted|fit|fled|flung|'
+                 r'flown|forbidden|forgotten|forgot|forgiven|frozen|got|gotten|given|gone|grown|hanged|hung|had|heard|hidden|hit|held|hurt|kept|'
+                 r'kneeled|knelt|knitted|known|laid|led|left|lent|let|lain|lied|lighted|lit|lost|made|meant|met|paid|pled|proved|proven|put|quit|'
+                 r'read|ridden|rung|risen|run|said|seen|sought|sold|sent|set|sewed|sewn|shaken|shone|shined|shot|showed|shown|shrunk|shut|sung|'
+                 r'sunk|sat|slain|slept|slid|slit|spoken|spent|spun|spat|spit|split|spread|sprung|stood|stolen|stuck|stung|stunk|stridden|struck|'
+                 r'strung|sworn|swept|swollen|swum|swung|taken|taught|torn|told|thought|thrown|understood|waked up|woken up|worn|wed|wept|welcomed|'
+                 r'wet|won|wrung|written|ed|en')
+
+
+# The text-based version of _figs_go and _figs_passive that _merge_glosses and _filter_rows replaced:
+    # the glosses of the same word are merged by re-running a regex until nothing changes, and the rows
+    # are filtered with "~" markers
+def old_figs(verse_data, filter_pattern):
+    modified_verse_data = list()
+    if verse_data:
+        all_text = '\n'.join(['\t'.join(line) for line in verse_data])
+        search_pattern = r'.+? (\d+:\d+)\t(.+?)\t(.+?)\t.+\n(.+? \1\t)(.+?\t\3.+)'
+        replace_with = r'\4\2…\5'
+        while True:
+            new_text = re.sub(search_pattern, replace_with, all_text)
+            if new_text == all_text:
+                break
+            all_text = new_text
+        all_text = re.sub(filter_pattern, r'~\1', all_text)
+        all_text = re.sub(r'\n[^~].+', r'', all_text)
+        all_text = re.sub(r'^[^~].+', r'', all_text)
+        all_text = re.sub(r'^\n', r'', all_text)
+        all_text = re.sub(r'~', r'', all_text)
+        modified_verse_data = [line.split('\t') for line in all_text.split('\n')]
+    return modified_verse_data
+
+
+def old_figs_go(verse_data):
+    return old_figs(verse_data, rf'(.+\b({GO_FORMS})\b)')
+
+
+def old_figs_passive(verse_data):
+    return old_figs(verse_data, rf'(.+\b(am|are|is|was|were|be|being|been)\b.+\b.*?({PASSIVE_FORMS})\b.+)')
+
+
+def test_figs_go_matches_old_version(prepper_and_book):
+    prepper, parsed_book, book_name = prepper_and_book
+    verse_data = prepper._create_verse_data(parsed_book, book_name, prepper.identification_patterns['go'])
+    assert verse_data
+    assert prepper._figs_go(verse_data) == old_figs_go(verse_data)
+
+
+def test_figs_passive_matches_old_version(prepper_and_book):
+    prepper, parsed_book, book_name = prepper_and_book
+    verse_data = prepper._create_verse_data(parsed_book, book_name, prepper.identification_patterns['passives'])
+    assert verse_data
+    assert prepper._figs_passive(verse_data) == old_figs_passive(verse_data)
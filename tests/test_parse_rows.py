@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+HEADERS = ['Reference', 'Explanation', 'Snippet', 'Alternate Translation']
+
+
+def test_rows_format_fixes_the_number_of_values(prepper, monkeypatch):
+    row_schema = prepper._rows_format(4)['json_schema']['schema']['properties']['rows']['items']
+    assert (row_schema['minItems'], row_schema['maxItems']) == (4, 4)
+    assert prepper._rows_format(4) == prepper._rows_format(4)
+    assert 'minItems' not in prepper._rows_format()['json_schema']['schema']['properties']['rows']['items']
+
+    monkeypatch.setattr(prepper, 'structured_output', False)
+    assert prepper._rows_format(4) is None
+
+
+def test_rows_of_json_and_tsv_responses(prepper):
+    json_response = json.dumps({'rows': [['1:1', 'The terms mean similar things', 'went and came', 'went'], ['1:2', 'only three values', 'x']]})
+    fenced_response = '```json\n{"rows": [["1:3", "Emphasis", "and she was left", "she remained"]]}\n```'
+    tsv_response = 'Here is the table:\n' + '\t'.join(HEADERS) + '\n1:4\tExplanation\tsnippet\talternate'
+
+    rows = prepper._parse_rows([json_response, None, fenced_response, tsv_response], HEADERS)
+    assert [row['Reference'] for row in rows] == ['1:1', '1:3', '1:4']
+    assert rows[1] == dict(zip(HEADERS, ['1:3', 'Emphasis', 'and she was left', 'she remained']))
+
+
+# The rows that do not fit go to the report of the book the script runs, even if BOOK_NAME names another book
+def test_malformed_rows_go_to_the_report_of_the_book(prepper, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('BOOK_NAME', 'Jonah')
+    monkeypatch.setattr(prepper, 'book_name', 'Ruth', raising=False)
+    (tmp_path / 'output' / 'Ruth').mkdir(parents=True)
+
+    prepper._parse_rows([json.dumps({'rows': [['no chapter and verse', 'a', 'b', 'c']]})], HEADERS)
+    with open(tmp_path / 'output' / 'Ruth' / 'report.md', 'r', encoding='utf-8') as report_file:
+        assert '["no chapter and verse", "a", "b", "c"]' in report_file.read()
+
+
+def test_fused_rows_are_split_by_issue(prepper, monkeypatch):
+    pytest.importorskip('groq')
+    from Fused_Detection import FusedDetection
+
+    reported = []
+    fused = FusedDetection.__new__(FusedDetection)
+    fused.__dict__.update(prepper.__dict__)
+    monkeypatch.setattr(fused, '_report_rows', lambda row_texts, description: reported.extend(row_texts), raising=False)
+
+    response = json.dumps({'rows': [
+        ['doublet', '1:2', 'The terms **a** and **b** mean similar things.', 'a and b', 'a'],
+        ['parallelism', '1:3', 'clause one, clause two', 'one clause', 'the writer'],
+        ['parallelism', '1:4', 'too few values'],
+        ['metaphor', '1:5', 'x', 'y', 'z'],
+    ]})
+    rows = fused._split_rows([response], ['doublets', 'parallelism'])
+
+    assert [row['Reference'] for row in rows['doublets']] == ['1:2']
+    assert [row['Reference'] for row in rows['parallelism']] == ['1:3']
+    assert len(reported) == 2
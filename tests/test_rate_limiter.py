@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import pytest
+
+from Rate_Limiter import RateLimiter
+
+
+class ServerError(Exception):
+    status_code = 503
+
+    def __init__(self, headers):
+        super().__init__('unavailable')
+        self.response = SimpleNamespace(headers=headers)
+
+
+# Sends one request that fails once with "headers", and returns the delay the limiter slept before retrying
+def retry_delay(monkeypatch, headers):
+    sleeps = []
+    monkeypatch.setattr('Rate_Limiter.time.sleep', sleeps.append)
+    monkeypatch.setattr('Rate_Limiter.atexit.register', lambda function: None)
+    limiter = RateLimiter('Test', requests_per_minute=0, tokens_per_minute=0, max_retries=1)
+    failures = [ServerError(headers)]
+
+    def request():
+        if failures:
+            raise failures.pop()
+        return SimpleNamespace(headers={})
+
+    limiter.send(request)
+    assert limiter.retries == 1
+    return sleeps[0]
+
+
+def test_retry_after_ms(monkeypatch):
+    assert retry_delay(monkeypatch, {'retry-after-ms': '1500'}) == pytest.approx(1.5)
+
+
+def test_unparseable_retry_after_ms_falls_back_to_retry_after(monkeypatch):
+    assert retry_delay(monkeypatch, {'Retry-After-Ms': 'soon', 'Retry-After': '2'}) == pytest.approx(2)
+
+
+def test_unparseable_retry_after_ms_falls_back_to_backoff(monkeypatch):
+    # The first backoff is between half a second and a second
+    assert 0.5 <= retry_delay(monkeypatch, {'retry-after-ms': 'soon'}) <= 1
+
+
+class Waited(Exception):
+    pass
+
+
+# Returns the seconds "limiter" waits before it may send one more request (or 0)
+def wait_before_next_request(monkeypatch, limiter, tokens=0):
+    def __sleep(seconds):
+        raise Waited(seconds)
+
+    monkeypatch.setattr('Rate_Limiter.time.sleep', __sleep)
+    try:
+        limiter.acquire(tokens)
+    except Waited as e:
+        return e.args[0]
+    return 0
+
+
+@pytest.mark.parametrize('shared', [True, False])
+def test_scripts_share_the_request_limit(monkeypatch, tmp_path, shared):
+    monkeypatch.setattr('Rate_Limiter.atexit.register', lambda function: None)
+    monkeypatch.setenv('LLM_RATE_LIMIT_SHARED', '1' if shared else '0')
+    monkeypatch.setenv('LLM_RATE_LIMIT_PATH', str(tmp_path / 'rate_limits.sqlite'))
+    first_script = RateLimiter('Test', requests_per_minute=1, tokens_per_minute=0)
+    second_script = RateLimiter('Test', requests_per_minute=1, tokens_per_minute=0)
+
+    assert wait_before_next_request(monkeypatch, first_script) == 0
+    if shared:
+        assert wait_before_next_request(monkeypatch, second_script) == pytest.approx(60, abs=1)
+    else:
+        assert wait_before_next_request(monkeypatch, second_script) == 0
+
+
+def test_tokens_are_limited(monkeypatch):
+    monkeypatch.setattr('Rate_Limiter.atexit.register', lambda function: None)
+    limiter = RateLimiter('Test', requests_per_minute=0, tokens_per_minute=600)
+
+    assert wait_before_next_request(monkeypatch, limiter, tokens=500) == 0
+    limiter.record(50)
+    # 50 tokens are left, and 10 tokens come back every second
+    assert wait_before_next_request(monkeypatch, limiter, tokens=100) == pytest.approx(5, abs=0.5)
+
+
+def test_exhausted_rate_limit_headers_block_requests(monkeypatch):
+    monkeypatch.setattr('Rate_Limiter.atexit.register', lambda function: None)
+    limiter = RateLimiter('Test', requests_per_minute=100, tokens_per_minute=0)
+
+    limiter.update({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '6m0s'})
+    assert wait_before_next_request(monkeypatch, limiter) == pytest.approx(360, abs=1)
@@ -0,0 +1,33 @@
+from Span_Aligner import SpanAligner
+
+
+def test_span_is_an_exact_quote_of_the_verse():
+    verse = 'May Yahweh give to you that you may find rest, each woman in the house of her husband.'
+    assert SpanAligner().align(verse, 'that you may live peacefully', 'rest') == 'that you may find rest'
+
+
+def test_words_of_the_alternate_translation_match_in_order():
+    # "me" of the alternate translation comes after "the Almighty", so the "me" before it is not part of the span
+    verse = 'Yahweh has testified against me, and the Almighty has brought calamity on me.'
+    assert SpanAligner().align(verse, 'the Almighty has made me suffer') == 'the Almighty has'
+
+
+def test_anchor_with_an_ellipsis():
+    verse = 'And they took for themselves Moabite wives; the name of the first was Orpah.'
+    assert SpanAligner().align(verse, 'they married Moabite women', 'took…wives') == 'they took for themselves Moabite wives'
+
+
+def test_anchor_parts_are_found_in_order():
+    aligner = SpanAligner()
+    verse_words = [word for word, start, end in aligner.tokenize('And she was left, she and her two sons.')]
+    assert aligner._find_anchor(verse_words, 'she…was left') == (1, 3)
+    assert aligner._find_anchor(verse_words, 'her…sons') == (6, 8)
+    assert aligner._find_anchor(verse_words, 'sons…her') is None
+
+
+def test_stems():
+    assert [SpanAligner.stem(word) for word in ['sons', 'walked', 'going', 'goes', 'naomi’s', 'is', 'rest']] == ['son', 'walk', 'go', 'go', 'naomi', 'is', 'rest']
+
+
+def test_no_matching_words():
+    assert SpanAligner().align('And Naomi said to her two daughters-in-law', 'completely unrelated') is None
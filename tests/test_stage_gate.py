@@ -0,0 +1,59 @@
+import time
+import threading
+
+from Stage_Gate import StageGate
+
+
+# Waits until "count" requests wait for a slot of "gate"
+def wait_for_waiting(gate, count):
+    deadline = time.time() + 10
+    while len(gate.waiting) < count:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_free_slot_goes_to_the_latest_stage(monkeypatch):
+    gate = StageGate(1)
+    order = []
+
+    def __request(stage):
+        with gate.slot(stage):
+            order.append(stage)
+
+    with gate.slot(0):
+        threads = []
+        for count, stage in enumerate([0, 2, 1], start=1):
+            threads.append(threading.Thread(target=__request, args=(stage,)))
+            threads[-1].start()
+            wait_for_waiting(gate, count)
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert order == [2, 1, 0]
+    assert {stage: stats[0] for stage, stats in gate.stats.items()} == {0: 2, 1: 1, 2: 1}
+
+
+def test_no_more_requests_than_slots():
+    gate = StageGate(2)
+    running = []
+    most_running = []
+    lock = threading.Lock()
+
+    def __request(stage):
+        with gate.slot(stage):
+            with lock:
+                running.append(stage)
+                most_running.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(stage)
+
+    threads = [threading.Thread(target=__request, args=(stage % 3,)) for stage in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert max(most_running) == 2
+    assert len(most_running) == 8
+    assert 'stage 1: ' in gate.report()
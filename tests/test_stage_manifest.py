@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from Stage_Manifest import StageManifest
+
+
+@pytest.fixture
+def manifests(tmp_path, monkeypatch):
+    for name in StageManifest.environment_variables + ['FUSED_GROUPS']:
+        monkeypatch.delenv(name, raising=False)
+    for file_name in ['Doublets.py', 'Fused_Detection.py'] + StageManifest.shared_modules:
+        (tmp_path / file_name).write_text(f'# {file_name}\n', encoding='utf-8')
+    book_dir = tmp_path / 'output' / 'Ruth'
+    book_dir.mkdir(parents=True)
+    (book_dir / 'ult_book.tsv').write_text('Reference\tVerse\n', encoding='utf-8')
+    (book_dir / 'ai_doublets.tsv').write_text('Reference\tDoublet\n', encoding='utf-8')
+    return StageManifest(str(tmp_path), 'Ruth')
+
+
+def test_unchanged_stage_matches(manifests):
+    manifests.save(manifests.build('Doublets.py', ['ult_book.tsv']), ['ai_doublets.tsv', 'not_written.tsv'])
+    assert manifests.matches(manifests.build('Doublets.py', ['ult_book.tsv']))
+
+    manifests.remove('Doublets.py')
+    assert not manifests.matches(manifests.build('Doublets.py', ['ult_book.tsv']))
+
+
+@pytest.mark.parametrize('change', ['code', 'shared module', 'input', 'output', 'environment'])
+def test_changed_stage_does_not_match(manifests, monkeypatch, change):
+    manifests.save(manifests.build('Doublets.py', ['ult_book.tsv']), ['ai_doublets.tsv'])
+    changed_file = {
+        'code': os.path.join(manifests.script_path, 'Doublets.py'),
+        'shared module': os.path.join(manifests.script_path, 'TNPrepper.py'),
+        'input': os.path.join(manifests.book_dir, 'ult_book.tsv'),
+        'output': os.path.join(manifests.book_dir, 'ai_doublets.tsv'),
+    }.get(change)
+    if changed_file:
+        with open(changed_file, 'a', encoding='utf-8') as file:
+            file.write('changed\n')
+    else:
+        monkeypatch.setenv('VERSE_RANGE', '1:1-5')
+
+    assert not manifests.matches(manifests.build('Doublets.py', ['ult_book.tsv']))
+
+
+def test_script_environment_only_changes_its_stage(manifests, monkeypatch):
+    manifests.save(manifests.build('Doublets.py', ['ult_book.tsv']), ['ai_doublets.tsv'])
+    manifests.save(manifests.build('Fused_Detection.py', ['ult_book.tsv']), [])
+
+    monkeypatch.setenv('FUSED_GROUPS', 'nouns')
+    assert manifests.matches(manifests.build('Doublets.py', ['ult_book.tsv']))
+    assert not manifests.matches(manifests.build('Fused_Detection.py', ['ult_book.tsv']))
@@ -0,0 +1,30 @@
+import csv
+
+
+def read_notes(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return list(csv.DictReader(file, delimiter='\t'))
+
+
+# A verse range without notes (as in ATs_snippets.py) drops the notes of the range and keeps the others
+def test_write_output_of_a_range_without_notes(prepper, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(prepper, 'verse_range', prepper._parse_verse_range('2'))
+    fieldnames = ['Reference', 'ID', 'Note']
+    notes = [
+        {'Reference': '1:1', 'ID': 'a1', 'Note': 'first'},
+        {'Reference': '2:3', 'ID': 'b2', 'Note': 'second'},
+        {'Reference': '3:5', 'ID': 'c3', 'Note': 'third'},
+    ]
+    output_file = tmp_path / 'output' / 'Ruth' / 'ai_notes.tsv'
+    output_file.parent.mkdir(parents=True)
+    with open(output_file, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, delimiter='\t', fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(notes)
+
+    range_notes = prepper._filter_verse_range([note for note in notes if note['Reference'] != '2:3'])
+    assert range_notes == []
+    prepper._write_output(book_name='Ruth', file='ai_notes.tsv', headers=fieldnames, data=range_notes, fieldnames=fieldnames)
+
+    assert read_notes(output_file) == [notes[0], notes[2]]
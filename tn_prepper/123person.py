@@ -6,6 +6,9 @@ import re
 from dotenv import load_dotenv
 
 class Person(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Speaker', 'Explanation', 'Snippet', 'Alternate Translation']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -32,15 +35,15 @@ class Person(TNPrepper):
 
         prompt3 = (
             f"You have been given a chapter from the Bible. Here is a list of places where people refer to themselves or to the people with whom they are speaking in the third person:\n{response2}\n\n"
-            "For each instance, append a row of exactly four tab-separated values to a TSV table. If there are multiple instances in a verse of the same type, address all of them with one row. Here is what you should include in each row:"
-            "\n(1) The first tab-separated value will provide the chapter and verse where the identified instance is found. Do not include the book name."
-            "\n(2) The second tab-separated value will indicate whether it would be more natural to use the first person or the second person here. Use the word 'first' or the word 'second' as your answer."
-            "\n(3) The third tab-separated value will provide an explanation of the issue. If it would be more natural to use the first person, use this template: '[Speaker] is speaking about himself in the third person. If this would not be natural in your language, you could use the first person form'."
+            "For each instance, add a row to the table. If there are multiple instances in a verse of the same type, address all of them with one row. Each row must contain exactly five values:"
+            "\n(1) The first value will provide the chapter and verse where the identified instance is found. Do not include the book name."
+            "\n(2) The second value will indicate whether it would be more natural to use the first person or the second person here. Use the word 'first' or the word 'second' as your answer."
+            "\n(3) The third value will provide an explanation of the issue. If it would be more natural to use the first person, use this template: '[Speaker] is speaking about himself in the third person. If this would not be natural in your language, you could use the first person form'."
             "If it would be more natural to use the second person, use this template: 'Here [Speaker] addresses [Recipient] in the third person to [function]. If this would not be natural in your language, you could use the second-person form and indicate the [function] in another way'. Replace the bracketed phrases with the appropriate information from the verse (without brackets)."
-            "\n(4) The fourth tab-separated value will provide an exact quote from the verse. This quote will include the section of the verse that will need to be rephrased in order to model how to express the idea in first or second person instead of third person."
-            "\n(5) The fifth tab-separated value will rephrase the exact quote from the third tab-separated value. The rephrased text will model how to express the idea in first or second person instead of third person. Ensure that the rephrased text is as close as possible to the exact quote and can exactly replace the quote."
+            "\n(4) The fourth value will provide an exact quote from the verse. This quote will include the section of the verse that will need to be rephrased in order to model how to express the idea in first or second person instead of third person."
+            "\n(5) The fifth value will rephrase the exact quote from the fourth value. The rephrased text will model how to express the idea in first or second person instead of third person. Ensure that the rephrased text is as close as possible to the exact quote and can exactly replace the quote."
         )
-        return self._query_openai(chapter_content, prompt3)
+        return self._query_rows(chapter_content, prompt3, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -81,6 +84,9 @@ class Person(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -95,32 +101,14 @@ class Person(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 5:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Speaker': columns[1],
-                        'Explanation': columns[2],
-                        'Snippet': columns[3],
-                        'Alternate Translation': columns[4],
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='123person')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'Speaker', 'Explanation', 'Snippet', 'Alternate Translation']
+        headers = self.row_headers
         file_name = 'ai_123person.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)
@@ -1,10 +1,13 @@
-from TNPrepper import TNPrepper
+from TNPrepper import TNPrepper, groq_rate_limiter
+from Checkpoint import Checkpoint
+from Span_Aligner import SpanAligner
 
 import re
+import json
+from itertools import groupby
 from groq import Groq
 import os
 from dotenv import load_dotenv
-import time
 
 
 class ATSnippets(TNPrepper):
@@ -22,23 +25,33 @@ class ATSnippets(TNPrepper):
         self.groq_client = Groq(api_key=api_key)
         self.groq_model = 'llama3-70b-8192'
 
-    # Function to wait between queries
-    def __wait_between_queries(self, seconds):
-        print(f"Waiting for {seconds} seconds...")
-        time.sleep(seconds)
+        # The snippets of the rephrased notes are found in the verse text (see __align_snippet)
+        self.span_aligner = SpanAligner()
+        self.span_stats = {'aligned': 0, 'kept': 0}
+        self.verse_map = {}
+
+        # The notes of a verse are asked about together, up to NOTES_PER_QUERY notes in one query
+        # (see __query_verse); NOTES_PER_QUERY=1 asks about each note on its own
+        self.notes_per_query = max(1, int(os.getenv('NOTES_PER_QUERY', '8')))
+        self.verse_answers = {}
+        self.verse_prompts = set()
+        self.note_query_stats = {'verse queries': 0, 'answered': 0, 'fallback': 0}
 
     # Function to query the LLM
     def __query_llm(self, context, prompt):
         combined_prompt = f"Verse and context:\n{context}\n\nPrompt:\n{prompt}"
+        system_prompt = "You are a bible-believing scholar. You are analyzing a text and providing answers that exactly match that text. You should not provide explanations and interpretation unless you are specifically asked to do so."
         response = None
+        from_cache = False
 
-        try:
-            chat_completion = self.groq_client.chat.completions.create(
+        def __request():
+            # The rate limiter does the retrying, so the client should not
+            raw_response = groq_rate_limiter.send(lambda: self.groq_client.with_options(max_retries=0).chat.completions.with_raw_response.create(
                 messages=[
 
                     {
                         "role": "system",
-                        "content": "You are a bible-believing scholar. You are analyzing a text and providing answers that exactly match that text. You should not provide explanations and interpretation unless you are specifically asked to do so."
+                        "content": system_prompt
                     },
 
                     {
@@ -47,8 +60,13 @@ class ATSnippets(TNPrepper):
                     }
                 ],
                 model=self.groq_model,
-            )
-            response = chat_completion.choices[0].message.content.strip()
+            ), tokens=len(self.tokenizer.encode(system_prompt)) + len(self.tokenizer.encode(combined_prompt)))
+            chat_completion = raw_response.parse()
+            return chat_completion.choices[0].message.content.strip()
+
+        try:
+            cache_key = self.llm_cache.key('groq', self.groq_model, system_prompt, context, prompt, None)
+            response, from_cache = self.llm_cache.fetch(cache_key, __request, provider='groq', model=self.groq_model)
 
         except Exception as e:
             print(f"Request failed: {e}")
@@ -57,33 +75,75 @@ class ATSnippets(TNPrepper):
         finally:
             print(combined_prompt)
             print(f'Response: {response}')
+            if from_cache:
+                print('(cached response)')
             print('---')
 
-            # Waiting, to stay below our request limit (30 reqs/minute)
-            self.__wait_between_queries(2)
-
             return response
 
-    # Function for SupportReference: rc://*/ta/man/translate/translate-names
-    def __process_support_reference_translate_names(self, note, context, verse_reference, ai_notes):
-        # Extract verse text and context
+    # Sets the snippet of a note to the words of the verse that "alternate_translation" replaces, which
+        # always cover "anchor" (see Span_Aligner.py). This used to be a second query asking which exact
+        # words of the verse the alternate translation is equivalent to. If none of its words are in the
+        # verse and there is no anchor, the snippet is left as it is.
+    def __align_snippet(self, note, verse_reference, alternate_translation, anchor):
+        snippet = self.span_aligner.align(self.verse_map.get(verse_reference, ''), alternate_translation, anchor)
+        if snippet:
+            note['Snippet'] = snippet
+            self.span_stats['aligned'] += 1
+        else:
+            self.span_stats['kept'] += 1
+
+    # Returns the answer to "prompt" about a note of the current verse: the answer from the query for
+        # the whole verse (see __query_verse) if there is one, otherwise the answer of a query of its own
+    def __ask(self, context, prompt):
+        answer = self.verse_answers.get(prompt)
+        if answer is not None:
+            return answer
+        if prompt in self.verse_prompts:
+            self.note_query_stats['fallback'] += 1
+        return self._query_openai(context, prompt)
+
+    # Asks the questions about the notes of one verse ([(ID, prompt)]) in one query and returns
+        # {prompt: answer} for the questions that were answered
+    def __query_verse(self, context, verse_reference, questions):
+        prompt = (
+            f"Answer each of the following questions about {verse_reference}. Each question has an ID.\n\n"
+            + "\n\n".join(f"ID: {note_id}\nQuestion: {question}" for note_id, question in questions)
+            + "\n\nReturn a table with one row for each question. Each row must contain exactly two values: "
+              "(1) the ID of the question, and (2) the answer, following the instructions of the question."
+        )
 
-        # Example of how to generate prompts and process responses
+        response = self._query_rows(context, prompt, ['ID', 'Answer'])
+        self.note_query_stats['verse queries'] += 1
+
+        questions_by_id = dict(questions)
+        answers = {}
+        for row in self._parse_rows([response], ['ID', 'Answer']):
+            question = questions_by_id.get(row['ID'].strip(' *'))
+            answer = row['Answer'].strip()
+            if question is not None and answer:
+                answers[question] = answer
+        self.note_query_stats['answered'] += len(answers)
+        return answers
+
+    # Prompt for SupportReference: rc://*/ta/man/translate/translate-names
+    def __prompt_translate_names(self, note, verse_reference):
         bold_word_match = re.search(r'\*\*(.*?)\*\*', note['Note'])
         if not bold_word_match:
             bold_word = ''
         else:
             bold_word = bold_word_match.group(1)
 
-        # Generate prompt
-        prompt = (
+        return (
             f"Given the context and the what you already know, does the name '{bold_word}' in {verse_reference} refer to a man, woman, god, province, region, city, or something else? "
             f"If the name refers to a person, identify only whether the person is a man or a woman. If the name refers to anything else, be as specific as possible."
             f"Provide a one-word answer that identifies the class of thing the name '{bold_word}' refers to."
         )
 
+    # Function for SupportReference: rc://*/ta/man/translate/translate-names
+    def __process_support_reference_translate_names(self, note, context, verse_reference, ai_notes):
         # Query LLM for response
-        response = self._query_openai(context, prompt)
+        response = self.__ask(context, self.__prompt_translate_names(note, verse_reference))
 
         if response is None:
             ai_notes.append(note)
@@ -93,18 +153,16 @@ class ATSnippets(TNPrepper):
             note['Note'] = note['Note'].replace('______', response.rstrip('.').lower())
             ai_notes.append(note)
 
-    # Function for SupportReference: rc://*/ta/man/translate/figs-abstractnouns
-    def __process_support_reference_abstract_nouns(self, note, context, verse_reference, ai_notes):
+    # Prompt for SupportReference: rc://*/ta/man/translate/figs-abstractnouns (None if the note has no bold nouns)
+    def __prompt_abstract_nouns(self, note, verse_reference):
         if note['Note'].count('*') == 4:
-            # Example of how to generate prompts and process responses
             bold_word_match = re.search(r'\*\*(.*?)\*\*', note['Note'])
             if not bold_word_match:
                 bold_word = ''
             else:
                 bold_word = bold_word_match.group(1)
 
-            # Generate prompt 1
-            prompt1 = (
+            return (
                 f"In {verse_reference}, the noun '{bold_word}' is abstract. Express the meaning with the same root form in a different part of speech (such as in adverb or adjective form). For example, 'joy' could become 'joyful'. When you do this, you may need to adjust the rest of the clause. "
                 f"Make your answer as short as possible, and respond with the rephrased text only. Do not include any explanation."
             )
@@ -117,112 +175,91 @@ class ATSnippets(TNPrepper):
                 found_phrase = bold_phrase_match.group(1)
                 bold_phrase = re.sub(r"\*\*", r"'", found_phrase)
 
-            # Generate prompt 1
-            prompt1 = (
+            return (
                 f"In {verse_reference}, the nouns {bold_phrase} are all abstract. Express the meaning with the same root forms but with a different part of speech (such as in adverb or adjective forms). For example, 'joy' could become 'joyful'. When you do this, you may need to adjust the rest of the clause. "
                 f"Make your answer as short as possible, and respond with the rephrased text only."
             )
 
+        return None
+
+    # Function for SupportReference: rc://*/ta/man/translate/figs-abstractnouns
+    def __process_support_reference_abstract_nouns(self, note, context, verse_reference, ai_notes):
+        prompt1 = self.__prompt_abstract_nouns(note, verse_reference)
+        if prompt1 is None:
+            ai_notes.append(note)
+            return
+
         # Query LLM for response 1
-        response1 = self._query_openai(context, prompt1)
+        response1 = self.__ask(context, prompt1)
         if response1 is None:
             ai_notes.append(note)
 
         else:
-            # Generate prompt 2 using response 1
+            # Process response 1; the snippet covers the (first) abstract noun
             response1_cleaned = response1.strip('"“”‘’….()\'')
-            prompt2 = (
-                f"Which exact words from {verse_reference} are the words '{response1_cleaned}' semantically equivalent to? Respond by quoting exact words from the verse only. Do not include any explanation."
-            )
-
-            # Query LLM for response 2
-            response2 = self._query_openai(context, prompt2)
-            if response2 is None:
-                ai_notes.append(note)
+            note['Note'] = note['Note'].replace('alternate_translation', response1_cleaned)
+            anchor_match = re.search(r'\*\*(.*?)\*\*', note['Note'])
+            self.__align_snippet(note, verse_reference, response1_cleaned, anchor_match.group(1) if anchor_match else None)
+            ai_notes.append(note)
 
-            else:
-                # Process responses
-                note['Note'] = note['Note'].replace('alternate_translation', response1_cleaned)
-                note['Snippet'] = response2.strip('"“”‘’….()\'')
-                ai_notes.append(note)
+    # Prompt for SupportReference: rc://*/ta/man/translate/translate-ordinal
+    def __prompt_translate_ordinal(self, note, verse_reference):
+        return (
+            f"In {verse_reference}, the word or phrase '{note['Snippet']}' is or contains an ordinal number. Provide a way to express the idea by using a cardinal number. Make your answer as short as possible, and respond with the rephrased text only. Do not include any explanation."
+        )
 
     # Function for SupportReference: rc://*/ta/man/translate/translate-ordinal
     def __process_support_reference_translate_ordinal(self, note, context, verse_reference, ai_notes):
 
         snippet = note['Snippet']
 
-        # Generate prompt 1
-        prompt1 = (
-            f"In {verse_reference}, the word or phrase '{snippet}' is or contains an ordinal number. Provide a way to express the idea by using a cardinal number. Make your answer as short as possible, and respond with the rephrased text only. Do not include any explanation."
-        )
-
         # Query LLM for response 1
-        response1 = self._query_openai(context, prompt1)
+        response1 = self.__ask(context, self.__prompt_translate_ordinal(note, verse_reference))
         if response1 is None:
             ai_notes.append(note)
 
         else:
-            # Generate prompt 2 using response 1
+            # Process response 1; the snippet covers the old snippet
             response1_cleaned = response1.strip('"“”‘’….()\'')
-            prompt2 = (
-                f"Which exact words from {verse_reference} are the words '{response1_cleaned}' semantically equivalent to? Respond with the exact words from the verse only. Do not include any explanation."
-            )
-
-            # Query LLM for response 2
-            response2 = self._query_openai(context, prompt2)
-            if response2 is None:
-                ai_notes.append(note)
-
-            # Process responses
             note['Note'] = note['Note'].replace('alternate_translation', response1_cleaned)
-            note['Snippet'] = response2.strip('"“”‘’….()\'')
+            self.__align_snippet(note, verse_reference, response1_cleaned, snippet)
             ai_notes.append(note)
 
+    # Prompt for SupportReference: rc://*/ta/man/translate/figs-activepassive
+    def __prompt_figs_activepassive(self, note, verse_reference):
+        return (
+            f"In {verse_reference}, the phrase '{note['Snippet']}' contains one or several passive forms. Provide a way to express the idea in active form, including the agent of the action if you can infer it from the context. Make your answer as short as possible, and respond with the rephrased text only."
+        )
+
     # Function for SupportReference: rc://*/ta/man/translate/figs-activepassive
     def __process_support_reference_figs_activepassive(self, note, context, verse_reference, ai_notes):
 
         snippet = note['Snippet']
 
-        # Generate prompt 1
-        prompt1 = (
-            f"In {verse_reference}, the phrase '{snippet}' contains one or several passive forms. Provide a way to express the idea in active form, including the agent of the action if you can infer it from the context. Make your answer as short as possible, and respond with the rephrased text only."
-        )
-
         # Query LLM for response 1
-        response1 = self._query_openai(context, prompt1)
+        response1 = self.__ask(context, self.__prompt_figs_activepassive(note, verse_reference))
         if response1 is None:
             ai_notes.append(note)
 
         else:
-            # Generate prompt 2 using response 1
+            # Process response 1; the snippet covers the old snippet
             response1_cleaned = response1.strip('"“”‘’….()\'')
-            prompt2 = (
-                f"Which exact words from {verse_reference} are the words '{response1_cleaned}' semantically equivalent to? Respond with the exact words from the verse only. Do not include any explanation."
-            )
-
-            # Query LLM for response 2
-            response2 = self._query_openai(context, prompt2)
-            if response2 is None:
-                ai_notes.append(note)
-
-            # Process responses
             note['Note'] = note['Note'].replace('alternate_translation', response1_cleaned)
-            note['Snippet'] = response2.strip('"“”‘’….()\'')
+            self.__align_snippet(note, verse_reference, response1_cleaned, snippet)
             ai_notes.append(note)
 
-    # Function for SupportReference: rc://*/ta/man/translate/figs-go
-    def __process_support_reference_figs_go(self, note, context, verse_reference, ai_notes):
-
-        snippet = note['Snippet']
-
-        # Generate prompt
-        prompt = (
-            f"Given the context, does the verb or verb phrase '{snippet}' in {verse_reference} indicate movement through space/time? "
+    # Prompt for SupportReference: rc://*/ta/man/translate/figs-go
+    def __prompt_figs_go(self, note, verse_reference):
+        return (
+            f"Given the context, does the verb or verb phrase '{note['Snippet']}' in {verse_reference} indicate movement through space/time? "
             f"Answer with 'Yes' or 'No' only, and do not provide any explanation."
         )
 
+    # Function for SupportReference: rc://*/ta/man/translate/figs-go
+    def __process_support_reference_figs_go(self, note, context, verse_reference, ai_notes):
+
         # Query LLM for response
-        response = self._query_openai(context, prompt)
+        response = self.__ask(context, self.__prompt_figs_go(note, verse_reference))
         if response is None:
             ai_notes.append(note)
 
@@ -247,6 +284,15 @@ class ATSnippets(TNPrepper):
             # Add more mappings as needed
         }
 
+        # The prompts of the processing functions, so that the notes of a verse can be asked about together
+        prompt_builders = {
+            'rc://*/ta/man/translate/translate-names': self.__prompt_translate_names,
+            'rc://*/ta/man/translate/figs-abstractnouns': self.__prompt_abstract_nouns,
+            'rc://*/ta/man/translate/translate-ordinal': self.__prompt_translate_ordinal,
+            'rc://*/ta/man/translate/figs-activepassive': self.__prompt_figs_activepassive,
+            'rc://*/ta/man/translate/figs-go': self.__prompt_figs_go,
+        }
+
         # Acquire the name of the Bible book
         book_name = self._get_book_name()
 
@@ -258,22 +304,35 @@ class ATSnippets(TNPrepper):
 
         # Organize verse texts for easy access
         verse_map = {verse['Reference']: verse['Verse'] for verse in verse_texts}
+        self.verse_map = verse_map
 
         # Prepare the context and query the LLM for each note
 
+        # The columns of the notes, taken before the notes are narrowed down
+        fieldnames = note_texts[0].keys()  # Assuming all notes have the same keys
+
+        # Keep only the notes in VERSE_RANGE, if one is set; ai_notes.tsv keeps the notes of the other verses
+        note_texts = self._filter_verse_range(note_texts)
+
         # If we are on DEV, we only process the first 5 notes
         if os.getenv('STAGE') == 'dev':
             note_texts = note_texts[:5]
 
-        for note in note_texts:
+        # The notes each note turned into are appended here as they are finished; with RESUME=1,
+        # the notes finished by an interrupted run are taken from here instead of being queried again
+        checkpoint = Checkpoint(f'{self.output_base_dir}/{book_name}/checkpoints/ATs_snippets.jsonl', name='ATs_snippets')
+
+        # The notes are in verse order, so the notes of a verse come one after another
+        for chapter_verse, verse_notes in groupby(note_texts, key=lambda note: note['Reference']):
+            verse_notes = list(verse_notes)
+
             # Construct the verse reference using the book name and the first column of the note
-            chapter_verse = note['Reference']
             verse_reference = f"{book_name} {chapter_verse}"
 
             # Extract the text of the verse and its surrounding verses
             verse_text = verse_map.get(verse_reference)
             if verse_text is None:
-                print(f"Verse {verse_reference} not found in {self.verse_text}. Skipping note.")
+                print(f"Verse {verse_reference} not found in {self.verse_text}. Skipping {len(verse_notes)} notes.")
                 continue
 
             # Find previous and next verses if available
@@ -288,19 +347,59 @@ class ATSnippets(TNPrepper):
             context = {
                 f'{prev_verse_reference} {prev_verse_text}\n{verse_reference} {verse_text}\n{next_verse_reference} {next_verse_text}'}
 
-            # Determine which processing function to use based on the SupportReference
-            support_ref = note['SupportReference']
-            if support_ref in support_reference_handlers:
-                # Call the appropriate processing function for this SupportReference
-                support_reference_handlers[support_ref](note, context, verse_reference, ai_notes)
-            else:
-                print(f"Unknown SupportReference: {support_ref}. Appending unmodified note.")
-                ai_notes.append(note)
-
-        result_lines = self._combine_names(ai_notes)
+            # The handlers change the notes, so take their checkpoint keys first
+            units = [json.dumps(note, ensure_ascii=False, sort_keys=True) for note in verse_notes]
+            checkpoint_results = [checkpoint.get(unit, str(context)) if note['SupportReference'] in support_reference_handlers else (False, None)
+                                  for note, unit in zip(verse_notes, units)]
+
+            # Ask about the unfinished notes of the verse together; a note whose answer is missing from
+            # the response is asked about on its own by its processing function
+            questions = []
+            for note, (finished, finished_notes) in zip(verse_notes, checkpoint_results):
+                prompt_builder = prompt_builders.get(note['SupportReference'])
+                prompt = prompt_builder(note, verse_reference) if prompt_builder and not finished else None
+                if prompt:
+                    questions.append((note.get('ID') or str(len(questions) + 1), prompt))
+
+            self.verse_answers = {}
+            self.verse_prompts = set()
+            for first in range(0, len(questions), self.notes_per_query):
+                verse_questions = questions[first:first + self.notes_per_query]
+                if len(verse_questions) > 1:
+                    self.verse_answers.update(self.__query_verse(context, verse_reference, verse_questions))
+                    self.verse_prompts.update(prompt for note_id, prompt in verse_questions)
+
+            for note, unit, (finished, finished_notes) in zip(verse_notes, units, checkpoint_results):
+                # Determine which processing function to use based on the SupportReference
+                support_ref = note['SupportReference']
+                if finished:
+                    ai_notes.extend(finished_notes)
+
+                elif support_ref in support_reference_handlers:
+                    # Call the appropriate processing function for this SupportReference
+                    first_new_note = len(ai_notes)
+                    support_reference_handlers[support_ref](note, context, verse_reference, ai_notes)
+
+                    # A note that comes back unchanged usually means the query failed, so it is tried again on resume
+                    new_notes = ai_notes[first_new_note:]
+                    if any(json.dumps(new_note, ensure_ascii=False, sort_keys=True) != unit for new_note in new_notes):
+                        checkpoint.add(unit, str(context), new_notes)
+                else:
+                    print(f"Unknown SupportReference: {support_ref}. Appending unmodified note.")
+                    ai_notes.append(note)
+
+        if checkpoint.resumed:
+            print(f'{checkpoint.resumed} notes were taken from the checkpoint')
+        if self.note_query_stats['verse queries']:
+            print(f"Notes asked about by verse: {self.note_query_stats['answered']} answers in {self.note_query_stats['verse queries']} queries "
+                  f"({self.note_query_stats['fallback']} notes asked about on their own)")
+        if self.span_stats['aligned'] or self.span_stats['kept']:
+            print(f"Snippets found in the verse text: {self.span_stats['aligned']} ({self.span_stats['kept']} notes kept their snippet)")
+
+        # A verse range without notes still goes through _write_output, which keeps the notes of the other verses
+        result_lines = self._combine_names(ai_notes) if ai_notes else []
 
         # Write the results to a new TSV file
-        fieldnames = note_texts[0].keys()  # Assuming all notes have the same keys
         self._write_output(book_name=book_name, file='ai_notes.tsv', headers=fieldnames, data=result_lines, fieldnames=fieldnames)
 
 
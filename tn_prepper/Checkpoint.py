@@ -0,0 +1,64 @@
+import os
+import json
+import hashlib
+import threading
+
+
+class Checkpoint():
+    def __init__(self, checkpoint_path, resume=None, name=None):
+        # One JSON record per finished unit of work (a chapter or a note), appended as soon as it is done
+        self.checkpoint_path = checkpoint_path
+
+        # The script the records belong to; records of another script (or without a name) are never resumed
+        self.name = name or os.path.splitext(os.path.basename(checkpoint_path))[0]
+
+        # With RESUME=1, the units recorded by an interrupted run are not done again. Otherwise the
+        # checkpoint starts empty, so results of an older prompt or verse text are never reused.
+        if resume is None:
+            resume = os.getenv('RESUME', '').lower() in ('1', 'true', 'yes')
+        self.resume = resume
+
+        self.records = {}
+        self.resumed = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.checkpoint_path) or '.', exist_ok=True)
+        if self.resume:
+            self.__load()
+        else:
+            open(self.checkpoint_path, 'w', encoding='utf-8').close()
+
+    def __load(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be cut off if the run was killed while writing it
+                    continue
+                if record.get('name') == self.name:
+                    self.records[(record['unit'], record['input_sha256'])] = record['result']
+        if self.records:
+            print(f'Resuming from {self.checkpoint_path} ({len(self.records)} finished)')
+
+    @staticmethod
+    def __hash(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    # Returns (True, result) if "unit" was finished with the same input, otherwise (False, None)
+    def get(self, unit, unit_input):
+        key = (unit, self.__hash(unit_input))
+        if key in self.records:
+            self.resumed += 1
+            return True, self.records[key]
+        return False, None
+
+    # Records the result (anything JSON can hold) of a finished unit
+    def add(self, unit, unit_input, result):
+        line = json.dumps({'name': self.name, 'unit': unit, 'input_sha256': self.__hash(unit_input), 'result': result}, ensure_ascii=False)
+        with self.lock:
+            with open(self.checkpoint_path, 'a', encoding='utf-8') as file:
+                file.write(line + '\n')
+                file.flush()
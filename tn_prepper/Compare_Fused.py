@@ -0,0 +1,117 @@
+from TNPrepper import TNPrepper
+from Fused_Detection import FusedDetection
+import os
+import re
+import sys
+import subprocess
+from dotenv import load_dotenv
+
+class CompareFused(TNPrepper):
+    def __init__(self, book_name, group_names=None):
+        super().__init__()
+
+        load_dotenv()
+
+        self.book_name = book_name
+
+        # FUSED_GROUPS (comma-separated, default: all) picks the groups to compare
+        if group_names is None:
+            group_names = [name.strip() for name in os.getenv('FUSED_GROUPS', '').split(',') if name.strip()] or list(FusedDetection.groups)
+        self.group_names = group_names
+
+        # The fused output is written next to the unfused output, with this in front of ".tsv"
+        self.suffix = '_fused'
+
+        # The comparison covers whatever the scripts wrote; it is not spliced into an older one
+        self.verse_range = None
+
+    # Runs a script for the book and returns (exit code, number of LLM queries, prompt tokens), counted
+        # from the "Token count for the query" lines every query prints (cached responses included)
+    def _run_script(self, script_name, env=None):
+        log_dir = f'{self.output_base_dir}/{self.book_name}/logs'
+        os.makedirs(log_dir, exist_ok=True)
+        log_path = f"{log_dir}/compare_{os.path.splitext(script_name)[0]}{(env or {}).get('FUSED_SUFFIX', '')}.log"
+
+        print(f'Running {script_name}')
+        result = subprocess.run([sys.executable, script_name], env=dict(os.environ, BOOK_NAME=self.book_name, **(env or {})), capture_output=True, text=True)
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            log_file.write(result.stdout + result.stderr)
+        if result.returncode != 0:
+            print(f'{script_name} failed with exit code {result.returncode}; see {log_path}')
+
+        token_counts = [int(count) for count in re.findall(r'^Token count for the query: (\d+)$', result.stdout, flags=re.MULTILINE)]
+        return result.returncode, len(token_counts), sum(token_counts)
+
+    # Returns {(chapter, verse): [normalized quotes]} for the rows of an ai_….tsv file
+    def _read_findings(self, file_name, quote_column):
+        path = f'{self.output_base_dir}/{self.book_name}/{file_name}'
+        findings = {}
+        if not os.path.exists(path):
+            return findings
+        for row in self._read_tsv(path):
+            key = self._reference_key(row.get('Reference'))
+            if key is None:
+                continue
+            quote = re.sub(r'[^\w\s]', '', row.get(quote_column) or '').lower().split()
+            findings.setdefault(key, []).append(' '.join(quote))
+        return findings
+
+    # Compares the unfused and fused findings of a category: rows, verses found by either or both, and
+        # rows of the same verse whose quotes overlap
+    def _compare_category(self, category_name):
+        category = FusedDetection.categories[category_name]
+        unfused = self._read_findings(category['file'], category['quote'])
+        fused = self._read_findings(category['file'].replace('.tsv', f'{self.suffix}.tsv'), category['quote'])
+
+        matching_rows = 0
+        for key, quotes in unfused.items():
+            fused_quotes = list(fused.get(key, []))
+            for quote in quotes:
+                match = next((fused_quote for fused_quote in fused_quotes if quote and fused_quote and (quote in fused_quote or fused_quote in quote)), None)
+                if match is not None:
+                    fused_quotes.remove(match)
+                    matching_rows += 1
+
+        return {
+            'Category': category_name,
+            'Unfused rows': sum(len(quotes) for quotes in unfused.values()),
+            'Fused rows': sum(len(quotes) for quotes in fused.values()),
+            'Verses in both': len(unfused.keys() & fused.keys()),
+            'Verses only unfused': len(unfused.keys() - fused.keys()),
+            'Verses only fused': len(fused.keys() - unfused.keys()),
+            'Matching rows': matching_rows
+        }
+
+    def run(self):
+        comparison = []
+        for group_name in self.group_names:
+            category_names = FusedDetection.groups[group_name]
+
+            unfused_queries = 0
+            unfused_tokens = 0
+            for category_name in category_names:
+                returncode, queries, tokens = self._run_script(FusedDetection.categories[category_name]['script'])
+                unfused_queries += queries
+                unfused_tokens += tokens
+
+            returncode, fused_queries, fused_tokens = self._run_script('Fused_Detection.py', {'FUSED_GROUPS': group_name, 'FUSED_SUFFIX': self.suffix})
+
+            print(f'\nGroup {group_name}: {unfused_queries} queries and {unfused_tokens} prompt tokens unfused, '
+                  f'{fused_queries} queries and {fused_tokens} prompt tokens fused')
+            for category_name in category_names:
+                row = dict(self._compare_category(category_name), Group=group_name)
+                row.update({'Unfused queries': unfused_queries, 'Fused queries': fused_queries, 'Unfused prompt tokens': unfused_tokens, 'Fused prompt tokens': fused_tokens})
+                print(f"{category_name}: {row['Unfused rows']} rows unfused, {row['Fused rows']} fused, {row['Matching rows']} matching; "
+                      f"verses found by both: {row['Verses in both']}, only unfused: {row['Verses only unfused']}, only fused: {row['Verses only fused']}")
+                comparison.append(row)
+
+        headers = ['Group', 'Category', 'Unfused rows', 'Fused rows', 'Matching rows', 'Verses in both', 'Verses only unfused', 'Verses only fused',
+                   'Unfused queries', 'Fused queries', 'Unfused prompt tokens', 'Fused prompt tokens']
+        self._write_fieldnames_to_tsv(self.book_name, 'fused_comparison.tsv', comparison, headers)
+
+
+if __name__ == "__main__":
+    book_name = os.getenv("BOOK_NAME")
+
+    compare_instance = CompareFused(book_name)
+    compare_instance.run()
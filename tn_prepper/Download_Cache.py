@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import hashlib
+import requests
+
+
+class DownloadCache():
+    def __init__(self, cache_dir=None, max_age=None, offline=None):
+        # Downloaded files live under cache_dir/objects, named by the sha256 of their content.
+        # Each URL gets a small entry file (cache_dir/entries) that points to its current object
+        # together with the ETag and Last-Modified headers needed for revalidation.
+        self.cache_dir = cache_dir or os.getenv('DOWNLOAD_CACHE_DIR', 'output/cache/downloads')
+
+        # Seconds during which a cached copy is used without asking the server again
+        if max_age is None:
+            max_age = int(os.getenv('DOWNLOAD_CACHE_MAX_AGE', '3600'))
+        self.max_age = max_age
+
+        # In offline mode the network is never touched
+        if offline is None:
+            offline = os.getenv('OFFLINE', '').lower() in ('1', 'true', 'yes')
+        self.offline = offline
+
+    def __entry_path(self, url):
+        url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return f'{self.cache_dir}/entries/{url_hash}.json'
+
+    def __object_path(self, content_hash):
+        return f'{self.cache_dir}/objects/{content_hash}'
+
+    def __write_atomic(self, path, data):
+        # Write to a temporary file first so that parallel scripts never read half a file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def __read_entry(self, url):
+        entry_path = self.__entry_path(url)
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path, 'r', encoding='utf-8') as file:
+            entry = json.load(file)
+
+        # An entry is only usable if the object it points to is still there
+        if not os.path.exists(self.__object_path(entry['sha256'])):
+            return None
+        return entry
+
+    def __read_object(self, entry):
+        with open(self.__object_path(entry['sha256']), 'rb') as file:
+            return file.read().decode(entry.get('encoding') or 'utf-8')
+
+    def __store(self, url, response):
+        content = response.content
+        content_hash = hashlib.sha256(content).hexdigest()
+
+        object_path = self.__object_path(content_hash)
+        if not os.path.exists(object_path):
+            self.__write_atomic(object_path, content)
+
+        entry = {
+            'url': url,
+            'sha256': content_hash,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': response.encoding,
+            'checked': time.time()
+        }
+        self.__write_atomic(self.__entry_path(url), json.dumps(entry, indent=2).encode('utf-8'))
+        return entry
+
+    def __touch(self, url, entry):
+        entry['checked'] = time.time()
+        self.__write_atomic(self.__entry_path(url), json.dumps(entry, indent=2).encode('utf-8'))
+
+    # Returns the text at "url", or '' if it cannot be retrieved
+    def get(self, url):
+        entry = self.__read_entry(url)
+
+        if self.offline:
+            if entry:
+                return self.__read_object(entry)
+            print(f'Offline mode: {url} is not in the download cache.')
+            return ''
+
+        # Fresh enough to skip the server entirely
+        if entry and time.time() - entry.get('checked', 0) < self.max_age:
+            return self.__read_object(entry)
+
+        # Otherwise revalidate with a conditional request
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = requests.get(url, headers=headers)
+        except requests.RequestException as e:
+            if entry:
+                print(f'Could not reach {url} ({e}). Using cached copy.')
+                return self.__read_object(entry)
+            print(f'Could not reach {url} ({e}).')
+            return ''
+
+        if response.status_code == 304 and entry:
+            self.__touch(url, entry)
+            return self.__read_object(entry)
+
+        if response.status_code == 200:
+            entry = self.__store(url, response)
+            return self.__read_object(entry)
+
+        if entry:
+            print(f'Request for {url} returned {response.status_code}. Using cached copy.')
+            return self.__read_object(entry)
+        return ''
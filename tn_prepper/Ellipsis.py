@@ -6,6 +6,9 @@ import re
 from dotenv import load_dotenv
 
 class Ellipsis(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Explanation', 'Snippet', 'Alternate Translation']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -45,15 +48,15 @@ class Ellipsis(TNPrepper):
             f"In your previous response, you gave a set of possible ellipsis in the chapter: {ellipses}.\n"
             "If the set is empty, return the answer 'None'\n."
             "If the set contains at least one entry, for each ellipsis, analyze the data and the chapter. Make sure that each possible ellipsis is a true case of ellipsis. If it is not a true case of ellipsis, delete the row.\n"
-            "Then, for each true case of ellipsis, provide a TSV table with four tab-separated columns:"
+            "Then, for each true case of ellipsis, add a row to a table with four columns:"
             "\n(1) The first column will provide the chapter and verse where the ellipsis occurs. Do not include the book name."
             "\n(2) The second column will name the person who wrote or spoke the verse in the chapter context."
             "\n(3) The third column will provide an exact quote from the verse. This quote will be the section of the verse that would need to be rephrased to make the omitted words explicit."
-            "\n(4) The fourth column will provide a way to express the exact quote from the fourth value with the omitted words made explicit. You should infer the omitted words from the previous clause(s). Ensure that the rephrased text fits naturally in the context and exactly replaces the quote.\n"
-            "Ensure that your answer contains exactly these four columns in TSV format. Also, do not rephrase any figurative language."
+            "\n(4) The fourth column will provide a way to express the exact quote from the third column with the omitted words made explicit. You should infer the omitted words from the previous clause(s). Ensure that the rephrased text fits naturally in the context and exactly replaces the quote.\n"
+            "Ensure that each row contains exactly these four columns. Also, do not rephrase any figurative language."
         )
 
-        return self._query_openai(chapter_content, prompt2)
+        return self._query_rows(chapter_content, prompt2, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -94,6 +97,9 @@ class Ellipsis(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -108,31 +114,14 @@ class Ellipsis(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 4:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Explanation': columns[1],
-                        'Snippet': columns[2],
-                        'Alternate Translation': columns[3]
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Ellipsis')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'Explanation', 'Snippet', 'Alternate Translation']
+        headers = self.row_headers
         file_name = 'ai_ellipsis.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)
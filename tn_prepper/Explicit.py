@@ -7,6 +7,9 @@ from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
 class Explicit(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Explanation', 'Snippet', 'Alternate Translation']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -20,15 +23,15 @@ class Explicit(TNPrepper):
             "However, for readers who are unfamiliar with that culture or who do not infer the information from the context, the meaning can be unclear.\n"
             "You have been given a chapter from the Bible. Identify every instance where an author omits information that he or she assumed his or her readers would already know.\n"
             "The issues of metaphor, metonymy, and other figures of speech, as well as the issue unusual words, will be dealt with in other notes. So, do not include those issues here. Instead, focus on issues related to whole clauses and sentences."
-            "As your answer, you will provide a TSV table with exactly four tab-separated values. If there are multiple places in a verse where significant information is omitted, include a separate row in the TSV table for each one.\n"
+            "As your answer, you will provide a table with exactly four values in each row. If there are multiple places in a verse where significant information is omitted, include a separate row in the table for each one.\n"
             "\n(1) The first column will provide the chapter and verse where the information is omittex. Do not include the book name."
             "\n(2) The second column will provide an explanation of the omitted information. The explanation must begin in this exact way: 'The implication is that'."
             "\n(3) The third column will provide an exact quote from the verse. This quote will be the section of the verse that would need to be rephrased to express the omitted information explicitly."
-            "\n(4) The fourth column will provide a way to express the exact quote from the fourth value with the omitted information made explicit. Do not remove or modify any figures of speech, and do not shorten the quote. Match the style of the verse as closely as possible."
+            "\n(4) The fourth column will provide a way to express the exact quote from the third column with the omitted information made explicit. Do not remove or modify any figures of speech, and do not shorten the quote. Match the style of the verse as closely as possible."
             "\nBe sure that the items in each row are consistent in how they understand the implied information.\n"
         )
 
-        return self._query_openai(chapter_content, prompt)
+        return self._query_rows(chapter_content, prompt, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -69,6 +72,9 @@ class Explicit(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -83,31 +89,14 @@ class Explicit(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 4:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Explanation': columns[1],
-                        'Snippet': columns[2],
-                        'Alternate Translation': columns[3]
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Explicit')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'Explanation', 'Snippet', 'Alternate Translation']
+        headers = self.row_headers
         file_name = 'ai_explicit.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)
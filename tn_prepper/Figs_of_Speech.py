@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 
 
 class Figs(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'ID', 'Tags', 'SupportReference', 'Quote', 'Occurrence', 'Note', 'Snippet']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -37,16 +40,16 @@ class Figs(TNPrepper):
 
         prompt3 = (
             f"You have been given a chapter from the Bible. Here is a list of figures of speech in this chapter: {response2}\n\n"
-            "\nFor each of these listed figures of speech, append a row of data to a TSV table. Each row must contain exactly eight tab-separated values. Here is what a row should be like:"
-            "chapter:verse\t\t\trc://*/ta/man/translate/figs-[figure_of_speech]\thebrew_placeholder\t1\tExplanation of the figure of speech along with an alternate translation that does not use the figure of speech\tquote from the verse that the alternate translation can replace\n\n"
+            "\nFor each of these listed figures of speech, add a row to the table. Each row must contain exactly eight values. Here is what a row should be like:\n"
+            '["chapter:verse", "", "", "rc://*/ta/man/translate/figs-[figure_of_speech]", "hebrew_placeholder", "1", "Explanation of the figure of speech along with an alternate translation that does not use the figure of speech", "quote from the verse that the alternate translation can replace"]\n\n'
             "Here are two examples:\n"
-            "1:2			rc://*/ta/man/translate/figs-metaphor	 hebrew_placeholder	1	Here the servants speak of how the young woman will always serve the king as if she would **stand to the face of the king**. If it would be helpful in your language, you could use a comparable figure of speech or state the meaning plainly. Alternate translation: “she will always be ready to serve”\tshe will always stand to the face of the king\n"
-            "1:37			rc://*/ta/man/translate/figs-metonymy   hebrew_placeholder  1	Here, **throne** represents the rule or reign of the person who sits on the **throne**. If it would be helpful in your language, you could use an equivalent expression from your language or state the meaning plainly. Alternate translation: “and may he make his reign greater than the reign of my lord the king David” or “and may he make him a greater ruler than my lord the king David”\tand may he make his throne greater than the throne of my lord the king David\n"
+            '["1:2", "", "", "rc://*/ta/man/translate/figs-metaphor", "hebrew_placeholder", "1", "Here the servants speak of how the young woman will always serve the king as if she would **stand to the face of the king**. If it would be helpful in your language, you could use a comparable figure of speech or state the meaning plainly. Alternate translation: “she will always be ready to serve”", "she will always stand to the face of the king"]\n'
+            '["1:37", "", "", "rc://*/ta/man/translate/figs-metonymy", "hebrew_placeholder", "1", "Here, **throne** represents the rule or reign of the person who sits on the **throne**. If it would be helpful in your language, you could use an equivalent expression from your language or state the meaning plainly. Alternate translation: “and may he make his reign greater than the reign of my lord the king David” or “and may he make him a greater ruler than my lord the king David”", "and may he make his throne greater than the throne of my lord the king David"]\n'
             "Note - whenever you quote directly from the verse, you should enclose the quoted word or words in double asterisks, as in the above examples."
             "Important: be sure that your explanation fits the context as well as the label for the figure of speech."
         )
 
-        return self._query_openai(chapter_content, prompt3)
+        return self._query_rows(chapter_content, prompt3, self.row_headers)
 
     def _read_tsv(self, file_path):
         verse_texts = []
@@ -60,6 +63,9 @@ class Figs(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -74,33 +80,14 @@ class Figs(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 8:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'ID': columns[1],
-                        'Tags': columns[2],
-                        'SupportReference': columns[3],
-                        'Quote': columns[4],
-                        'Occurrence': columns[5],
-                        'Note': columns[6],
-                        'Snippet': columns[7]
-                    }
-                    row_dict['Snippet'] = row_dict['Snippet'].strip('.,:;“”‘’"!?')
-                    row_dict['Reference'] = re.sub(r'\w+ ', '', row_dict['Reference'])
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Figs_of_Speech')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
+        for row_dict in mod_ai_data:
+            row_dict['Snippet'] = row_dict['Snippet'].strip('.,:;“”‘’"!?')
+            row_dict['Reference'] = re.sub(r'\w+ ', '', row_dict['Reference'])
 
         rows = [[row['Reference'], row['ID'], row['Tags'], row['SupportReference'], row['Quote'], row['Occurrence'], row['Note'], row['Snippet']] for row in mod_ai_data]
         headers_transformed = ['Reference', 'ID', 'Tags', 'SupportReference', 'Quote', 'Occurrence', 'Note', 'Snippet']
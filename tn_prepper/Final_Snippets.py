@@ -2,8 +2,6 @@ from TNPrepper import TNPrepper
 
 import re
 import csv
-import requests
-from bs4 import BeautifulSoup
 from collections import defaultdict
 from dotenv import load_dotenv
 import os
@@ -34,22 +32,8 @@ class Final_Snippets(TNPrepper):
         # URL of the file to download
         url = f"https://git.door43.org/unfoldingWord/hbo_uhb/raw/branch/master/{acronym}.usfm"
 
-        # Function to get the content of the file
-        def __get_file_content(url):
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.text
-            else:
-                return ''
-
-        # Get the file content
-        file_content = __get_file_content(url)
-
-        # Process the file content
-        soup = BeautifulSoup(file_content, 'html.parser')
-
-        # Combine all lines into a single string
-        combined_text = soup.get_text(separator='\n')
+        # Get the file content (usfm is plain text, so no html parsing is needed)
+        combined_text = self._get_file_content(url)
 
         return combined_text
     
@@ -153,14 +137,8 @@ class Final_Snippets(TNPrepper):
         # URL of the file to download
         url = f"https://git.door43.org/unfoldingWord/en_{version}/raw/branch/master/{acronym}.usfm"
 
-        # Get the file content
-        file_content = self._get_file_content(url)
-
-        # Process the file content
-        soup = BeautifulSoup(file_content, 'html.parser')
-
-        # Combine all lines into a single string
-        combined_text = soup.get_text(separator='\n')
+        # Get the file content (usfm is plain text, so no html parsing is needed)
+        combined_text = self._get_file_content(url)
 
         ult_dict = []
         text_chunks = {}
@@ -260,6 +238,7 @@ class Final_Snippets(TNPrepper):
 
     def _find_sequence(self, ult_dict_combined, input_file):
         data, headers = self.__read_ai_notes(input_file)
+        data = self._filter_verse_range(data)
         snippet_data = []
         
         # Step 1: Create a dictionary with verse_ref as key and concatenated string of gloss words as value
@@ -387,6 +366,9 @@ class Final_Snippets(TNPrepper):
     
     def _process_ai_notes(self, input_file, origl_and_snippet):
         ai_notes, headers = self.__read_ai_notes(input_file)
+
+        # Only the notes in VERSE_RANGE (if one is set) are finished; final_notes.tsv keeps the others
+        ai_notes = self._filter_verse_range(ai_notes)
         
         # Iterate over origl_and_snippet
         for row in origl_and_snippet:
@@ -535,77 +517,8 @@ if __name__ == "__main__":
     book_name = os.getenv("BOOK_NAME")
     version = os.getenv("VERSION")
 
-    # Mapping of book names to their respective acronyms
-    acronym_mapping = {
-        "Genesis": "01-GEN",
-        "Exodus": "02-EXO",
-        "Leviticus": "03-LEV",
-        "Numbers": "04-NUM",
-        "Deuteronomy": "05-DEU",
-        "Joshua": "06-JOS",
-        "Judges": "07-JDG",
-        "Ruth": "08-RUT",
-        "1 Samuel": "09-1SA",
-        "2 Samuel": "10-2SA",
-        "1 Kings": "11-1KI",
-        "2 Kings": "12-2KI",
-        "1 Chronicles": "13-1CH",
-        "2 Chronicles": "14-2CH",
-        "Ezra": "15-EZR",
-        "Nehemiah": "16-NEH",
-        "Esther": "17-EST",
-        "Job": "18-JOB",
-        "Psalms": "19-PSA",
-        "Proverbs": "20-PRO",
-        "Song of Solomon": "22-SNG",
-        "Isaiah": "23-ISA",
-        "Jeremiah": "24-JER",
-        "Lamentations": "25-LAM",
-        "Ezekiel": "26-EZK",
-        "Daniel": "27-DAN",
-        "Hosea": "28-HOS",
-        "Joel": "29-JOL",
-        "Amos": "30-AMO",
-        "Obadiah": "31-OBA",
-        "Jonah": "32-JON",
-        "Micah": "33-MIC",
-        "Nahum": "34-NAM",
-        "Habakkuk": "35-HAB",
-        "Zephaniah": "36-ZEP",
-        "Haggai": "37-HAG",
-        "Zechariah": "38-ZEC",
-        "Malachi": "39-MAL",
-        "Matthew": "41-MAT",
-        "Mark": "42-MRK",
-        "Luke": "43-LUK",
-        "John": "44-JHN",
-        "Acts": "45-ACT",
-        "Romans": "46-ROM",
-        "1 Corinthians": "47-1CO",
-        "2 Corinthians": "48-2CO",
-        "Galatians": "49-GAL",
-        "Ephesians": "50-EPH",
-        "Philippians": "51-PHP",
-        "Colossians": "52-COL",
-        "1 Thessalonians": "53-1TH",
-        "2 Thessalonians": "54-2TH",
-        "1 Timothy": "55-1TI",
-        "2 Timothy": "56-2TI",
-        "Titus": "57-TIT",
-        "Philemon": "58-PHM",
-        "Hebrews": "59-HEB",
-        "James": "60-JAS",
-        "1 Peter": "61-1PE",
-        "2 Peter": "62-2PE",
-        "1 John": "63-1JN",
-        "2 John": "64-2JN",
-        "3 John": "65-3JN",
-        "Jude": "66-JUD",
-        "Revelation": "67-REV"
-    }
-
-    if book_name in acronym_mapping:
-        acronym = acronym_mapping[book_name]
+    if book_name in TNPrepper.acronym_mapping:
+        acronym = TNPrepper.acronym_mapping[book_name]
 
     input_file = f'output/{book_name}/ai_notes.tsv'
 
@@ -0,0 +1,258 @@
+from TNPrepper import TNPrepper
+from Doublets import Doublets
+from Parallelism import Parallelism
+from Collective_Nouns import Collective_Nouns
+from Generic_Nouns import Generic_Nouns
+from Nominal_Adjectives import Nominal_Adjective
+from Kinship import Kinship
+from Gender import Gender
+import os
+from dotenv import load_dotenv
+
+class FusedDetection(TNPrepper):
+    # Related categories (named as in Generate_Notes.py) that are looked for together, with one prompt
+    # per chapter instead of a chain of prompts per chapter for each category
+    groups = {
+        'repetition': ['doublets', 'parallelism'],
+        'nouns': ['collective nouns', 'generic nouns', 'nominal adjectives'],
+        'people': ['kinship', 'gender notations']
+    }
+
+    # For each category: the script it replaces, the class whose _transform_response writes its notes,
+    # the label that starts its rows in the response, what to look for, its columns (with what the
+    # response should put in each), the column compared by Compare_Fused.py, and its output files
+    categories = {
+        'doublets': {
+            'script': 'Doublets.py',
+            'class': Doublets,
+            'label': 'doublet',
+            'definition': "two words or very short phrases (not full clauses) that have the same meaning and that are joined directly by 'and'. This type of repetition emphasizes the meaning.",
+            'columns': [
+                ('Reference', "the chapter and verse where the doublet is found. Do not include the book name."),
+                ('Explanation', "an explanation in this exact form: 'The terms **[word/phrase 1]** and **[word/phrase 2]** mean similar things. [Speaker/Writer] is using the two terms together for emphasis.' Replace the bracketed words with the appropriate data from the verse."),
+                ('Snippet', "an exact quote from the verse: the section of the verse that would need to be rephrased to express the idea without the doublet."),
+                ('Alternate Translation', "a way to express the quote without using both words or phrases. It should be able to replace the quote in the verse without losing any meaning.")
+            ],
+            'quote': 'Snippet',
+            'file': 'ai_doublets.tsv',
+            'transformed_file': 'transformed_ai_doublets.tsv'
+        },
+        'parallelism': {
+            'script': 'Parallelism.py',
+            'class': Parallelism,
+            'label': 'parallelism',
+            'definition': "two clauses that have similar grammatical structures and similar meanings and that are used together for poetic effect.",
+            'columns': [
+                ('Reference', "the chapter and verse where the parallelism is found. Do not include the book name."),
+                ('Phrases', "an exact quote from the verse that contains the two clauses that make up the parallelism."),
+                ('Alternate Translation', "a way to express the two parallel clauses as a single, simple clause that combines the ideas of both."),
+                ('Speaker', "who writes or speaks the parallelism.")
+            ],
+            'quote': 'Phrases',
+            'file': 'ai_parallelism.tsv',
+            'transformed_file': 'transformed_ai_parallelism.tsv'
+        },
+        'collective nouns': {
+            'script': 'Collective_Nouns.py',
+            'class': Collective_Nouns,
+            'label': 'collective noun',
+            'definition': "a noun that is singular in form but plural in meaning. A plural noun cannot be collective.",
+            'columns': [
+                ('Reference', "the chapter and verse where the collective noun is found. Do not include the book name."),
+                ('Explanation', "an explanation that follows this template: 'In this verse, the word **[collective noun]** is singular in form, but it refers to all [things named by collective noun] as a group.' The words in double asterisks must be exact quotes from the verse."),
+                ('Snippet', "an exact quote from the verse, as short as possible: the words that would need to be rephrased to express the idea without a collective noun."),
+                ('Alternate Translation', "a rephrasing of the quote that no longer contains a collective noun and that can exactly replace the quote in the verse.")
+            ],
+            'quote': 'Snippet',
+            'file': 'ai_collectivenouns.tsv',
+            'transformed_file': 'transformed_ai_collectivenouns.tsv'
+        },
+        'generic nouns': {
+            'script': 'Generic_Nouns.py',
+            'class': Generic_Nouns,
+            'label': 'generic noun',
+            'definition': "a singular noun or noun phrase that seems to refer to a specific person or thing, but in the context refers to people or things in general. For example, in 'People curse the man who refuses to sell grain', 'man' could be any person who refuses to sell grain.",
+            'columns': [
+                ('Reference', "the chapter and verse where the generic noun is found. Do not include the book name."),
+                ('Explanation', "an explanation that follows this template: 'The word **generic_noun** represents [things] in general, not one particular [thing]'. The words in double asterisks must be exact quotes from the verse."),
+                ('Snippet', "an exact quote from the verse: the words that would need to be rephrased to express the idea without a generic noun."),
+                ('Alternate Translation', "a rephrasing of the quote that refers to people or things in general (for example, by making the noun plural) and that can exactly replace the quote in the verse.")
+            ],
+            'quote': 'Snippet',
+            'file': 'ai_genericnouns.tsv',
+            'transformed_file': 'transformed_ai_genericnouns.tsv'
+        },
+        'nominal adjectives': {
+            'script': 'Nominal_Adjectives.py',
+            'class': Nominal_Adjective,
+            'label': 'nominal adjective',
+            'definition': "an adjective that functions as a noun to refer to a class of things or people. If there are nominal adjectives near each other in a verse, they belong in one row.",
+            'columns': [
+                ('Reference', "the chapter and verse where the nominal adjective is found. Do not include the book name."),
+                ('Explanation', "an explanation that follows this template: '[The writer] is using the adjective **[adjective]** as a noun to mean [meaning]'. The words in double asterisks must be exact quotes from the verse."),
+                ('Snippet', "an exact quote from the verse: the words that would need to be rephrased to express the idea without a nominal adjective."),
+                ('Alternate Translation', "a rephrasing of the quote that no longer contains a nominal adjective and that can exactly replace the quote in the verse.")
+            ],
+            'quote': 'Snippet',
+            'file': 'ai_nominaladj.tsv',
+            'transformed_file': 'transformed_ai_nominaladj.tsv'
+        },
+        'kinship': {
+            'script': 'Kinship.py',
+            'class': Kinship,
+            'label': 'kinship',
+            'definition': ("a literal (not figurative) use of one of these family relationship terms, which needs the information after it: "
+                           "brother or sister (younger or older, half or full); cousin (gender, side of the family, younger or older); "
+                           "uncle or aunt (side of the family, older or younger than parent); niece, nephew, grandfather, or grandmother (side of the family); "
+                           "-in-law (side of the family, specific relationship). Other terms, such as 'queen', 'wife', 'servant', 'son', 'daughter', or 'father', do not count."),
+            'columns': [
+                ('Reference', "the chapter and verse where the term is found."),
+                ('Term', "the term, quoted exactly from the verse."),
+                ('Explanation', "the required information for the term, in this template: 'Here the term **[family relationship term]** specifically refers to [the exact family relationship]. [Any further explanation required, such as if information is not known.] If your language has a specific word for [the exact family relationship], it would be appropriate to use it here.'")
+            ],
+            'quote': 'Term',
+            'file': 'ai_kinship.tsv',
+            'transformed_file': 'transformed_ai_kinship.tsv'
+        },
+        'gender notations': {
+            'script': 'Gender.py',
+            'class': Gender,
+            'label': 'gender',
+            'definition': "a masculine word that in its context refers to both male and female people, such as 'men' for a group of men and women, 'sons' for children or descendants of both genders, or 'brothers' for relatives of both genders.",
+            'columns': [
+                ('Reference', "the chapter and verse where the masculine word is found. Do not include the book name."),
+                ('Explanation', "an explanation that follows this template: 'Although the term **[masculine word]** is masculine, [the writer] is using the word in a generic sense that includes both men and women'. The words in double asterisks must be exact quotes from the verse."),
+                ('Snippet', "an exact quote from the verse, as short as possible: the words that would need to be rephrased to refer directly to both male and female people."),
+                ('Alternate Translation', "a rephrasing of the quote that refers directly to both male and female people and that can exactly replace the quote in the verse.")
+            ],
+            'quote': 'Snippet',
+            'file': 'ai_gender.tsv',
+            'transformed_file': 'transformed_ai_gender.tsv'
+        }
+    }
+
+    def __init__(self, book_name, group_names=None, suffix=None):
+        super().__init__()
+
+        load_dotenv()
+
+        self.book_name = book_name
+        self.verse_text = f'output/{book_name}/ult_book.tsv'
+
+        # FUSED_GROUPS (comma-separated, default: all) picks the groups to run
+        if group_names is None:
+            group_names = [name.strip() for name in os.getenv('FUSED_GROUPS', '').split(',') if name.strip()] or list(self.groups)
+        for group_name in group_names:
+            if group_name not in self.groups:
+                raise ValueError(f'Unknown fused group: {group_name}')
+        self.group_names = group_names
+
+        # FUSED_SUFFIX (e.g. "_fused") is put in front of ".tsv" in the output file names, so that
+        # Compare_Fused.py can keep the output of the unfused scripts next to it
+        self.suffix = os.getenv('FUSED_SUFFIX', '') if suffix is None else suffix
+
+    # Returns the name of an output file with the suffix
+    def output_file(self, file_name):
+        return file_name.replace('.tsv', f'{self.suffix}.tsv')
+
+    # Builds the one prompt that asks for every category of the group, each row starting with the category's label
+    def _build_prompt(self, category_names):
+        labels = [self.categories[category_name]['label'] for category_name in category_names]
+
+        prompt = "You have been given a chapter from the Bible. Look in the chapter for each of the following translation issues:\n"
+        for category_name in category_names:
+            category = self.categories[category_name]
+            prompt += f"\n- {category['label']}: {category['definition']}"
+
+        prompt += (
+            "\n\nExamine each instance you find in context, and keep only those that fit the description exactly.\n"
+            "Then, for each instance, add a row to the table. "
+            f"The first value of each row is the name of the issue, exactly as written here: {', '.join(labels)}. "
+            "The values after it depend on the issue:"
+        )
+        for category_name in category_names:
+            category = self.categories[category_name]
+            prompt += f"\n\nA {category['label']} row contains exactly {len(category['columns']) + 1} values:\n(1) the name of the issue: {category['label']}"
+            for number, (column, description) in enumerate(category['columns'], 2):
+                prompt += f"\n({number}) {description}"
+
+        prompt += (
+            "\n\nBe sure that the values in each row are consistent in how they identify, understand, and explain the issue.\n\n"
+            'Return the table as JSON in this form: {"rows": [["name of the issue", "value 2", ...], ...]}, with one list of text values for each row. '
+            'Do not include a header row or any explanation. If you find none of these issues, return {"rows": []}.'
+        )
+        return prompt
+
+    # Splits the rows of the responses by their label into {category: [row dicts]}, with the columns of each category;
+        # rows with an unknown label or that do not fit the columns of their category go to report.md
+    def _split_rows(self, responses, category_names):
+        categories_by_label = {self.categories[category_name]['label']: category_name for category_name in category_names}
+        candidates = {category_name: [] for category_name in category_names}
+        unknown_rows = []
+
+        for response in responses:
+            if not response:
+                continue
+            for values, row_text in self._response_rows(response):
+                category_name = categories_by_label.get(str(values[0]).strip(' *\'"').lower()) if values else None
+                if category_name is None:
+                    unknown_rows.append(row_text)
+                else:
+                    candidates[category_name].append((values[1:], row_text))
+
+        if unknown_rows:
+            print(f"{len(unknown_rows)} rows did not start with one of the issue names {', '.join(categories_by_label)} and were not used:")
+            self._report_rows(unknown_rows, 'with an unknown issue name')
+        return {category_name: self._fit_rows(candidates[category_name], [column for column, description in self.categories[category_name]['columns']])
+                for category_name in category_names}
+
+    # Writes the ai_….tsv and transformed_ai_….tsv files of a category, as its own script would
+    def _write_category(self, category_name, rows):
+        category = self.categories[category_name]
+        headers = [column for column, description in category['columns']]
+        self._write_fieldnames_to_tsv(self.book_name, self.output_file(category['file']), rows, headers)
+
+        transformed_data = category['class'](self.book_name)._transform_response(rows) if rows else []
+
+        headers_transformed = ['Reference', 'ID', 'Tags', 'SupportReference', 'Quote', 'Occurrence', 'Note', 'Snippet']
+        self._write_output(self.book_name, file=self.output_file(category['transformed_file']), headers=headers_transformed, data=transformed_data)
+
+    def run(self):
+        # Load verse texts from TSV
+        verse_texts = self._read_tsv(self.verse_text)
+
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
+        # Check the stage and limit verse_texts if in development stage
+        if os.getenv('STAGE') == 'dev':
+            verse_texts = verse_texts[:5]
+
+        # Organize verse texts by chapter
+        chapters = {}
+        for verse in verse_texts:
+            reference = verse['Reference']
+            book_name, chapter_and_verse = reference.rsplit(' ', 1)
+            chapter = f"{book_name} {chapter_and_verse.split(':')[0]}"
+            if chapter not in chapters:
+                chapters[chapter] = []
+            chapters[chapter].append(verse)
+
+        for group_name in self.group_names:
+            category_names = self.groups[group_name]
+            prompt = self._build_prompt(category_names)
+            print(f"Looking for {', '.join(category_names)} together")
+
+            responses = self._dispatch_chapters(chapters, lambda chapter_content: self._query_openai(chapter_content, prompt, response_format=self._rows_format()), checkpoint_name=f'Fused_Detection-{group_name}')
+
+            rows = self._split_rows(responses, category_names)
+            for category_name in category_names:
+                print(f'{category_name}: {len(rows[category_name])} rows')
+                self._write_category(category_name, rows[category_name])
+
+
+if __name__ == "__main__":
+    book_name = os.getenv("BOOK_NAME")
+
+    fused_instance = FusedDetection(book_name)
+    fused_instance.run()
@@ -1,11 +1,17 @@
 from TNPrepper import TNPrepper
+from Stage_Manifest import StageManifest
+from Fused_Detection import FusedDetection
 import os
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class ScriptRunner(TNPrepper):
-    def __init__(self, script_path):
+    def __init__(self, script_path, book_name=None, jobs=None):
 
         # Mapping from category to script name
         self.script_mapping = {
@@ -34,6 +40,56 @@ class ScriptRunner(TNPrepper):
         }
 
         self.script_path = script_path
+        self.book_name = book_name or os.getenv('BOOK_NAME', '')
+
+        # Number of scripts that may run at the same time
+        if jobs is None:
+            jobs = int(os.getenv('PIPELINE_JOBS', '4'))
+        self.jobs = jobs
+
+        # Put in front of every message when several books run at the same time
+        self.prefix = ''
+
+        # Files each stage writes in output/<book> (report.md is shared by several stages and left out)
+        self.stage_outputs = {
+            'ULT.py': ['ult_book.tsv', f"parsed_{os.getenv('VERSION', '')}.pickle"],
+            'AbstractNouns.py': ['abnouns.tsv', 'transformed_abnouns.tsv'],
+            'Go.py': ['new_figs_go.tsv', 'go.tsv'],
+            'Names.py': ['names.tsv', 'transformed_names.tsv'],
+            'Ordinals.py': ['ordinals.tsv'],
+            'Passives.py': ['passives.tsv', 'transformed_passives.tsv'],
+            'RQuestion.py': ['ai_rquestions.tsv', 'transformed_ai_rquestions.tsv'],
+            'Logical_Relationships.py': ['ai_relationships.tsv', 'transformed_ai_relationships.tsv'],
+            'Parallelism.py': ['ai_parallelism.tsv', 'transformed_ai_parallelism.tsv'],
+            'Doublets.py': ['ai_doublets.tsv', 'transformed_ai_doublets.tsv'],
+            'Unknowns.py': ['ai_unknowns.tsv', 'transformed_ai_unknowns.tsv'],
+            'Explicit.py': ['ai_explicit.tsv', 'transformed_ai_explicit.tsv'],
+            'Ellipsis.py': ['ai_ellipsis.tsv', 'transformed_ai_ellipsis.tsv'],
+            'Figs_of_Speech.py': ['transformed_ai_figures_of_speech.tsv'],
+            '123person.py': ['ai_123person.tsv', 'transformed_ai_123person.tsv'],
+            'Kinship.py': ['ai_kinship.tsv', 'transformed_ai_kinship.tsv'],
+            'Quotations.py': ['ai_quotations.tsv', 'transformed_ai_quotations.tsv'],
+            'Pronouns.py': ['ai_pronouns.tsv', 'transformed_ai_pronouns.tsv'],
+            'Collective_Nouns.py': ['ai_collectivenouns.tsv', 'transformed_ai_collectivenouns.tsv'],
+            'Gender.py': ['ai_gender.tsv', 'transformed_ai_gender.tsv'],
+            'Generic_Nouns.py': ['ai_genericnouns.tsv', 'transformed_ai_genericnouns.tsv'],
+            'Nominal_Adjectives.py': ['ai_nominaladj.tsv', 'transformed_ai_nominaladj.tsv'],
+            'Fused_Detection.py': [],
+            'Combine_Notes.py': ['combined_notes.tsv'],
+            'ATs_snippets.py': ['ai_notes.tsv'],
+            'Final_Snippets.py': ['1_unique_numbers.tsv', '2_ult_dict.tsv', '3_snippet_data.tsv', '4_origl_and_snippet.tsv', 'final_notes.tsv']
+        }
+
+        # Fused_Detection.py writes the files of the scripts it stands in for, in the groups that build_pipeline
+            # picked (passed on in FUSED_GROUPS, also to the runner of each book)
+        fused_groups = [name.strip() for name in os.getenv('FUSED_GROUPS', '').split(',') if name.strip()]
+        self.stage_outputs['Fused_Detection.py'] = self.fused_outputs(fused_groups)
+
+        # With "force", every stage runs even if its manifest says it is up to date
+        self.force = os.getenv('PIPELINE_FORCE', '').lower() in ('1', 'true', 'yes')
+
+        # With "fused", related categories run together in Fused_Detection.py (see build_pipeline)
+        self.fused = os.getenv('FUSED', '').lower() in ('1', 'true', 'yes')
 
     def get_excluded_categories(self):
         # Display the list of categories to the user
@@ -46,37 +102,260 @@ class ScriptRunner(TNPrepper):
         excluded_categories = [category.strip() for category in excluded_categories.split(",")]
         return excluded_categories
 
-    def run_scripts(self):
-        self.run_script('ULT.py')
-        print('Running ULT.py')
+    # Returns the files Fused_Detection.py writes when it looks for the groups "fused_groups"
+    def fused_outputs(self, fused_groups):
+        return [file_name for group_name in fused_groups if group_name in FusedDetection.groups
+                for category_name in FusedDetection.groups[group_name]
+                for file_name in self.stage_outputs[self.script_mapping[category_name]]]
 
-        excluded_categories = self.get_excluded_categories()
+    # Returns the categories not to run, given the categories to run (all if empty) and the ones to leave out
+    def select_excluded_categories(self, included_categories, excluded_categories):
+        for category in included_categories + excluded_categories:
+            if category not in self.script_mapping:
+                raise ValueError(f'Unknown category: {category}')
+
+        if included_categories:
+            excluded_categories = excluded_categories + [category for category in self.script_mapping if category not in included_categories]
+        return excluded_categories
 
+    # Expands "all OT", "all NT", and "all" into book names, and checks the others
+    def select_books(self, book_names):
+        books = []
+        for book_name in book_names:
+            if book_name.lower() == 'all':
+                books.extend(self.acronym_mapping)
+            elif book_name.lower() == 'all ot':
+                books.extend(book for book, acronym in self.acronym_mapping.items() if int(acronym[:2]) < 40)
+            elif book_name.lower() == 'all nt':
+                books.extend(book for book, acronym in self.acronym_mapping.items() if int(acronym[:2]) > 40)
+            elif book_name in self.acronym_mapping:
+                books.append(book_name)
+            else:
+                raise ValueError(f'Unknown book: {book_name}')
+        return list(dict.fromkeys(books))
+
+    # Returns the stages to run and the stages each one needs: {script name: [script names]}
+    def build_pipeline(self, excluded_categories):
+        # ULT.py writes ult_book.tsv and the parsed book that every other script reads
+        pipeline = {'ULT.py': []}
+
+        # In fused mode, each group of related categories that all run is looked for by Fused_Detection.py
+            # instead of by one script per category; it writes the same files as those scripts
+        fused_categories = []
+        if self.fused:
+            fused_groups = [group_name for group_name, category_names in FusedDetection.groups.items()
+                            if all(category_name not in excluded_categories for category_name in category_names)]
+            fused_categories = [category_name for group_name in fused_groups for category_name in FusedDetection.groups[group_name]]
+            self.stage_outputs['Fused_Detection.py'] = self.fused_outputs(fused_groups)
+
+            # Passed on to Fused_Detection.py
+            os.environ['FUSED_GROUPS'] = ','.join(fused_groups)
+
+        detector_scripts = []
+        if fused_categories:
+            pipeline['Fused_Detection.py'] = ['ULT.py']
+            detector_scripts.append('Fused_Detection.py')
         for category, script_name in self.script_mapping.items():
+            if category in fused_categories:
+                continue
             if category not in excluded_categories:
-                print(f"Running script for category: {category}")
-                self.run_script(script_name)
+                pipeline[script_name] = ['ULT.py']
+                detector_scripts.append(script_name)
             else:
                 print(f"Skipping script for category: {category}")
 
-        print('Running Combine_Notes.py')
-        self.run_script('Combine_Notes.py')
+        # Combine_Notes.py reads every transformed_….tsv; the last two stages each need the one before
+        pipeline['Combine_Notes.py'] = ['ULT.py'] + detector_scripts
+        pipeline['ATs_snippets.py'] = ['Combine_Notes.py']
+        pipeline['Final_Snippets.py'] = ['ATs_snippets.py']
+
+        return pipeline
+
+    # Returns the input files of a stage: the outputs of the stages it needs, and the ULT output every stage reads
+    def stage_inputs(self, needs):
+        input_files = list(self.stage_outputs['ULT.py'])
+        for need in needs:
+            input_files.extend(self.stage_outputs.get(need, []))
+        return input_files
+
+    # Runs the stages of "pipeline" as soon as the stages they need have succeeded, up to self.jobs at a time
+        # A stage whose dependency failed (or was skipped) is skipped. A stage whose manifest (see Stage_Manifest.py)
+        # matches its code, environment, and inputs is not run again ("cached"). ULT.py always runs, since its
+        # input is downloaded; when the ULT did not change, its outputs do not either.
+        # Returns {script name: (status, seconds)}.
+    def run_pipeline(self, pipeline):
+        results = {}
+        pending = dict(pipeline)
+        running = {}
+        manifests = {}
+        stage_manifest = StageManifest(self.script_path, self.book_name)
+        start_time = time.time()
+
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as executor:
+            while pending or running:
+                # The pipeline is in dependency order, so one pass also skips the dependents of skipped stages
+                for script_name, needs in list(pending.items()):
+                    failed_needs = [need for need in needs if results.get(need, ('',))[0] in ('failed', 'skipped')]
+                    if failed_needs:
+                        print(f"{self.prefix}Skipping {script_name} because {', '.join(failed_needs)} did not succeed")
+                        results[script_name] = ('skipped', 0.0)
+                        del pending[script_name]
+
+                for script_name, needs in list(pending.items()):
+                    if all(results.get(need, ('',))[0] in ('ok', 'cached') for need in needs):
+                        del pending[script_name]
+                        manifest = stage_manifest.build(script_name, self.stage_inputs(needs))
+                        if needs and not self.force and stage_manifest.matches(manifest):
+                            print(f'{self.prefix}{script_name} is up to date')
+                            results[script_name] = ('cached', 0.0)
+                            continue
 
-        print('Running ATs_snippets.py')
-        self.run_script('ATs_snippets.py')
+                        stage_manifest.remove(script_name)
+                        manifests[script_name] = manifest
+                        print(f'{self.prefix}Running {script_name}')
+                        running[executor.submit(self.run_script, script_name)] = script_name
 
-        print('Running Final_Snippets.py')
-        self.run_script('Final_Snippets.py')
-        
-        print('All data can found in output/book_name')
-        print('Final product is "final_notes.tsv"')
+                if not running:
+                    if any(all(results.get(need, ('',))[0] in ('ok', 'cached') for need in needs) for needs in pending.values()):
+                        # Stages became ready because the ones they need were up to date
+                        continue
+                    # Only stages with unknown dependencies are left
+                    for script_name in pending:
+                        print(f"{self.prefix}Skipping {script_name} because its dependencies are not in the pipeline")
+                        results[script_name] = ('skipped', 0.0)
+                    break
 
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    script_name = running.pop(future)
+                    returncode, seconds = future.result()
+                    status = 'ok' if returncode == 0 else 'failed'
+                    if status == 'ok':
+                        stage_manifest.save(manifests[script_name], self.stage_outputs.get(script_name, []))
+                    results[script_name] = (status, seconds)
+                    print(f'{self.prefix}Finished {script_name} ({status}, {seconds:.1f}s)')
+
+        self.print_summary(results, time.time() - start_time)
+        return results
+
+    def print_summary(self, results, total_seconds):
+        # One print call, so that the summaries of books running at the same time do not interleave
+        lines = [f'\n{self.prefix}Stage summary:']
+        for script_name, (status, seconds) in results.items():
+            lines.append(f'{script_name:<28}{status:<9}{seconds:8.1f}s')
+        lines.append(f'Total wall-clock time: {total_seconds:.1f}s')
+        print('\n'.join(lines))
+
+    def run_scripts(self):
+        excluded_categories = self.get_excluded_categories()
+
+        pipeline = self.build_pipeline(excluded_categories)
+        results = self.run_pipeline(pipeline)
+
+        if results.get('Final_Snippets.py', ('',))[0] in ('ok', 'cached'):
+            print('All data can found in output/book_name')
+            print('Final product is "final_notes.tsv"')
+
+    # Runs the whole pipeline for each book, "book_jobs" books at a time. Returns {book name: results}.
+        # Every book gets its own ScriptRunner (and so its own worker pool of self.jobs scripts); the
+        # LLM rate limits are shared by all scripts through output/cache/rate_limits.sqlite.
+    def run_books(self, books, excluded_categories, book_jobs=1):
+        pipeline = self.build_pipeline(excluded_categories)
+        start_time = time.time()
+
+        def run_book(book_name):
+            book_runner = ScriptRunner(self.script_path, book_name, self.jobs)
+            if len(books) > 1:
+                book_runner.prefix = f'[{book_name}] '
+            return book_runner.run_pipeline(pipeline)
+
+        with ThreadPoolExecutor(max_workers=max(1, book_jobs)) as executor:
+            book_results = dict(zip(books, executor.map(run_book, books)))
+
+        if len(books) > 1:
+            lines = ['\nBook summary:']
+            for book_name, results in book_results.items():
+                failed = [script_name for script_name, (status, seconds) in results.items() if status not in ('ok', 'cached')]
+                status = 'ok' if not failed else f'{len(failed)} stages failed or skipped'
+                lines.append(f'{book_name:<20}{status}')
+            lines.append(f'Total wall-clock time: {time.time() - start_time:.1f}s')
+            print('\n'.join(lines))
+
+        return book_results
+
+    # Runs one script and returns (exit code, seconds)
+        # Scripts that run at the same time would mix their output, so each one writes to its own log
+        # in output/<book>/logs.
     def run_script(self, script_name):
-        os.system(f"cd {self.script_path} && python3 {script_name}")
+        log_dir = os.path.join(self.script_path or '.', 'output', self.book_name, 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+        log_path = os.path.join(log_dir, f'{os.path.splitext(script_name)[0]}.log')
+
+        start_time = time.time()
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            # The scripts read the book from BOOK_NAME (load_dotenv does not override it)
+            env = dict(os.environ, BOOK_NAME=self.book_name)
+            returncode = subprocess.run(['python3', script_name], cwd=self.script_path, env=env, stdout=log_file, stderr=subprocess.STDOUT).returncode
+        seconds = time.time() - start_time
+
+        if returncode != 0:
+            print(f'{self.prefix}{script_name} failed with exit code {returncode}; see {log_path}')
+        return returncode, seconds
+
+# Splits "Genesis, Exodus" "all NT" into ["Genesis", "Exodus", "all NT"]
+def split_names(values):
+    return [name.strip() for value in values or [] for name in value.split(',') if name.strip()]
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description='Generate notes for one or more books without asking any questions. Without arguments, the categories are asked for interactively.')
+    parser.add_argument('--books', nargs='+', help='book names, "all OT", "all NT", or "all" (comma-separated or one per argument; default: BOOK_NAME)')
+    parser.add_argument('--include', nargs='+', help='only run these categories')
+    parser.add_argument('--exclude', nargs='+', help='do not run these categories')
+    parser.add_argument('--jobs', type=int, default=int(os.getenv('PIPELINE_JOBS', '4')), help='scripts that run at the same time for each book (default: PIPELINE_JOBS or 4)')
+    parser.add_argument('--book-jobs', type=int, default=int(os.getenv('BOOK_JOBS', '1')), help='books that run at the same time (default: BOOK_JOBS or 1)')
+    parser.add_argument('--range', help='only (re)generate the notes of these verses, e.g. "5", "5-7", or "5:1-7:20"; they replace the same verses in the existing output (default: VERSE_RANGE)')
+    parser.add_argument('--resume', action='store_true', help='continue the AI scripts from the checkpoints of an interrupted run (default: RESUME)')
+    parser.add_argument('--batch', action='store_true', help='send the chapter prompts of the AI scripts through the OpenAI Batch API (default: LLM_BATCH)')
+    parser.add_argument('--fused', action='store_true', help='look for related categories (e.g. doublets and parallelism) together, with one prompt per chapter (default: FUSED)')
+    parser.add_argument('--force', action='store_true', help='run every stage, even those whose manifest is up to date (default: PIPELINE_FORCE)')
+    parser.add_argument('--list', action='store_true', help='list the books and categories and exit')
+    args = parser.parse_args()
+
     script_path = os.getenv("SCRIPT_PATH")
 
-    script_runner = ScriptRunner(script_path)
-    script_runner.run_scripts()
+    if args.range is not None:
+        try:
+            ScriptRunner._parse_verse_range(args.range)
+        except ValueError as e:
+            parser.error(str(e))
+        # Passed on to every script
+        os.environ['VERSE_RANGE'] = args.range
+
+    if args.resume:
+        os.environ['RESUME'] = '1'
+    if args.batch:
+        os.environ['LLM_BATCH'] = '1'
+    if args.fused:
+        os.environ['FUSED'] = '1'
+
+    script_runner = ScriptRunner(script_path, jobs=args.jobs)
+    if args.force:
+        os.environ['PIPELINE_FORCE'] = '1'
+        script_runner.force = True
+
+    if args.list:
+        print('Books: ' + ', '.join(script_runner.acronym_mapping))
+        print('Categories: ' + ', '.join(script_runner.script_mapping))
+    elif args.books or args.include or args.exclude or args.range is not None or args.resume or args.batch or args.fused:
+        try:
+            books = script_runner.select_books(split_names(args.books) or [script_runner.book_name])
+            excluded_categories = script_runner.select_excluded_categories(split_names(args.include), split_names(args.exclude))
+        except ValueError as e:
+            parser.error(str(e))
+
+        book_results = script_runner.run_books(books, excluded_categories, args.book_jobs)
+        if any(status not in ('ok', 'cached') for results in book_results.values() for status, seconds in results.values()):
+            exit(1)
+    else:
+        script_runner.run_scripts()
@@ -6,6 +6,9 @@ import re
 from dotenv import load_dotenv
 
 class Generic_Nouns(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Explanation', 'Snippet', 'Alternate Translation']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -33,15 +36,15 @@ class Generic_Nouns(TNPrepper):
 
         prompt3 = (
             f"Here is a list of generic nouns in this chapter:\n{response2}\n\n"
-            "For each generic noun, append a row of data to a TSV table. If the list is empty, return 'None' instead of a table.\n"
-            "Each row in the TSV table must contain exactly four tab-separated values:\n"
-            "\n(1) The first tab-separated value will provide the chapter and verse where the generic noun is found. Do not include the book name."
-            "\n(2) The second tab-separated value will provide an explanation of the generic noun. The explanation must follow this template: 'The word **generic_noun** represents [things] in general, not one particular [thing]'. Replace the bracketed words with information from the verse and context. The word or words in double asterisks must be exact quotes from the verse."
-            "\n(3) The third tab-separated value will contain an exact quote from the verse. This quote will provide the words that would need to be rephrased to express the idea without using a generic noun."
-            "\n(4) The fourth tab-separated value will model how to rephrase the exact quote from the third value so that it refers to people or things in general. One of the best ways to do this is to make the noun or noun phrase plural. Make sure that the rephrased text can exactly replace the quote in the verse."
+            "For each generic noun, add a row to the table. If the list is empty, the table has no rows.\n"
+            "Each row in the table must contain exactly four values:\n"
+            "\n(1) The first value will provide the chapter and verse where the generic noun is found. Do not include the book name."
+            "\n(2) The second value will provide an explanation of the generic noun. The explanation must follow this template: 'The word **generic_noun** represents [things] in general, not one particular [thing]'. Replace the bracketed words with information from the verse and context. The word or words in double asterisks must be exact quotes from the verse."
+            "\n(3) The third value will contain an exact quote from the verse. This quote will provide the words that would need to be rephrased to express the idea without using a generic noun."
+            "\n(4) The fourth value will model how to rephrase the exact quote from the third value so that it refers to people or things in general. One of the best ways to do this is to make the noun or noun phrase plural. Make sure that the rephrased text can exactly replace the quote in the verse."
             "\nMake sure that the values in each row are consistent in how they identify, understand, and explain the collective noun.\n"
         )
-        return self._query_openai(chapter_content, prompt3)
+        return self._query_rows(chapter_content, prompt3, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -82,6 +85,9 @@ class Generic_Nouns(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -96,31 +102,14 @@ class Generic_Nouns(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 4:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Explanation': columns[1],
-                        'Snippet': columns[2],
-                        'Alternate Translation': columns[3]
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Generic_Nouns')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'Explanation', 'Snippet', 'Alternate Translation']
+        headers = self.row_headers
         file_name = 'ai_genericnouns.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)
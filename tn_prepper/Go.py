@@ -15,14 +15,14 @@ class Go(TNPrepper):
 
         go_instance = Go("Obadiah", "ult")
         
-        # Scrape data from proposed book
-        soup = self._scrape_and_read_data(self.book_name, self.version)
+        # Load the parsed data of the proposed book
+        parsed_book = self._load_parsed_book(self.book_name, self.version)
 
-        # Define the identification pattern
-        identification_pattern = r'x-morph="([^"]*?V[^"]*?)".+?x-content="([^"]+?)".+\\w .+?\|'
+        # Look up the identification pattern (searched for in the morphology)
+        identification_pattern = self.identification_patterns['go']
 
         # Create verse data
-        verse_data = self._create_verse_data(soup, self.book_name, identification_pattern)
+        verse_data = self._create_verse_data(parsed_book, self.book_name, identification_pattern)
 
         modified_verse_data = self._figs_go(verse_data)
 
@@ -5,7 +5,10 @@ import csv
 import re
 from dotenv import load_dotenv
 
-class RQuestion(TNPrepper):
+class Kinship(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Term', 'Explanation']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -27,19 +30,19 @@ class RQuestion(TNPrepper):
             "grandfather: side of the family\n"
             "grandmother: side of the family\n"
             "-in-law: side of the family, specific relationship\n\n"
-            "You have been given a chapter from the Bible. Identify all terms for the above relationships in the chapter, if any. Only identify the relationships listed above. Do not include any other family relationships, such as terms like 'queen', 'wife', 'servant', 'son', 'daughter', or 'father'. If there are no terms, return 'None.'\n"
+            "You have been given a chapter from the Bible. Identify all terms for the above relationships in the chapter, if any. Only identify the relationships listed above. Do not include any other family relationships, such as terms like 'queen', 'wife', 'servant', 'son', 'daughter', or 'father'. If there are no terms, the table has no rows.\n"
             "Ignore any figurative uses of terms for these relationships, and focus only on literal family relationships.\n"
-            "When you find a term for one of the above relationships, you must append a row of data to a TSV table. If there are multiple terms in one verse, append a separate row for each one.\n"
-            "Each row must contain exactly three tab-separated values:\n"
-            "\n(1) The first tab-separated value will provide the chapter and verse where the term is found. Ensure that you provide the correct reference for the term."
-            "\n(2) The second tab-separated value will provide the term from the verse. Quote exactly from the verse."
-            "\n(3) The third tab-separated value will give the required information for the term, using all information you have available. If you do not know some of the required information, include that fact in your answer. The required information must be must put in this three-sentence template:\n"
+            "When you find a term for one of the above relationships, you must add a row to the table. If there are multiple terms in one verse, add a separate row for each one.\n"
+            "Each row must contain exactly three values:\n"
+            "\n(1) The first value will provide the chapter and verse where the term is found. Ensure that you provide the correct reference for the term."
+            "\n(2) The second value will provide the term from the verse. Quote exactly from the verse."
+            "\n(3) The third value will give the required information for the term, using all information you have available. If you do not know some of the required information, include that fact in your answer. The required information must be must put in this three-sentence template:\n"
             "'Here the term **[family relationship term]** specifically refers to [the exact family relationship]. [Any further explanation required, such as if information is not known.] If your language has a specific word for [the exact family relationship], it would be appropriate to use it here.'"
             "\nReplace the words in brackets with the appropriate information. If you quote directly from the verse, use double asterisks instead of quote marks, as the template illustrates.\n"
             "If the term is not one of the specified family relationship terms listed above, do not include it in your response.\n"
-            "Ensure that the table is in TSV form."
+            "Ensure that each row contains exactly these three values."
         )
-        return self._query_openai(chapter_content, prompt)
+        return self._query_rows(chapter_content, prompt, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -81,6 +84,9 @@ class RQuestion(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -95,30 +101,14 @@ class RQuestion(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 3:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Term': columns[1],
-                        'Explanation': columns[2],
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Kinship')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'Term', 'Explanation']
+        headers = self.row_headers
         file_name = 'ai_kinship.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)
@@ -132,5 +122,5 @@ class RQuestion(TNPrepper):
 if __name__ == "__main__":
     book_name = os.getenv("BOOK_NAME")
 
-    rquestion_instance = RQuestion(book_name)
-    rquestion_instance.run()
+    kinship_instance = Kinship(book_name)
+    kinship_instance.run()
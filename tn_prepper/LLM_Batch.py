@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import atexit
+import itertools
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+from Local_Batch_Client import LocalBatchClient
+
+
+class LLMBatch():
+    def __init__(self, client=None, enabled=None, local=None):
+        # LLM_BATCH=1 sends the OpenAI requests of the chapter prompt chains through the Batch API
+        # instead of one by one. That is slower, but costs half as much and has its own rate limits.
+        if enabled is None:
+            enabled = os.getenv('LLM_BATCH', '').lower() in ('1', 'true', 'yes')
+        self.enabled = enabled
+
+        # LLM_BATCH_LOCAL=1 uses LocalBatchClient instead of the Batch API, e.g. to try a script offline
+        if local is None:
+            local = os.getenv('LLM_BATCH_LOCAL', '').lower() in ('1', 'true', 'yes')
+        self.client = LocalBatchClient() if local else client
+
+        # The JSONL files that were sent are kept here
+        self.batch_dir = os.getenv('LLM_BATCH_DIR', 'output/cache/batches')
+
+        # Seconds between status checks of a submitted batch
+        self.poll_seconds = float(os.getenv('LLM_BATCH_POLL_SECONDS', '0' if local else '30'))
+
+        # A batch is sent as soon as every running chain waits for a response. Chains that wait for
+        # something else (e.g. an identical request of another chain) are covered by sending whatever
+        # is collected after this many seconds without new requests.
+        self.flush_seconds = float(os.getenv('LLM_BATCH_FLUSH_SECONDS', '5'))
+
+        self.pending = []
+        self.active_chains = 0
+        self.last_request = time.time()
+        self.worker = None
+        self.condition = threading.Condition()
+        self.thread_state = threading.local()
+        self.request_ids = itertools.count(1)
+
+        self.batches = 0
+        self.requests = 0
+        self.failed = 0
+
+        if self.enabled:
+            atexit.register(self.report)
+
+    # Announces "count" prompt chains (e.g. one per chapter) before they start, so that no batch is
+    # sent before all of them have made their first request
+    def expect_chains(self, count):
+        with self.condition:
+            self.active_chains += count
+
+    # Runs the current thread as one of the expected prompt chains; its requests go into batches
+    @contextmanager
+    def chain(self):
+        self.thread_state.in_chain = True
+        try:
+            yield
+        finally:
+            self.thread_state.in_chain = False
+            with self.condition:
+                self.active_chains -= 1
+                self.condition.notify_all()
+
+    # True if requests of the current thread should go into a batch
+    def in_chain(self):
+        return self.enabled and getattr(self.thread_state, 'in_chain', False)
+
+    # Adds a chat completion request (the body of /v1/chat/completions) to the next batch and returns
+    # the message content once that batch is done
+    def request(self, body):
+        future = Future()
+        with self.condition:
+            self.pending.append((f'request-{next(self.request_ids)}', body, future))
+            self.last_request = time.time()
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.__run, daemon=True)
+                self.worker.start()
+            self.condition.notify_all()
+        return future.result()
+
+    def __run(self):
+        while True:
+            with self.condition:
+                while True:
+                    idle_seconds = time.time() - self.last_request
+                    if self.pending and (len(self.pending) >= self.active_chains or idle_seconds >= self.flush_seconds):
+                        break
+                    if not self.pending and self.active_chains == 0:
+                        self.worker = None
+                        return
+                    self.condition.wait(timeout=max(0.1, self.flush_seconds - idle_seconds) if self.pending else None)
+                requests, self.pending = self.pending, []
+
+            self.__send(requests)
+
+    def __send(self, requests):
+        try:
+            results, errors = self.__run_batch(requests)
+        except Exception as e:
+            print(f'Batch of {len(requests)} requests failed: {e}')
+            self.failed += len(requests)
+            for custom_id, body, future in requests:
+                future.set_exception(e)
+            return
+
+        for custom_id, body, future in requests:
+            if custom_id in results:
+                future.set_result(results[custom_id])
+            else:
+                self.failed += 1
+                error = errors.get(custom_id, 'no response in the batch')
+                print(f'Request {custom_id} failed: {error}')
+                future.set_exception(RuntimeError(f'Request {custom_id} failed: {error}'))
+
+    # Reads the lines of an output or error file of a batch into "results" ({custom_id: content}) for the
+        # requests that succeeded and "errors" ({custom_id: error}) for those that did not
+    @staticmethod
+    def __read_records(text, results, errors):
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get('response') or {}
+            if response.get('status_code') == 200:
+                results[record['custom_id']] = response['body']['choices'][0]['message']['content']
+            else:
+                error = record.get('error') or (response.get('body') or {}).get('error') or {}
+                errors[record['custom_id']] = f"{error.get('message') or 'no message'} (status {response.get('status_code')}, code {error.get('code')})"
+
+    # Writes the requests to a JSONL file, submits it, waits for the batch, and returns {custom_id: content}
+        # and {custom_id: error}
+    def __run_batch(self, requests):
+        os.makedirs(self.batch_dir, exist_ok=True)
+        batch_path = f'{self.batch_dir}/batch-{int(time.time())}-{os.getpid()}-{self.batches + 1}.jsonl'
+        with open(batch_path, 'w', encoding='utf-8') as file:
+            for custom_id, body, future in requests:
+                file.write(json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': '/v1/chat/completions', 'body': body}, ensure_ascii=False) + '\n')
+
+        with open(batch_path, 'rb') as file:
+            input_file = self.client.files.create(file=file, purpose='batch')
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint='/v1/chat/completions', completion_window='24h')
+        self.batches += 1
+        self.requests += len(requests)
+        print(f'Submitted batch {batch.id} with {len(requests)} requests ({batch_path})')
+
+        start_time = time.time()
+        while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+            time.sleep(self.poll_seconds)
+            batch = self.client.batches.retrieve(batch.id)
+        print(f'Batch {batch.id} {batch.status} after {time.time() - start_time:.0f}s')
+
+        # Requests that failed are listed in the error file
+        results = {}
+        errors = {}
+        if batch.output_file_id:
+            self.__read_records(self.client.files.content(batch.output_file_id).text, results, errors)
+        if batch.error_file_id:
+            self.__read_records(self.client.files.content(batch.error_file_id).text, results, errors)
+        return results, errors
+
+    def report(self):
+        if self.batches or self.failed:
+            print(f'LLM batches: {self.batches} batches, {self.requests} requests, {self.failed} without a response')
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import Future
+
+
+class LLMCache():
+    def __init__(self, cache_path=None, max_mb=None, refresh=None, enabled=None):
+        # Responses are stored in one SQLite file, keyed by the sha256 of everything that was sent
+        self.cache_path = cache_path or os.getenv('LLM_CACHE_PATH', 'output/cache/llm_cache.sqlite')
+
+        # The least recently used responses are dropped once the cache grows beyond this size
+        if max_mb is None:
+            max_mb = float(os.getenv('LLM_CACHE_MAX_MB', '200'))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+        # With "refresh", cached responses are ignored (and replaced) the first time they are asked for
+        if refresh is None:
+            refresh = os.getenv('LLM_CACHE_REFRESH', '').lower() in ('1', 'true', 'yes')
+        self.refresh = refresh
+        self.refreshed_keys = set()
+
+        # LLM_CACHE=0 turns the cache off completely
+        if enabled is None:
+            enabled = os.getenv('LLM_CACHE', '1').lower() not in ('0', 'false', 'no')
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        # Identical requests that are already running share one Future
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.connection = None
+
+        if self.enabled:
+            atexit.register(self.report)
+
+    def __connect(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            # Several scripts may share the cache file, so wait for their writes instead of failing
+            self.connection = sqlite3.connect(self.cache_path, timeout=30, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, provider TEXT, model TEXT, response TEXT, '
+                'size INTEGER, created REAL, last_used REAL)'
+            )
+            self.connection.commit()
+        return self.connection
+
+    # Returns the cache key for one request
+        # A context that is not a string (ATs_snippets.py passes a set holding the verses) is keyed by
+        # its text, which is also what the prompt contains.
+    @staticmethod
+    def key(provider, model, system, context, prompt, temperature):
+        request = json.dumps([provider, model, system, context, prompt, temperature], ensure_ascii=False, default=str)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def __get(self, key):
+        if self.refresh and key not in self.refreshed_keys:
+            return None
+        with self.lock:
+            connection = self.__connect()
+            row = connection.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row:
+                connection.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+                connection.commit()
+        return row[0] if row else None
+
+    def __put(self, key, provider, model, response):
+        now = time.time()
+        with self.lock:
+            connection = self.__connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO responses (key, provider, model, response, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, provider, model, response, len(response.encode('utf-8')), now, now)
+            )
+            self.refreshed_keys.add(key)
+
+            # Evict the least recently used responses until the cache fits again
+            total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total_size > self.max_bytes:
+                evicted = []
+                for old_key, size in connection.execute('SELECT key, size FROM responses ORDER BY last_used'):
+                    if total_size <= self.max_bytes:
+                        break
+                    evicted.append((old_key,))
+                    total_size -= size
+                connection.executemany('DELETE FROM responses WHERE key = ?', evicted)
+            connection.commit()
+
+    # Returns (response, from_cache). "request" is only called when the response is not cached yet
+    # and no identical request is already running; failed requests (None) are not cached.
+    def fetch(self, key, request, provider='', model=''):
+        if not self.enabled:
+            return request(), False
+
+        response = self.__get(key)
+        if response is not None:
+            self.hits += 1
+            return response, True
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+
+        # Someone else is already asking the same thing
+        if not owner:
+            self.coalesced += 1
+            return future.result(), True
+
+        self.misses += 1
+        try:
+            response = request()
+            if response is not None:
+                self.__put(key, provider, model, response)
+            future.set_result(response)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+        return response, False
+
+    def report(self):
+        if self.hits or self.misses or self.coalesced:
+            print(f'LLM cache: {self.hits} hits, {self.misses} misses, {self.coalesced} coalesced ({self.cache_path})')
@@ -0,0 +1,69 @@
+class LexiconMatcher():
+    def __init__(self, entries):
+        # Each entry is one word (e.g. "peace") or two words (e.g. "covenant faithfulness"); the
+        # second word of a two-word entry may come anywhere after the first one.
+        self.entries = list(dict.fromkeys(entries))
+        self.entry_parts = {entry: entry.split(' ', 1) for entry in self.entries}
+
+        # One character trie over all (lower-cased) words; "None" marks the end of a word
+        self.trie = {}
+        for parts in self.entry_parts.values():
+            for part in parts:
+                node = self.trie
+                for character in part.lower():
+                    node = node.setdefault(character, {})
+                node[None] = part.lower()
+
+    @staticmethod
+    def __is_word_character(character):
+        return character.isalnum() or character == '_'
+
+    def __is_boundary(self, text, position):
+        before = position > 0 and self.__is_word_character(text[position - 1])
+        after = position < len(text) and self.__is_word_character(text[position])
+        return before != after
+
+    @staticmethod
+    def __lower(text):
+        # Keep character positions stable for the few characters that lower-case to several characters
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            lowered = ''.join(character.lower() if len(character.lower()) == 1 else character for character in text)
+        return lowered
+
+    # Returns {word: [(start, end), ...]} for every lexicon word found as a whole word in "text"
+    def __find_words(self, text):
+        lowered = self.__lower(text)
+        found = {}
+        for start in range(len(text)):
+            if not self.__is_boundary(text, start):
+                continue
+            node = self.trie
+            position = start
+            while True:
+                if None in node and self.__is_boundary(text, position):
+                    found.setdefault(node[None], []).append((start, position))
+                if position == len(text) or lowered[position] not in node:
+                    break
+                node = node[lowered[position]]
+                position += 1
+        return found
+
+    # Returns the lexicon entries found in "text" (case-insensitive, whole words), in lexicon order
+    def find(self, text):
+        found = self.__find_words(text)
+        if not found:
+            return []
+
+        entries = []
+        for entry in self.entries:
+            parts = [part.lower() for part in self.entry_parts[entry]]
+            if len(parts) == 1:
+                if parts[0] in found:
+                    entries.append(entry)
+            elif parts[0] in found and parts[1] in found:
+                # The second word has to start after the first occurrence of the first word ends
+                first_end = min(end for start, end in found[parts[0]])
+                if any(start >= first_end for start, end in found[parts[1]]):
+                    entries.append(entry)
+        return entries
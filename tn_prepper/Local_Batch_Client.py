@@ -0,0 +1,74 @@
+import json
+import itertools
+from types import SimpleNamespace
+
+
+class LocalBatchClient():
+    # Stands in for the files and batches endpoints of the OpenAI client, so that batch mode can be
+    # tried without a network or an API key. Requests are answered by "responder", which takes the
+    # request body and returns the message content.
+    def __init__(self, responder=None, polls_until_done=1):
+        self.responder = responder or self.echo
+        self.polls_until_done = polls_until_done
+        self.stored_files = {}
+        self.stored_batches = {}
+        self.ids = itertools.count(1)
+
+        self.files = SimpleNamespace(create=self.create_file, content=self.file_content)
+        self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.retrieve_batch)
+
+    # Answers with the first line of the prompt, which is enough to follow a prompt chain
+    @staticmethod
+    def echo(body):
+        prompt = body['messages'][-1]['content']
+        return f"Local batch response to: {prompt.split('Prompt:', 1)[-1].strip().splitlines()[0] if prompt.strip() else ''}"
+
+    def create_file(self, file, purpose):
+        file_id = f'file-local-{next(self.ids)}'
+        content = file.read()
+        self.stored_files[file_id] = content.decode('utf-8') if isinstance(content, bytes) else content
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def file_content(self, file_id):
+        return SimpleNamespace(text=self.stored_files[file_id])
+
+    def create_batch(self, input_file_id, endpoint, completion_window, **kwargs):
+        batch_id = f'batch-local-{next(self.ids)}'
+        self.stored_batches[batch_id] = {'input_file_id': input_file_id, 'polls': 0, 'batch': None}
+        return SimpleNamespace(id=batch_id, status='validating', output_file_id=None, error_file_id=None)
+
+    def retrieve_batch(self, batch_id):
+        stored_batch = self.stored_batches[batch_id]
+        if stored_batch['batch']:
+            return stored_batch['batch']
+
+        stored_batch['polls'] += 1
+        if stored_batch['polls'] < self.polls_until_done:
+            return SimpleNamespace(id=batch_id, status='in_progress', output_file_id=None, error_file_id=None)
+
+        # Answer every request, the way the Batch API writes its output file. A request for which the
+        # responder raises goes into the error file instead.
+        output_lines = []
+        error_lines = []
+        for line in self.stored_files[stored_batch['input_file_id']].splitlines():
+            request = json.loads(line)
+            try:
+                body = {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': self.responder(request['body'])}}]}
+            except Exception as e:
+                body = {'error': {'message': str(e), 'type': 'local_error', 'code': type(e).__name__}}
+                error_lines.append(json.dumps({'custom_id': request['custom_id'], 'response': {'status_code': 500, 'body': body}, 'error': None}))
+                continue
+            output_lines.append(json.dumps({'custom_id': request['custom_id'], 'response': {'status_code': 200, 'body': body}, 'error': None}))
+
+        output_file_id = self.__store_lines(output_lines)
+        error_file_id = self.__store_lines(error_lines)
+        stored_batch['batch'] = SimpleNamespace(id=batch_id, status='completed', output_file_id=output_file_id, error_file_id=error_file_id)
+        return stored_batch['batch']
+
+    # Stores the lines as a file and returns its id, or None if there are no lines (as the Batch API does)
+    def __store_lines(self, lines):
+        if not lines:
+            return None
+        file_id = f'file-local-{next(self.ids)}'
+        self.stored_files[file_id] = '\n'.join(lines) + '\n'
+        return file_id
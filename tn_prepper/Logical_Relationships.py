@@ -6,6 +6,9 @@ import csv
 from dotenv import load_dotenv
 
 class LogicalRelationships(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Function', 'Explanation', 'Snippet', 'Alternate Translation']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -34,18 +37,18 @@ class LogicalRelationships(TNPrepper):
 
         prompt3 = (
             f"You have been given a chapter from the Bible. Here is a list of significant conjunctions and transition words in this chapter:\n{response3}\n\n"
-            "Analyze these conjunctions and transition words in context. As your answer, you will provide a table with exactly five tab-separated values for each word or phrase in the provided list."
+            "Analyze these conjunctions and transition words in context. As your answer, you will provide a table with a row of exactly five values for each word or phrase in the provided list."
             "\n(1) The first column will provide the chapter and verse where the conjunction or transition word is found. Do not include the book name."
             "\n(2) The second column will indicate the precise function of the transition word or conjunction in context. You must identify one of the following functions: contrast, result, purpose, contrary to fact condition, factual condition, hypothetical condition, exception, addition."
             "\n(3) The third column will provide a one sentence explanation of the function of the transition word or conjunction in context. The sentence should begin with this phrase: 'The word **word** here'."
             "\n(4) The fourth column will provide an exact quote from the verse. This quote will be the section of the verse that would need to be rephrased to express the idea with a different transition word or phrase."
-            "\n(5) The fifth column will provide a way to express the exact quote from the fourth value with a different transition word or phrase."
+            "\n(5) The fifth column will provide a way to express the exact quote from the fourth column with a different transition word or phrase."
             "Be sure that the values in each row are consistent in how they understand the transition word or conjunction.\n"
-            "Here is an example of what your response might look like:\n\n"
-            "1:4\tcontrast\tThe word **but** here introduces a contrast with what Jonah said in the previous verse.\tbut\tin contrast\n"
-            "3:5\tresult\tThe word **And** here connects the response of the men of Nineveh to Jonah's proclamation.\tAnd he\tSo he"
+            "Here is an example of two rows:\n\n"
+            '["1:4", "contrast", "The word **but** here introduces a contrast with what Jonah said in the previous verse.", "but", "in contrast"]\n'
+            '["3:5", "result", "The word **And** here connects the response of the men of Nineveh to Jonah\'s proclamation.", "And he", "So he"]'
         )
-        return self._query_openai(chapter_content, prompt3)
+        return self._query_rows(chapter_content, prompt3, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -114,6 +117,9 @@ class LogicalRelationships(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -128,32 +134,14 @@ class LogicalRelationships(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 5:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Function': columns[1],
-                        'Explanation': columns[2],
-                        'Snippet': columns[3],
-                        'Alternate Translation': columns[4]
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Logical_Relationships')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'Function', 'Explanation', 'Snippet', 'Alternate Translation']
+        headers = self.row_headers
         file_name = 'ai_relationships.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)
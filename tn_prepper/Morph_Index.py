@@ -0,0 +1,172 @@
+from array import array
+from collections import defaultdict
+
+
+class MorphIndex():
+    # Fields that follow the part of speech in each segment of a Hebrew/Aramaic morphology code
+    # (see https://hb.openscriptures.org/parsing/HebrewMorphologyCodes.html)
+    segment_fields = {
+        'A': ['type', 'gender', 'number', 'state'],
+        'N': ['type', 'gender', 'number', 'state'],
+        'P': ['type', 'person', 'gender', 'number'],
+        'S': ['type', 'person', 'gender', 'number'],
+        'R': ['type'],
+        'T': ['type'],
+        'C': [],
+        'D': [],
+    }
+
+    def __init__(self, postings=None, size=0):
+        # "postings" maps each feature key to a sorted array of token positions
+        self.postings = postings or {}
+        self.size = size
+
+    # Splits a morphology code such as "He,C:Vqw3ms" into the language and one dict of features per segment
+    @classmethod
+    def parse_morphology(cls, morphology):
+        if ',' not in morphology:
+            return '', []
+        language, code = morphology.split(',', 1)
+
+        # Greek codes (e.g. "Gr,N,,,,,NMS,") are comma separated; only the part of speech is used
+        if language == 'Gr':
+            pos = code.split(',', 1)[0]
+            return language, [{'pos': pos[:1]}] if pos else []
+
+        segments = []
+        for segment in code.split(':'):
+            if not segment:
+                continue
+            features = {'pos': segment[0]}
+            if segment[0] == 'V':
+                # Verbs: stem, type (aspect), then person/gender/number, or gender/number/state for participles
+                features['stem'] = segment[1:2]
+                features['type'] = segment[2:3]
+                if features['type'] in ('r', 's'):
+                    fields = ['gender', 'number', 'state']
+                elif features['type'] in ('a', 'c'):
+                    fields = []
+                else:
+                    fields = ['person', 'gender', 'number']
+                values = segment[3:]
+            else:
+                fields = cls.segment_fields.get(segment[0], [])
+                values = segment[1:]
+            for field, value in zip(fields, values):
+                features[field] = value
+            segments.append({field: value for field, value in features.items() if value})
+        return language, segments
+
+    # Returns the index keys for one token: language, lexeme/strong, and segment-scoped morphology features
+    @classmethod
+    def token_keys(cls, token):
+        chapter, verse, morphology, lexeme, strong, lemma, occurrence, gloss = token
+        language, segments = cls.parse_morphology(morphology)
+
+        keys = {f'language={language}', f'content={lexeme}', f'lemma={lemma}'}
+        # x-strong can carry prefixes (e.g. "b:H7225"); index the main number and its base without a letter suffix
+        if strong:
+            main_strong = strong.split(':')[-1]
+            keys.add(f'strong={main_strong}')
+            keys.add(f'strong={main_strong.rstrip("abcdefgh")}')
+        for segment in segments:
+            pos = segment['pos']
+            keys.add(f'pos={pos}')
+            for field, value in segment.items():
+                if field != 'pos':
+                    keys.add(f'{pos}.{field}={value}')
+        return keys
+
+    # Builds the index for the tokens of a parsed book
+    @classmethod
+    def build(cls, tokens):
+        postings = defaultdict(lambda: array('I'))
+        for position, token in enumerate(tokens):
+            for key in cls.token_keys(token):
+                postings[key].append(position)
+        return cls(dict(postings), len(tokens))
+
+    def __postings(self, key):
+        return self.postings.get(key, array('I'))
+
+    # Merges two sorted arrays, keeping positions found in both
+    @staticmethod
+    def intersect(first, second):
+        result = array('I')
+        i = j = 0
+        while i < len(first) and j < len(second):
+            if first[i] == second[j]:
+                result.append(first[i])
+                i += 1
+                j += 1
+            elif first[i] < second[j]:
+                i += 1
+            else:
+                j += 1
+        return result
+
+    # Merges two sorted arrays, keeping positions found in either
+    @staticmethod
+    def union(first, second):
+        result = array('I')
+        i = j = 0
+        while i < len(first) and j < len(second):
+            if first[i] == second[j]:
+                result.append(first[i])
+                i += 1
+                j += 1
+            elif first[i] < second[j]:
+                result.append(first[i])
+                i += 1
+            else:
+                result.append(second[j])
+                j += 1
+        result.extend(first[i:])
+        result.extend(second[j:])
+        return result
+
+    # Keeps the positions of "first" that are not in "second"
+    @staticmethod
+    def difference(first, second):
+        result = array('I')
+        j = 0
+        for position in first:
+            while j < len(second) and second[j] < position:
+                j += 1
+            if j == len(second) or second[j] != position:
+                result.append(position)
+        return result
+
+    # Returns the sorted positions of the tokens that match every given feature, e.g.
+    #   lookup(pos='N', type='p')       proper nouns
+    #   lookup(pos='V', stem='NPH')     Niphal, Pual, or Hophal verbs (several letters mean "any of")
+    #   lookup(strong='H5414')          every form of one lexeme
+    # Features other than pos, language, strong, lemma, and content belong to the segment named by "pos".
+    def lookup(self, **features):
+        pos = features.pop('pos', None)
+        result = None
+
+        def __any_of(key_prefix, values):
+            if isinstance(values, str):
+                values = [values] if key_prefix in ('strong', 'lemma', 'content', 'language') else list(values)
+            positions = array('I')
+            for value in values:
+                positions = self.union(positions, self.__postings(f'{key_prefix}={value}'))
+            return positions
+
+        if pos:
+            result = __any_of('pos', pos)
+        for field, values in features.items():
+            if field in ('strong', 'lemma', 'content', 'language'):
+                positions = __any_of(field, values)
+            else:
+                if not pos:
+                    raise ValueError(f'"{field}" needs a part of speech (pos) to look up')
+                positions = array('I')
+                for pos_value in pos:
+                    positions = self.union(positions, __any_of(f'{pos_value}.{field}', values))
+            result = positions if result is None else self.intersect(result, positions)
+
+        if result is None:
+            return array('I', range(self.size))
+        return result
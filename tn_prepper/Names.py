@@ -13,14 +13,14 @@ class Names(TNPrepper):
 
     def run(self):
         
-        # Scrape data from proposed book
-        soup = self._scrape_and_read_data(self.book_name, self.version)
+        # Load the parsed data of the proposed book
+        parsed_book = self._load_parsed_book(self.book_name, self.version)
 
-        # Define the identification pattern
-        identification_pattern = r'x-morph="([^"]*?[^V]Np[^"]*?)".+?x-content="([^"]+?)".+\\w .+?\|'
+        # Look up the identification pattern (searched for in the morphology)
+        identification_pattern = self.identification_patterns['names']
 
         # Create verse data
-        verse_data = self._create_verse_data(soup, self.book_name, identification_pattern)
+        verse_data = self._create_verse_data(parsed_book, self.book_name, identification_pattern)
 
         joined_name_count, modified_verse_data = self._translate_names(verse_data)
 
@@ -13,14 +13,14 @@ class Ordinals(TNPrepper):
 
     def run(self):
 
-        # Scrape data from proposed book
-        soup = self._scrape_and_read_data(self.book_name, self.version)
+        # Load the parsed data of the proposed book
+        parsed_book = self._load_parsed_book(self.book_name, self.version)
 
-        # Define the identification pattern
-        identification_pattern = r'x-morph="([^"]*?Ao[^"]*?)".+?x-content="([^"]+?)".+\\w .+?\|'
+        # Look up the identification pattern (searched for in the morphology)
+        identification_pattern = self.identification_patterns['ordinals']
 
         # Create verse data
-        verse_data = self._create_verse_data(soup, self.book_name, identification_pattern)
+        verse_data = self._create_verse_data(parsed_book, self.book_name, identification_pattern)
 
         # Transform the data
         support_reference = "rc://*/ta/man/translate/translate-ordinal"
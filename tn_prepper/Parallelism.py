@@ -6,6 +6,9 @@ import re
 from dotenv import load_dotenv
 
 class Parallelism(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Phrases', 'Alternate Translation', 'Speaker']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -30,14 +33,14 @@ class Parallelism(TNPrepper):
 
         prompt3 = (
             f"You have been given a chapter from the Bible. Here is a list of parallelisms from that chapter:\n{response2}\n\n"
-            "If the list is empty, return 'None'. Otherwise, for each parallelism, you will append a row of data to a TSV table. Each row should contain exactly four tab-separated values:"
-            "(1) The first tab-separated value will be the chapter and verse where the parallelism is found. Do not include the book name.\n"
-            "(2) The second tab-separated value will be an exact quote from the verse. This quote must contain the two clauses that make up the parallelism.\n"
-            "(3) The third tab-separated value will be a way to express the two parallel clauses you quoted as a single, simple clause. Be sure that this simple clause combines the ideas of the two clauses you quoted.\n"
-            "(4) The fourth tab-separated value will identify who writes or speaks the parallelism.\n\n"
+            "If the list is empty, the table has no rows. Otherwise, for each parallelism, you will add a row to the table. Each row should contain exactly four values:"
+            "(1) The first value will be the chapter and verse where the parallelism is found. Do not include the book name.\n"
+            "(2) The second value will be an exact quote from the verse. This quote must contain the two clauses that make up the parallelism.\n"
+            "(3) The third value will be a way to express the two parallel clauses you quoted as a single, simple clause. Be sure that this simple clause combines the ideas of the two clauses you quoted.\n"
+            "(4) The fourth value will identify who writes or speaks the parallelism.\n\n"
             "\nBe sure that the items in each row are consistent in how they understand the parallelism.\n"
         )
-        return self._query_openai(chapter_content, prompt3)
+        return self._query_rows(chapter_content, prompt3, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -78,6 +81,9 @@ class Parallelism(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -92,31 +98,14 @@ class Parallelism(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 4:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Phrases': columns[1],
-                        'Alternate Translation': columns[2],
-                        'Speaker': columns[3]
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Parallelism')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'Phrases', 'Alternate Translation', 'Speaker']
+        headers = self.row_headers
         file_name = 'ai_parallelism.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)
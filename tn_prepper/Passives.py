@@ -1,8 +1,6 @@
 from TNPrepper import TNPrepper
 from dotenv import load_dotenv
 import os
-import re
-from itertools import permutations, combinations
 from collections import defaultdict
 
 load_dotenv()
@@ -55,93 +53,46 @@ class Passives(TNPrepper):
                 continue
 
             glosses = [row['Glosses'] for row in rows]
-            glosses_set = set(glosses)  # For efficient lookup
-
-            gloss_to_pattern = {re.escape(gloss): gloss for gloss in glosses}
-            found_glosses = set()
-            found_valid_sequence = False
-
-            for r in range(len(glosses), 1, -1):
-                for comb in combinations(glosses, r):
-                    for perm in permutations(comb):
-                        # Skip if any gloss in the permutation has already been used
-                        if any(gloss in found_glosses for gloss in perm):
-                            continue
-
-                        # Create a regex pattern and track glosses used
-                        pattern_parts = []
-                        glosses_used = []
-
-                        for i in range(len(perm) - 1):
-                            gloss = re.escape(perm[i])
-                            mod_gloss = re.sub('…', '.+?', gloss)
-                            pattern_parts.append(mod_gloss)
-                            pattern_parts.append(r'[^;.?:!]+?')  # Match any characters except sentence delimiters
-                            glosses_used.append(gloss)
-                        pattern_parts.append(re.escape(perm[-1]))
-                        glosses_used.append(re.escape(perm[-1]))
-
-                        names_joined_pattern = ''.join(pattern_parts)
-
-                        # Search for matches in the verse
-                        for match in re.finditer(names_joined_pattern, verse, re.IGNORECASE):
-                            start, end = match.span()
-                            matched_text = verse[start:end]
-
-                            # Map back to original glosses
-                            reconstructed_glosses = []
-                            for part in pattern_parts:
-                                if part in gloss_to_pattern:
-                                    reconstructed_glosses.append(gloss_to_pattern[part])
-
-                            # Filter rows based on the reconstructed glosses
-                            matched_rows = [row for row in rows if row['Glosses'] in reconstructed_glosses]
-                            found_glosses.update(reconstructed_glosses)
-
-                            if matched_rows:
-                                # Join matched rows
-                                glosses_combined = '…'.join(row['Glosses'] for row in matched_rows)
-                                lexeme_combined = ' & '.join(row['Lexeme'] for row in matched_rows)
-                                morphology_combined = '; '.join(row['Morphology'] for row in matched_rows)
-
-                                combined_data.append({
-                                    'Reference': reference,
-                                    'Glosses': glosses_combined,
-                                    'Lexeme': lexeme_combined,
-                                    'Morphology': morphology_combined,
-                                })
-
-                                found_valid_sequence = True
-                                break  # Stop searching if a valid sequence is found
-
-                            if found_valid_sequence:
-                                break
-                        if found_valid_sequence:
-                            break
-                    if found_valid_sequence:
-                        break
+
+            # Find the largest group of glosses that occur together in one sentence of the verse
+            found_glosses = self._align_glosses(verse, glosses, min_gap=1)
+
+            # Filter rows based on the found glosses
+            matched_rows = [row for row in rows if row['Glosses'] in found_glosses]
+            if matched_rows:
+                # Join matched rows
+                glosses_combined = '…'.join(row['Glosses'] for row in matched_rows)
+                lexeme_combined = ' & '.join(row['Lexeme'] for row in matched_rows)
+                morphology_combined = '; '.join(row['Morphology'] for row in matched_rows)
+
+                combined_data.append({
+                    'Reference': reference,
+                    'Glosses': glosses_combined,
+                    'Lexeme': lexeme_combined,
+                    'Morphology': morphology_combined,
+                })
 
             # Handle non-found glosses
-            non_found_glosses = set(glosses) - found_glosses
-            if non_found_glosses:
-                non_found_rows = [row for row in rows if row['Glosses'] in non_found_glosses]
-                combined_data.extend(non_found_rows)
+            non_found_rows = [row for row in rows if row['Glosses'] not in found_glosses]
+            combined_data.extend(non_found_rows)
 
             processed_references.add(reference)  # Mark this reference as processed
 
+        self._report_alignment()
+
         return combined_data
 
 
     def run(self):
         
-        # Scrape data from proposed book
-        soup = self._scrape_and_read_data(self.book_name, self.version)
+        # Load the parsed data of the proposed book
+        parsed_book = self._load_parsed_book(self.book_name, self.version)
 
-        # Define the identification pattern
-        identification_pattern = r'x-morph="([^"]*?V[^"]*?)".+?x-content="([^"]+?)".+\\w .+?\|'
+        # Look up the identification pattern (searched for in the morphology)
+        identification_pattern = self.identification_patterns['passives']
 
         # Create verse data
-        verse_data = self._create_verse_data(soup, self.book_name, identification_pattern)
+        verse_data = self._create_verse_data(parsed_book, self.book_name, identification_pattern)
 
         modified_verse_data = self._figs_passive(verse_data)
 
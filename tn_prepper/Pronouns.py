@@ -6,6 +6,9 @@ import re
 from dotenv import load_dotenv
 
 class Pronouns(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Pronoun', 'Explanation', 'Snippet', 'Alternate Translation']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -32,16 +35,16 @@ class Pronouns(TNPrepper):
 
         prompt3 = (
             f"You have been given a chapter from the Bible. Here is a list of pronouns whose referent is unclear:\n{response2}\n\n"
-            "If the list is empty or 'None', respond with 'None'. Otherwise, create a TSV table of exactly four columns of data based on the list and the chapter."
+            "If the list is empty or 'None', the table has no rows. Otherwise, create a table of exactly five columns of data based on the list and the chapter."
             "\n(1) The first column will contain the reference for the verse where the pronoun is found. Do not include the book name."
             "\n(2) The second column will contain the pronoun whose referent is unclear."
             "\n(3) The third column will provide an explanation. You must follow this template: 'The pronoun **[pronoun]** refers to [the referent]. If this is not clear for your readers, you could refer to [the referent] directly.'"
             "\n(4) The fourth column will provide an exact quote from the verse. This quote will contain the word or words from the verse that would need to be rephrased to make the referenc clear."
             "\n(5) The fifth column will model how the quote from the fourth column could be rephrased so the referent is clear. Be sure that the word or words you provide exactly replace the quote from the fourth column."
-            "Make sure that you are consistent in how you understand and interpret the pronoun across the columns, and use TSV format."
+            "Make sure that you are consistent in how you understand and interpret the pronoun across the columns."
         )
 
-        return self._query_openai(chapter_content, prompt3)
+        return self._query_rows(chapter_content, prompt3, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -83,6 +86,9 @@ class Pronouns(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -97,32 +103,14 @@ class Pronouns(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 5:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Pronoun': columns[1],
-                        'Explanation': columns[2],
-                        'Snippet': columns[3],
-                        'Alternate Translation': columns[4]
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Pronouns')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'Pronoun', 'Explanation', 'Snippet', 'Alternate Translation']
+        headers = self.row_headers
         file_name = 'ai_pronouns.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)
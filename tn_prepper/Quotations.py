@@ -6,6 +6,9 @@ import re
 from dotenv import load_dotenv
 
 class Quotations(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Snippet', 'Type', 'Alternate Translation']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -15,19 +18,19 @@ class Quotations(TNPrepper):
 
     def __process_prompt(self, chapter_content):
         prompt = (
-            "In the Bible, quotations can be either direct, indirect, or within another quote. You have been given a chapter from the Bible. Please identify all direct, indirect, and quote-in-quote quotations that that do not span multiple verses. If there are no quotes that do not span multiple verses, return 'None'.\n"
-            "For every direct, indirect, or quote-in-quote quotation, append a row of data to a TSV table. If there are multiple quotations in a verse, include a separate row for each one.\n"
-            "Each row must contain exactly five tab-separated values:\n"
-            "\n(1) The first tab-separated value will provide the chapter and verse where the quotation is found. Do not include the book name."
-            "\n(2) The second tab-separated value will provide the words from the verse that introduce the quotation (including speaker and verb of speech) and the words that contain the entire quotation. Quote exactly from the verse."
-            "\n(3) The third tab-separated value will identify whether the quote is 'quote-in-quote', 'direct', or 'indirect'."
-            "\n(4) The fourth tab-separated value will rephrase the words from the second tab-separated value. The rephrased text will model how to rephrase a direct quote as an indirect quote, an indirect quote as a direct quote (with quotation marks), or a quote-in-quote as a single-level quote. Ensure that the rephrased text is as close as possible to the words from the second value and can exactly replace them. Do not remove figurative language or simplify the wording."
+            "In the Bible, quotations can be either direct, indirect, or within another quote. You have been given a chapter from the Bible. Please identify all direct, indirect, and quote-in-quote quotations that that do not span multiple verses. If there are no quotes that do not span multiple verses, the table has no rows.\n"
+            "For every direct, indirect, or quote-in-quote quotation, add a row to the table. If there are multiple quotations in a verse, include a separate row for each one.\n"
+            "Each row must contain exactly five values:\n"
+            "\n(1) The first value will provide the chapter and verse where the quotation is found. Do not include the book name."
+            "\n(2) The second value will provide the words from the verse that introduce the quotation (including speaker and verb of speech) and the words that contain the entire quotation. Quote exactly from the verse."
+            "\n(3) The third value will identify whether the quote is 'quote-in-quote', 'direct', or 'indirect'."
+            "\n(4) The fourth value will rephrase the words from the second value. The rephrased text will model how to rephrase a direct quote as an indirect quote, an indirect quote as a direct quote (with quotation marks), or a quote-in-quote as a single-level quote. Ensure that the rephrased text is as close as possible to the words from the second value and can exactly replace them. Do not remove figurative language or simplify the wording."
             "\nMake sure that the values in each row are consistent in how they identify, understand, and explain the quotation."
             "\nFocus on these two things:"
             "\n(1) make sure that you include the words that introduce the quote in the second value"
             "\n(2) make sure that you follow the instructions for rephrasing the quote in the fourth value"
         )
-        return self._query_openai(chapter_content, prompt)
+        return self._query_rows(chapter_content, prompt, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -78,6 +81,9 @@ class Quotations(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -92,28 +98,11 @@ class Quotations(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 4:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Snippet': columns[1],
-                        'Type': columns[2],
-                        'Alternate Translation': columns[3]
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Quotations')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
         headers = ['Reference', 'Quotation', 'Type', 'Snippet', 'Alternate Translation']
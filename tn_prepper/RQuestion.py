@@ -6,6 +6,9 @@ import re
 from dotenv import load_dotenv
 
 class RQuestion(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'RQuestion', 'Explanation', 'Alternate Translation', 'Snippet']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -16,17 +19,17 @@ class RQuestion(TNPrepper):
     def __process_prompt(self, chapter_content):
         prompt = (
             "A rhetorical question is a question that is asked not to elicit a direct answer, but rather to make a point, emphasize a sentiment, or create an effect. You have been given a chapter from the Bible. Please identify all rhetorical questions in the chapter, if there are any.\n"
-            "When you find a rhetorical question, you will append a row of data to a table. If there are multiple rhetorical questions right next to each other in a verse, include them all in one row.\n"
-            "Each row must contain exactly five tab-separated values. Do not include any introduction or explanation with the table.\n"
-            "\n(1) The first tab-separated value will provide the chapter and verse where the rhetorical question is found. Do not include the book name."
-            "\n(2) The second tab-separated value will provide the words from the verse that contain the rhetorical question. Quote exactly from the verse."
-            "\n(3) The third tab-separated value will provide a one-sentence explanation of the function of the rhetorical question. You must begin your sentence with the phrase 'The [speaker] is using the question form to'. Replace [speaker] with the person who writes or speaks the rhetorical question."
-            "\n(4) The fourth tab-separated value will provide a way to express the idea without using the question form. The alternate expression you provide must be able to exactly replace the rhetorical question from the verse."
-            "\n(5) The fifth tab-separated value will include the exact words from the verse that the alternate expression can replace. Make sure that the words you provide are quoted precisely from the verse."
+            "When you find a rhetorical question, you will add a row to the table. If there are multiple rhetorical questions right next to each other in a verse, include them all in one row.\n"
+            "Each row must contain exactly five values. Do not include any introduction or explanation with the table.\n"
+            "\n(1) The first value will provide the chapter and verse where the rhetorical question is found. Do not include the book name."
+            "\n(2) The second value will provide the words from the verse that contain the rhetorical question. Quote exactly from the verse."
+            "\n(3) The third value will provide a one-sentence explanation of the function of the rhetorical question. You must begin your sentence with the phrase 'The [speaker] is using the question form to'. Replace [speaker] with the person who writes or speaks the rhetorical question."
+            "\n(4) The fourth value will provide a way to express the idea without using the question form. The alternate expression you provide must be able to exactly replace the rhetorical question from the verse."
+            "\n(5) The fifth value will include the exact words from the verse that the alternate expression can replace. Make sure that the words you provide are quoted precisely from the verse."
             "\nMake sure that the values in each row are consistent in how they identify, understand, and explain the rhetorical question.\n"
-            "Also, make sure that each row contains exactly these five values, separated by tabs."
+            "Also, make sure that each row contains exactly these five values."
         )
-        return self._query_openai(chapter_content, prompt)
+        return self._query_rows(chapter_content, prompt, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -67,6 +70,9 @@ class RQuestion(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -81,32 +87,14 @@ class RQuestion(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 5:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'RQuestion': columns[1],
-                        'Explanation': columns[2],
-                        'Alternate Translation': columns[3],
-                        'Snippet': columns[4]
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='RQuestion')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'RQuestion', 'Explanation', 'Alternate Translation', 'Snippet']
+        headers = self.row_headers
         file_name = 'ai_rquestions.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)
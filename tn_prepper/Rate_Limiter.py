@@ -0,0 +1,240 @@
+import os
+import re
+import time
+import atexit
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+
+class RateLimiter():
+    # Status codes after which a request is tried again
+    retry_status_codes = (408, 409, 429, 500, 502, 503, 504)
+
+    def __init__(self, name='LLM', requests_per_minute=None, tokens_per_minute=None, max_retries=None):
+        self.name = name
+
+        # Limits for all requests that share this limiter; 0 means no limit
+        if requests_per_minute is None:
+            requests_per_minute = float(os.getenv('LLM_RPM', '0'))
+        if tokens_per_minute is None:
+            tokens_per_minute = float(os.getenv('LLM_TPM', '0'))
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+        # Number of times a request is retried after a 429, a 5xx, or a connection error
+        if max_retries is None:
+            max_retries = int(os.getenv('LLM_MAX_RETRIES', '6'))
+        self.max_retries = max_retries
+
+        # The buckets live in a small SQLite file, so that every script running at the same time
+        # (e.g. started in parallel by Generate_Notes.py) draws from the same quota.
+        # LLM_RATE_LIMIT_SHARED=0 keeps them in this process only.
+        self.shared = os.getenv('LLM_RATE_LIMIT_SHARED', '1').lower() not in ('0', 'false', 'no')
+        self.state_path = os.getenv('LLM_RATE_LIMIT_PATH', 'output/cache/rate_limits.sqlite')
+        self.connection = None
+
+        # Two token buckets that start full and refill continuously. "blocked_until" is the time
+        # before which no request is sent (set by Retry-After and exhausted rate-limit headers).
+        self.local_state = self.__initial_state()
+
+        self.requests = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+        self.lock = threading.Lock()
+
+        atexit.register(self.report)
+
+    def __initial_state(self):
+        return {
+            'available_requests': self.requests_per_minute,
+            'available_tokens': self.tokens_per_minute,
+            'updated': time.time(),
+            'blocked_until': 0.0
+        }
+
+    def __connect(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+            self.connection = sqlite3.connect(self.state_path, timeout=30, check_same_thread=False, isolation_level=None)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'name TEXT PRIMARY KEY, available_requests REAL, available_tokens REAL, updated REAL, blocked_until REAL)'
+            )
+        return self.connection
+
+    # Yields the bucket state, refilled up to now; changes are saved when the block ends
+        # For a shared limiter, the state is read and written in one exclusive SQLite transaction,
+        # so processes never hand out the same capacity twice.
+    @contextmanager
+    def __state(self):
+        with self.lock:
+            if not self.shared:
+                self.__refill(self.local_state)
+                yield self.local_state
+                return
+
+            connection = self.__connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute(
+                    'SELECT available_requests, available_tokens, updated, blocked_until FROM buckets WHERE name = ?', (self.name,)
+                ).fetchone()
+                if row:
+                    state = dict(zip(('available_requests', 'available_tokens', 'updated', 'blocked_until'), row))
+                else:
+                    state = self.__initial_state()
+                self.__refill(state)
+                yield state
+                connection.execute(
+                    'INSERT OR REPLACE INTO buckets (name, available_requests, available_tokens, updated, blocked_until) VALUES (?, ?, ?, ?, ?)',
+                    (self.name, state['available_requests'], state['available_tokens'], state['updated'], state['blocked_until'])
+                )
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def __refill(self, state):
+        now = time.time()
+        elapsed = max(0.0, now - state['updated'])
+        state['updated'] = now
+        if self.requests_per_minute:
+            state['available_requests'] = min(self.requests_per_minute, state['available_requests'] + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            state['available_tokens'] = min(self.tokens_per_minute, state['available_tokens'] + elapsed * self.tokens_per_minute / 60)
+
+    def __sleep(self, seconds):
+        time.sleep(seconds)
+        with self.lock:
+            self.throttled_seconds += seconds
+
+    # Blocks until one request of about "tokens" tokens may be sent
+    def acquire(self, tokens=0):
+        while True:
+            with self.__state() as state:
+                wait = max(0.0, state['blocked_until'] - time.time())
+                if self.requests_per_minute and state['available_requests'] < 1:
+                    wait = max(wait, (1 - state['available_requests']) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute:
+                    # A request larger than the whole bucket only waits for a full bucket
+                    needed_tokens = min(tokens, self.tokens_per_minute)
+                    if state['available_tokens'] < needed_tokens:
+                        wait = max(wait, (needed_tokens - state['available_tokens']) * 60 / self.tokens_per_minute)
+
+                if wait == 0:
+                    if self.requests_per_minute:
+                        state['available_requests'] -= 1
+                    if self.tokens_per_minute:
+                        state['available_tokens'] -= tokens
+                    self.requests += 1
+                    return
+
+            self.__sleep(wait)
+
+    # Charges tokens that were only known after the response came back (e.g. completion tokens)
+    def record(self, tokens):
+        if self.tokens_per_minute and tokens:
+            with self.__state() as state:
+                state['available_tokens'] -= tokens
+
+    # Parses durations such as "1s", "6m0s", "20ms", or "0.5" into seconds
+    @staticmethod
+    def __parse_duration(value):
+        if value is None:
+            return None
+        value = str(value).strip()
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        seconds = 0.0
+        parts = re.findall(r'([\d.]+)(ms|h|m|s)', value)
+        if not parts:
+            return None
+        for number, unit in parts:
+            seconds += float(number) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+        return seconds
+
+    # Returns the number of seconds the server asked us to wait, if any
+    def __retry_after(self, headers):
+        # A retry-after-ms that cannot be parsed falls back to retry-after, then to the backoff
+        milliseconds = self.__parse_duration(headers.get('retry-after-ms'))
+        if milliseconds is not None:
+            return max(0.0, milliseconds / 1000)
+        retry_after = headers.get('retry-after')
+        if not retry_after:
+            return None
+        seconds = self.__parse_duration(retry_after)
+        if seconds is None:
+            # Retry-After can also be an HTTP date
+            try:
+                seconds = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return max(0.0, seconds)
+
+    # Adjusts the buckets to the rate-limit headers of a response
+    def update(self, headers):
+        if not headers:
+            return
+        headers = {key.lower(): value for key, value in headers.items()}
+        with self.__state() as state:
+            for kind in ('requests', 'tokens'):
+                remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+                if remaining is None:
+                    continue
+                try:
+                    remaining = float(remaining)
+                except ValueError:
+                    continue
+                if kind == 'requests' and self.requests_per_minute:
+                    state['available_requests'] = min(state['available_requests'], remaining)
+                if kind == 'tokens' and self.tokens_per_minute:
+                    state['available_tokens'] = min(state['available_tokens'], remaining)
+
+                # Nothing left: wait for the server's window to reset
+                reset = self.__parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                if remaining < 1 and reset:
+                    state['blocked_until'] = max(state['blocked_until'], time.time() + reset)
+
+    # Sends "request" (a function returning a raw response with .headers) under the limits, and retries
+    # it with exponential backoff and jitter after a 429, a 5xx, or a connection error. Retry-After is
+    # honored, and while it lasts, no other request of this limiter is sent either.
+    def send(self, request, tokens=0):
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                response = request()
+            except Exception as e:
+                status_code = getattr(e, 'status_code', None)
+                connection_error = status_code is None and type(e).__name__ in ('APIConnectionError', 'APITimeoutError', 'ConnectionError', 'TimeoutError')
+                if attempt >= self.max_retries or not (status_code in self.retry_status_codes or connection_error):
+                    raise
+
+                headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+                headers = {key.lower(): value for key, value in headers.items()}
+                delay = self.__retry_after(headers)
+                if delay is None:
+                    # Exponential backoff with jitter, capped at one minute
+                    backoff = min(60.0, 2 ** attempt)
+                    delay = backoff / 2 + random.uniform(0, backoff / 2)
+
+                self.retries += 1
+                if status_code == 429:
+                    with self.__state() as state:
+                        state['blocked_until'] = max(state['blocked_until'], time.time() + delay)
+                print(f'{self.name} request failed ({status_code or type(e).__name__}); retrying in {delay:.1f}s')
+                self.__sleep(delay)
+                attempt += 1
+                continue
+
+            self.update(getattr(response, 'headers', None))
+            return response
+
+    def report(self):
+        if self.requests:
+            print(f'{self.name} rate limiter: {self.requests} requests, {self.retries} retries, {self.throttled_seconds:.1f}s throttled')
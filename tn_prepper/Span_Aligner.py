@@ -0,0 +1,104 @@
+import re
+
+
+class SpanAligner():
+    # Finds the words of a verse that an alternate translation replaces, without asking an LLM: the
+    # span of verse words that best covers the words of the alternate translation. The result is cut
+    # from the verse itself, so the snippet is always an exact quote.
+    def __init__(self, min_prefix=3, max_extra_words=4, unmatched_penalty=0.5):
+        # Two words count as the same word if one starts with the other or they share this many letters
+        # at the start, so that e.g. "joy" matches "joyful" and "taken" matches "take"
+        self.min_prefix = min_prefix
+
+        # A span may be this many words longer than the alternate translation (or the anchor)
+        self.max_extra_words = max_extra_words
+
+        # What a span word that matches nothing costs, against one point for a matched word
+        self.unmatched_penalty = unmatched_penalty
+
+    # Returns [(word, start, end)] with the lowercase words of "text" and their character positions
+    @staticmethod
+    def tokenize(text):
+        return [(match.group(0).lower(), match.start(), match.end()) for match in re.finditer(r"\w+(?:['’]\w+)*", text or '')]
+
+    # Returns "word" without a plural, possessive, or verb ending, e.g. "sons" -> "son", "walked" -> "walk"
+    @staticmethod
+    def stem(word):
+        for suffix in ("'s", "’s", 'ing', 'ed', 'es', 's'):
+            if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+                return word[:-len(suffix)]
+        return word
+
+    def _same_word(self, word1, word2):
+        if word1 == word2:
+            return True
+        shorter, longer = sorted((word1, word2), key=len)
+        if len(shorter) >= self.min_prefix and longer.startswith(shorter):
+            return True
+        return len(shorter) > self.min_prefix and shorter[:self.min_prefix + 1] == longer[:self.min_prefix + 1]
+
+    # Returns (first, last) indexes of the verse words that "anchor" covers, or None if it is not in the verse
+        # An anchor with '…' (e.g. "she…was left") is several runs of words, found in order
+    def _find_anchor(self, verse_words, anchor):
+        anchor_span = None
+        start = 0
+        for part in anchor.split('…'):
+            part_words = [word for word, part_start, part_end in self.tokenize(part)]
+            if not part_words:
+                continue
+            first = next((first for first in range(start, len(verse_words) - len(part_words) + 1)
+                          if verse_words[first:first + len(part_words)] == part_words), None)
+            if first is None:
+                return None
+            start = first + len(part_words)
+            anchor_span = (anchor_span[0] if anchor_span else first, start - 1)
+        return anchor_span
+
+    # Returns the exact text of the verse span that "alternate_translation" replaces, or None if no
+        # verse word matches it. A span scores one point for each of its words that matches a word of
+        # the alternate translation in the same order (the longest common subsequence of their stems)
+        # and loses "unmatched_penalty" for each of its other words. If "anchor" (e.g. the abstract noun
+        # or the passive verb the note is about) is in the verse, the span always covers it.
+    def align(self, verse_text, alternate_translation, anchor=None):
+        verse_tokens = self.tokenize(verse_text)
+        verse_words = [word for word, start, end in verse_tokens]
+        at_words = [word for word, start, end in self.tokenize(alternate_translation)]
+        if not verse_words or not at_words:
+            return None
+        verse_stems = [self.stem(word) for word in verse_words]
+        at_stems = [self.stem(word) for word in at_words]
+
+        anchor_span = self._find_anchor(verse_words, anchor) if anchor else None
+        max_length = max(len(at_words), anchor_span[1] - anchor_span[0] + 1 if anchor_span else 0) + self.max_extra_words
+
+        best = None
+        for first in range(len(verse_words)):
+            if anchor_span and first > anchor_span[0]:
+                break
+
+            # matches[j]: the most words of the span so far that match the first j words of the alternate translation in order
+            matches = [0] * (len(at_stems) + 1)
+            for last in range(first, min(len(verse_words), first + max_length)):
+                previous = matches
+                matches = [0]
+                for j, at_stem in enumerate(at_stems):
+                    if self._same_word(verse_stems[last], at_stem):
+                        matches.append(previous[j] + 1)
+                    else:
+                        matches.append(max(previous[j + 1], matches[j]))
+                matched = matches[-1]
+
+                if anchor_span and last < anchor_span[1]:
+                    continue
+                if not matched and not anchor_span:
+                    continue
+                length = last - first + 1
+                # Shorter spans win ties
+                score = (matched - self.unmatched_penalty * (length - matched), -length)
+                if best is None or score > best[0]:
+                    best = (score, first, last)
+
+        if best is None:
+            return None
+        score, first, last = best
+        return verse_text[verse_tokens[first][1]:verse_tokens[last][2]]
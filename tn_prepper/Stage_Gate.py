@@ -0,0 +1,58 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+class StageGate():
+    def __init__(self, slots):
+        # At most "slots" requests are sent at the same time. When a slot frees up, it goes to the
+        # waiting request of the latest stage (e.g. the third prompt of a chapter before the first
+        # prompt of a new chapter), so chapters already in the pipeline finish first and the number
+        # of half-done chapters stays bounded.
+        self.slots = max(1, slots)
+        self.in_use = 0
+        self.waiting = []
+        self.tickets = 0
+        self.condition = threading.Condition()
+
+        # {stage: [requests, seconds waiting for a slot, seconds in the slot]}
+        self.stats = {}
+
+    def __next_in_line(self):
+        # Latest stage first, then first come first served
+        return min(self.waiting, key=lambda entry: (-entry[0], entry[1]))
+
+    # Holds one request slot for a request of "stage" (0 for the first prompt of a chain)
+    @contextmanager
+    def slot(self, stage):
+        start_time = time.time()
+        with self.condition:
+            self.tickets += 1
+            entry = (stage, self.tickets)
+            self.waiting.append(entry)
+            while self.in_use >= self.slots or self.__next_in_line() != entry:
+                self.condition.wait()
+            self.waiting.remove(entry)
+            self.in_use += 1
+
+            # The request that was next in line after this one may take a free slot now too
+            if self.in_use < self.slots and self.waiting:
+                self.condition.notify_all()
+
+        acquired_time = time.time()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_use -= 1
+                stats = self.stats.setdefault(stage, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += acquired_time - start_time
+                stats[2] += time.time() - acquired_time
+                self.condition.notify_all()
+
+    def report(self):
+        lines = []
+        for stage, (requests, waiting_seconds, busy_seconds) in sorted(self.stats.items()):
+            lines.append(f'stage {stage + 1}: {requests} requests, {busy_seconds / requests:.1f}s per request, {waiting_seconds:.1f}s waiting for a slot')
+        return '; '.join(lines)
@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+
+
+class StageManifest():
+    # Modules every stage imports through TNPrepper; a change to one of them re-runs every stage
+    shared_modules = [
+        'TNPrepper.py',
+        'Download_Cache.py',
+        'USFM_Tokenizer.py',
+        'Morph_Index.py',
+        'Lexicon_Matcher.py',
+        'LLM_Cache.py',
+        'Rate_Limiter.py',
+        'Checkpoint.py',
+        'LLM_Batch.py',
+        'Local_Batch_Client.py',
+        'Stage_Gate.py'
+    ]
+
+    # Scripts a stage imports besides the shared modules; a change to one of them re-runs the stage too
+    script_modules = {
+        'ATs_snippets.py': ['Span_Aligner.py'],
+        'Fused_Detection.py': ['Doublets.py', 'Parallelism.py', 'Collective_Nouns.py', 'Generic_Nouns.py', 'Nominal_Adjectives.py', 'Kinship.py', 'Gender.py']
+    }
+
+    # Environment variables that change what the stages write
+    environment_variables = ['BOOK_NAME', 'VERSION', 'MAX_VERSE_GLOSSES', 'VERSE_RANGE', 'NOTES_PER_QUERY', 'STRUCTURED_OUTPUT']
+
+    # Environment variables that change what one stage writes; a change to one of them re-runs only that stage
+    script_environment_variables = {
+        'Fused_Detection.py': ['FUSED_GROUPS']
+    }
+
+    def __init__(self, script_path, book_name):
+        self.script_path = script_path or '.'
+        self.book_name = book_name
+        self.book_dir = os.path.join(self.script_path, 'output', book_name)
+        self.manifest_dir = os.path.join(self.book_dir, 'manifests')
+
+    # Returns the sha256 of a file, or None if it does not exist
+    @staticmethod
+    def hash_file(path):
+        if not os.path.exists(path):
+            return None
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def __manifest_path(self, script_name):
+        return os.path.join(self.manifest_dir, f'{os.path.splitext(script_name)[0]}.json')
+
+    def __hash_files(self, directory, file_names):
+        return {file_name: self.hash_file(os.path.join(directory, file_name)) for file_name in file_names}
+
+    # Returns what a run of "script_name" depends on: its code, the shared modules, its environment,
+    # and the content of its input files (names relative to output/<book>)
+    def build(self, script_name, input_files):
+        return {
+            'script': script_name,
+            'code': self.__hash_files(self.script_path, [script_name] + self.script_modules.get(script_name, []) + self.shared_modules),
+            'env': dict({name: os.getenv(name, '') for name in self.environment_variables + self.script_environment_variables.get(script_name, [])}, BOOK_NAME=self.book_name),
+            'inputs': self.__hash_files(self.book_dir, sorted(set(input_files)))
+        }
+
+    # True if the last successful run of the stage had the same code, environment, and inputs,
+    # and its outputs are still there unchanged
+    def matches(self, manifest):
+        manifest_path = self.__manifest_path(manifest['script'])
+        if not os.path.exists(manifest_path):
+            return False
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as file:
+                previous = json.load(file)
+        except (OSError, ValueError):
+            return False
+
+        if any(previous.get(key) != manifest[key] for key in ('code', 'env', 'inputs')):
+            return False
+        outputs = previous.get('outputs', {})
+        return all(self.hash_file(os.path.join(self.book_dir, file_name)) == output_hash for file_name, output_hash in outputs.items())
+
+    # Forgets the last run, e.g. before the stage runs again, so that a failed run is never trusted
+    def remove(self, script_name):
+        manifest_path = self.__manifest_path(script_name)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+    # Records a successful run together with the hashes of the files it wrote (files it did not write are left out)
+    def save(self, manifest, output_files):
+        outputs = {file_name: output_hash for file_name, output_hash in self.__hash_files(self.book_dir, output_files).items() if output_hash}
+        manifest = dict(manifest, outputs=outputs)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        manifest_path = self.__manifest_path(manifest['script'])
+        tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(tmp_path, manifest_path)
@@ -1,106 +1,169 @@
 import os
 import csv
-import requests
+import json
+import pickle
+import hashlib
 from bs4 import BeautifulSoup
 import re
-from tqdm import tqdm
+import bisect
+from itertools import groupby
 from pprint import pprint
 import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import openai
 from dotenv import load_dotenv
 from openai import OpenAI
 import tiktoken
+from Download_Cache import DownloadCache
+from USFM_Tokenizer import USFMTokenizer
+from Morph_Index import MorphIndex
+from Lexicon_Matcher import LexiconMatcher
+from LLM_Cache import LLMCache
+from Rate_Limiter import RateLimiter
+from Checkpoint import Checkpoint
+from LLM_Batch import LLMBatch
+from Stage_Gate import StageGate
 client = OpenAI()
 
+# Shared by every request of this process to each provider
+rate_limiter = RateLimiter('OpenAI')
+# Groq allows 30 requests per minute
+groq_rate_limiter = RateLimiter('Groq', requests_per_minute=float(os.getenv('GROQ_RPM', '30')), tokens_per_minute=float(os.getenv('GROQ_TPM', '0')))
+
+# Bump when the layout of the parsed book artifact changes
+PARSED_BOOK_FORMAT = 4
+
 
 class TNPrepper():
+    # Morphology queries of the local detectors (see Morph_Index.py), all answered when the book is parsed
+    identification_patterns = {
+        'go': {'pos': 'V'},
+        'passives': {'pos': 'V'},
+        'names': {'pos': 'N', 'type': 'p'},
+        'ordinals': {'pos': 'A', 'type': 'o'},
+        'abstract nouns': {'pos': 'N', 'type': 'c'}
+    }
+
+    # Mapping of book names to their respective acronyms (Old Testament books are numbered below 40)
+    acronym_mapping = {
+        "Genesis": "01-GEN",
+        "Exodus": "02-EXO",
+        "Leviticus": "03-LEV",
+        "Numbers": "04-NUM",
+        "Deuteronomy": "05-DEU",
+        "Joshua": "06-JOS",
+        "Judges": "07-JDG",
+        "Ruth": "08-RUT",
+        "1 Samuel": "09-1SA",
+        "2 Samuel": "10-2SA",
+        "1 Kings": "11-1KI",
+        "2 Kings": "12-2KI",
+        "1 Chronicles": "13-1CH",
+        "2 Chronicles": "14-2CH",
+        "Ezra": "15-EZR",
+        "Nehemiah": "16-NEH",
+        "Esther": "17-EST",
+        "Job": "18-JOB",
+        "Psalms": "19-PSA",
+        "Proverbs": "20-PRO",
+        "Ecclesiastes": "21-ECC",
+        "Song of Solomon": "22-SNG",
+        "Isaiah": "23-ISA",
+        "Jeremiah": "24-JER",
+        "Lamentations": "25-LAM",
+        "Ezekiel": "26-EZK",
+        "Daniel": "27-DAN",
+        "Hosea": "28-HOS",
+        "Joel": "29-JOL",
+        "Amos": "30-AMO",
+        "Obadiah": "31-OBA",
+        "Jonah": "32-JON",
+        "Micah": "33-MIC",
+        "Nahum": "34-NAM",
+        "Habakkuk": "35-HAB",
+        "Zephaniah": "36-ZEP",
+        "Haggai": "37-HAG",
+        "Zechariah": "38-ZEC",
+        "Malachi": "39-MAL",
+        "Matthew": "41-MAT",
+        "Mark": "42-MRK",
+        "Luke": "43-LUK",
+        "John": "44-JHN",
+        "Acts": "45-ACT",
+        "Romans": "46-ROM",
+        "1 Corinthians": "47-1CO",
+        "2 Corinthians": "48-2CO",
+        "Galatians": "49-GAL",
+        "Ephesians": "50-EPH",
+        "Philippians": "51-PHP",
+        "Colossians": "52-COL",
+        "1 Thessalonians": "53-1TH",
+        "2 Thessalonians": "54-2TH",
+        "1 Timothy": "55-1TI",
+        "2 Timothy": "56-2TI",
+        "Titus": "57-TIT",
+        "Philemon": "58-PHM",
+        "Hebrews": "59-HEB",
+        "James": "60-JAS",
+        "1 Peter": "61-1PE",
+        "2 Peter": "62-2PE",
+        "1 John": "63-1JN",
+        "2 John": "64-2JN",
+        "3 John": "65-3JN",
+        "Jude": "66-JUD",
+        "Revelation": "67-REV"
+    }
+
     def __init__(self, model='gpt-4o-mini'):
         self.output_base_dir = 'output'
         self.model = model
         self.tokenizer = tiktoken.get_encoding('cl100k_base')
+        self.download_cache = DownloadCache()
+
+        # LLM responses are cached on disk, so rerunning a script does not query the same prompts again
+        self.llm_cache = LLMCache()
+
+        # Number of requests sent at the same time by the chapter prompt chains (see _dispatch_chapters)
+        self.llm_concurrency = int(os.getenv('LLM_CONCURRENCY', '8'))
+
+        # Number of chapters in the pipeline at the same time, so that one chapter's later prompts
+        # overlap with the next chapters' first prompts
+        self.llm_pipeline_depth = int(os.getenv('LLM_PIPELINE_DEPTH', str(2 * self.llm_concurrency)))
+
+        # The stage gate and prompt count of the chain running on each thread
+        self.chain_state = threading.local()
+
+        # Prompt tokens sent to OpenAI, and how many of them the provider had cached (see _query_openai)
+        self.prompt_cache_stats = {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0}
+        self.stats_lock = threading.Lock()
+
+        # With LLM_BATCH=1, the OpenAI requests of the chapter prompt chains go through the Batch API
+        self.llm_batch = LLMBatch(client)
+
+        # Prompts that ask for a table get the rows as JSON, one list of values per row (see _query_rows);
+        # STRUCTURED_OUTPUT=0 still asks for JSON rows, but without enforcing the schema
+        self.structured_output = os.getenv('STRUCTURED_OUTPUT', '1').lower() in ('1', 'true', 'yes')
 
-    # Function to get the content of the file
+        # Verses with more glosses than this are not aligned (see _align_glosses)
+        self.max_verse_glosses = int(os.getenv('MAX_VERSE_GLOSSES', '40'))
+        self.alignment_stats = {'verses': 0, 'combined': 0, 'guarded': 0, 'most_glosses': 0, 'seconds': 0.0}
+
+        # Only the verses in VERSE_RANGE (e.g. "5", "5-7", "5:1-7:20") are processed, and the results
+        # replace just those verses in the existing output files (see _parse_verse_range)
+        self.verse_range = self._parse_verse_range(os.getenv('VERSE_RANGE', ''))
+
+    # Function to get the content of the file, through the on-disk download cache (OFFLINE=1 never uses the network)
     def _get_file_content(self, url):
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.text
-        else:
-            return ''
-
-    # Scrapes ult or ust and reads it, returning "soup"
-    def _scrape_and_read_data(self, book_name, version):
-        # Mapping of book names to their respective acronyms
-        acronym_mapping = {
-            "Genesis": "01-GEN",
-            "Exodus": "02-EXO",
-            "Leviticus": "03-LEV",
-            "Numbers": "04-NUM",
-            "Deuteronomy": "05-DEU",
-            "Joshua": "06-JOS",
-            "Judges": "07-JDG",
-            "Ruth": "08-RUT",
-            "1 Samuel": "09-1SA",
-            "2 Samuel": "10-2SA",
-            "1 Kings": "11-1KI",
-            "2 Kings": "12-2KI",
-            "1 Chronicles": "13-1CH",
-            "2 Chronicles": "14-2CH",
-            "Ezra": "15-EZR",
-            "Nehemiah": "16-NEH",
-            "Esther": "17-EST",
-            "Job": "18-JOB",
-            "Psalms": "19-PSA",
-            "Proverbs": "20-PRO",
-            "Song of Solomon": "22-SNG",
-            "Isaiah": "23-ISA",
-            "Jeremiah": "24-JER",
-            "Lamentations": "25-LAM",
-            "Ezekiel": "26-EZK",
-            "Daniel": "27-DAN",
-            "Hosea": "28-HOS",
-            "Joel": "29-JOL",
-            "Amos": "30-AMO",
-            "Obadiah": "31-OBA",
-            "Jonah": "32-JON",
-            "Micah": "33-MIC",
-            "Nahum": "34-NAM",
-            "Habakkuk": "35-HAB",
-            "Zephaniah": "36-ZEP",
-            "Haggai": "37-HAG",
-            "Zechariah": "38-ZEC",
-            "Malachi": "39-MAL",
-            "Matthew": "41-MAT",
-            "Mark": "42-MRK",
-            "Luke": "43-LUK",
-            "John": "44-JHN",
-            "Acts": "45-ACT",
-            "Romans": "46-ROM",
-            "1 Corinthians": "47-1CO",
-            "2 Corinthians": "48-2CO",
-            "Galatians": "49-GAL",
-            "Ephesians": "50-EPH",
-            "Philippians": "51-PHP",
-            "Colossians": "52-COL",
-            "1 Thessalonians": "53-1TH",
-            "2 Thessalonians": "54-2TH",
-            "1 Timothy": "55-1TI",
-            "2 Timothy": "56-2TI",
-            "Titus": "57-TIT",
-            "Philemon": "58-PHM",
-            "Hebrews": "59-HEB",
-            "James": "60-JAS",
-            "1 Peter": "61-1PE",
-            "2 Peter": "62-2PE",
-            "1 John": "63-1JN",
-            "2 John": "64-2JN",
-            "3 John": "65-3JN",
-            "Jude": "66-JUD",
-            "Revelation": "67-REV"
-        }
+        return self.download_cache.get(url)
 
+    # Downloads the usfm of ult or ust for the book, returning the raw text
+    def _get_book_usfm(self, book_name, version):
         # Get the acronym from the acronym mapping
-        if book_name in acronym_mapping:
-            acronym = acronym_mapping[book_name]
+        if book_name in self.acronym_mapping:
+            acronym = self.acronym_mapping[book_name]
         else:
             print("Invalid book name. Please enter a valid book name.")
             exit()
@@ -109,60 +172,174 @@ class TNPrepper():
         url = f"https://git.door43.org/unfoldingWord/en_{version}/raw/branch/master/{acronym}.usfm"
 
         # Get the file content
-        file_content = self._get_file_content(url)
-
-        # Process the file content
-        soup = BeautifulSoup(file_content, 'html.parser')
-        return soup
-
-    # NOTE: there may be too much variation among the functions to use this for all of them
-    # Searches "identification_pattern" and returns "verse_data"
-        # "identification_pattern" should have two match groups, 
-        # the first for morphology (x-morph) and the second for the Hebrew word (x-content),
-        # and it should end with \\w .+?\|
-    def _create_verse_data(self, soup, book_name, identification_pattern):
+        return self._get_file_content(url)
+
+    # Returns the "parsed book" (verses and aligned tokens) for ult or ust, kept in output/<book>/parsed_<version>.pickle
+    def _load_parsed_book(self, book_name, version):
+        file_content = self._get_book_usfm(book_name, version)
+        source_hash = hashlib.sha256(file_content.encode('utf-8')).hexdigest()
+
+        parsed_book_path = f'{self.output_base_dir}/{book_name}/parsed_{version}.pickle'
+        if os.path.exists(parsed_book_path):
+            with open(parsed_book_path, 'rb') as file:
+                parsed_book = pickle.load(file)
+            if parsed_book.get('format') == PARSED_BOOK_FORMAT and parsed_book.get('source_sha256') == source_hash:
+                return parsed_book
+
+        parsed_book = self.__build_parsed_book(file_content, book_name)
+        parsed_book['source_sha256'] = source_hash
+
+        # Extract the candidates of every local detector now, so that no detector has to scan the tokens
+        self._create_verse_data_batch(parsed_book, book_name, self.identification_patterns)
+
+        # Write to a temporary file first, since several detectors may be building at once
+        os.makedirs(os.path.dirname(parsed_book_path), exist_ok=True)
+        tmp_path = f'{parsed_book_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(parsed_book, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, parsed_book_path)
+        print(f'Parsed book has been written to {parsed_book_path}')
+
+        return parsed_book
+
+    # Builds the parsed book in one pass over the usfm
+    def __build_parsed_book(self, file_content, book_name):
         # Initialize variables
         chapter = None
         verse = None
+        verse_words = []
         verse_data = []
+        tokens = []
+        token = None
+        pending_punctuation = None
+        after_closing_marker = False
+
+        # Punctuation that belongs to the verse text: closing punctuation right after a marker
+        # that ends with '*', and opening punctuation right before the next marker
+        closing_pattern = re.compile(r'^[)}.,:;!?’”—]+')
+        opening_pattern = re.compile(r'[“‘{(]+$')
+
+        def __add_token(token):
+            # Keep aligned words that carry morphology, a Hebrew/Greek word, and at least one gloss
+            if token and token[2].get('x-morph') and token[2].get('x-content') and token[3]:
+                chapter, verse, attributes, glosses = token
+                tokens.append((
+                    chapter,
+                    verse,
+                    attributes['x-morph'],
+                    attributes['x-content'],
+                    attributes.get('x-strong', ''),
+                    attributes.get('x-lemma', ''),
+                    attributes.get('x-occurrence', ''),
+                    ' '.join(glosses)
+                ))
+
+        for kind, value, attributes in USFMTokenizer().tokenize(file_content):
+            if kind == 'text':
+                if after_closing_marker:
+                    match = closing_pattern.match(value)
+                    if match:
+                        verse_words.append(match.group())
+                match = opening_pattern.search(value)
+                pending_punctuation = match.group() if match else None
+                after_closing_marker = False
+                continue
+
+            if pending_punctuation:
+                verse_words.append(pending_punctuation)
+                pending_punctuation = None
+
+            if kind in ('c', 'v'):
+                if verse_words:
+                    # Append previous verse words to verse_data
+                    verse_data.append((f'{book_name} {chapter}:{verse}', " ".join(verse_words)))
+                    verse_words = []
+                if kind == 'c':
+                    chapter = value
+                else:
+                    verse = value
+            elif kind == 'zaln-s':
+                # Each alignment starts a new token; the words that follow are its glosses
+                __add_token(token)
+                token = (chapter, verse, attributes, [])
+            elif kind == 'w':
+                verse_words.extend(word.strip() for word in value.split())
+                if token and value:
+                    token[3].append(value)
+
+            after_closing_marker = kind in ('zaln-s', 'zaln-e', 'w') or (kind == 'marker' and value.endswith('*'))
+
+        __add_token(token)
+
+        # Append the last verse
+        if verse_words:
+            verse_data.append((f'{book_name} {chapter}:{verse}', " ".join(verse_words)))
+
+        # Clean up the spacing around punctuation
+        verses = []
+        for reference, verse_text in verse_data:
+            line = f'{reference}\t{verse_text}'
+            line = re.sub(r'( )([.,;:’”?!—})]+)', r'\2', line)
+            line = re.sub(r'([({“‘—]+)( )', r'\1', line)
+            line = re.sub(r'(\w[’]) (s)', r'\1\2', line)
+            line = line.strip()
+            reference, verse_text = line.split('\t', 1)
+            verses.append((reference, verse_text))
+
+        return {
+            'format': PARSED_BOOK_FORMAT,
+            'verses': verses,
+            'tokens': tokens,
+            'index': MorphIndex.build(tokens)
+        }
 
-        # Combine all lines into a single string
-        combined_text = soup.get_text(separator='\n')
-
-        # Split the combined text by "\\zaln-s"
-        chunks = combined_text.split('\\zaln-s')
-
-        with tqdm(total=len(chunks), desc="Processing Chunks") as pbar:
-            for chunk in chunks:
-                pbar.update(1)  # Update progress bar
-
-                # Find all matches of the desired pattern
-                matches = re.findall(identification_pattern, chunk, re.DOTALL)
-                if matches:  # Only proceed if there are matches
-                    for match in matches:
-                        lexeme = match[1]
-                        morphology = match[0]
-
-                        # Find all glosses in the chunk
-                        gloss_matches = re.findall(r'\\w (.+?)\|', chunk)
-                        if gloss_matches:
-                            # Combine all glosses into a single string
-                            combined_gloss = ' '.join(gloss_matches)
-
-                            # Append to verse_data with lexeme, verse reference, and combined glosses
-                            verse_data.append([f'{book_name} {chapter}:{verse}', combined_gloss, lexeme, morphology])
-
-                # Find chapter in the chunk
-                chapter_match = re.search(r'\\c (\d+)', chunk)
-                if chapter_match:
-                    chapter = int(chapter_match.group(1))
-
-                # Find verse in the chunk
-                verse_match = re.search(r'\\v (\d+)', chunk)
-                if verse_match:
-                    verse = int(verse_match.group(1))
-
-        return verse_data
+    # NOTE: there may be too much variation among the functions to use this for all of them
+    # Searches "identification_pattern" (a morphology index query such as {'pos': 'V'}, or a regex on x-morph) and returns "verse_data"
+    def _create_verse_data(self, parsed_book, book_name, identification_pattern):
+        return self._create_verse_data_batch(parsed_book, book_name, {'verse_data': identification_pattern})['verse_data']
+
+    # Searches several named "identification_patterns" at once and returns "verse_data" for each name
+    def _create_verse_data_batch(self, parsed_book, book_name, identification_patterns):
+        candidates = parsed_book.setdefault('candidates', {})
+        tokens = parsed_book['tokens']
+
+        def __candidate_key(pattern):
+            if isinstance(pattern, dict):
+                return tuple(sorted(pattern.items()))
+            return pattern
+
+        new_patterns = {}
+        for pattern in identification_patterns.values():
+            key = __candidate_key(pattern)
+            if key in candidates:
+                continue
+            if isinstance(pattern, dict):
+                candidates[key] = list(parsed_book['index'].lookup(**pattern))
+            else:
+                new_patterns[key] = re.compile(pattern)
+
+        if new_patterns:
+            found = {pattern: [] for pattern in new_patterns}
+            for index, token in enumerate(tokens):
+                morphology = token[2]
+                for pattern, compiled_pattern in new_patterns.items():
+                    if compiled_pattern.search(morphology):
+                        found[pattern].append(index)
+            candidates.update(found)
+
+        all_verse_data = {}
+        for name, pattern in identification_patterns.items():
+            verse_data = []
+            for index in candidates[__candidate_key(pattern)]:
+                chapter, verse, morphology, lexeme, strong, lemma, occurrence, gloss = tokens[index]
+                if not self._in_verse_range(f'{chapter}:{verse}'):
+                    continue
+
+                # Append to verse_data with lexeme, verse reference, and combined glosses
+                verse_data.append([f'{book_name} {chapter}:{verse}', gloss, lexeme, morphology])
+            all_verse_data[name] = verse_data
+
+        return all_verse_data
 
     # NOTE: there may be too much variation among the functions to use this for all of them
     # Takes "verse_data" and transforms it into TN form
@@ -218,6 +395,66 @@ class TNPrepper():
             book_name = input("Enter the book name (e.g., 2 Chronicles): ")
         return book_name
 
+    # Parses a range such as "5", "5:3", "5-7", "5:1-20", or "5:1-7:20" into ((chapter, verse), (chapter, verse))
+        # A chapter without a verse covers the whole chapter (including its introduction). Returns None for ''.
+    @staticmethod
+    def _parse_verse_range(text):
+        text = text.replace(' ', '')
+        if not text:
+            return None
+        match = re.fullmatch(r'(\d+)(?::(\d+))?(?:-(\d+)(?::(\d+))?)?', text)
+        if not match:
+            raise ValueError(f'Invalid verse range: {text}')
+
+        start_chapter, start_verse, end_chapter, end_verse = match.groups()
+        start = (int(start_chapter), int(start_verse) if start_verse else 0)
+        if end_chapter is None:
+            end = (start[0], start[1] if start_verse else float('inf'))
+        elif end_verse is None and start_verse:
+            # "5:1-20" ends in the same chapter
+            end = (start[0], int(end_chapter))
+        else:
+            end = (int(end_chapter), int(end_verse) if end_verse else float('inf'))
+
+        if end < start:
+            raise ValueError(f'Invalid verse range: {text}')
+        return start, end
+
+    # Returns (chapter, verse) for references such as "Ruth 1:2", "1:2", or "1:2-4" (verse 0 for "1:intro"), or None
+    @staticmethod
+    def _reference_key(reference):
+        match = re.search(r'(\d+):(\w+)', reference or '')
+        if not match:
+            return None
+        verse = match.group(2)
+        return int(match.group(1)), int(verse) if verse.isdigit() else 0
+
+    # True if there is no verse range, or if "reference" lies in it
+    def _in_verse_range(self, reference):
+        if not self.verse_range:
+            return True
+        key = self._reference_key(reference)
+        return key is not None and self.verse_range[0] <= key <= self.verse_range[1]
+
+    # Keeps the rows (dicts with a 'Reference' or lists starting with the reference) in the verse range
+    def _filter_verse_range(self, rows):
+        if not self.verse_range:
+            return rows
+        return [row for row in rows if self._in_verse_range(row['Reference'] if isinstance(row, dict) else row[0])]
+
+    # With a verse range, the rows in the range replace the rows of the same verses in the existing output
+    def __splice_verse_range(self, output_file, rows, reference_of, existing_rows):
+        if not self.verse_range or not os.path.exists(output_file):
+            return rows
+
+        kept_rows = [row for row in existing_rows(output_file) if not self._in_verse_range(reference_of(row))]
+        new_rows = [row for row in rows if self._in_verse_range(reference_of(row))]
+
+        # Rows without a reference go to the end; sorted() keeps the order of rows in the same verse
+        spliced_rows = sorted(kept_rows + new_rows, key=lambda row: self._reference_key(reference_of(row)) or (float('inf'), 0))
+        print(f"Replaced verses {os.getenv('VERSE_RANGE')} in {output_file} ({len(new_rows)} rows; {len(kept_rows)} rows kept)")
+        return spliced_rows
+
     def _parse_verse_ref(self, verse_ref):
         # Function to split verse_ref into chapter and verse and return as tuple for sorting
         chapter, verse = verse_ref.split(':')
@@ -238,6 +475,12 @@ class TNPrepper():
 
         output_file = self.__setup_output(book_name, file)
 
+        if fieldnames:
+            reference_field = list(fieldnames)[0]
+            data = self.__splice_verse_range(output_file, list(data), lambda row: row.get(reference_field, ''), self._read_tsv)
+        else:
+            data = self.__splice_verse_range(output_file, list(data), lambda row: row[0] if row else '', lambda path: self._read_tsv_as_lists(path)[1:])
+
         # Write results to a TSV file
         with open(output_file, mode='w', newline='', encoding='utf-8') as file:
             if fieldnames:
@@ -255,6 +498,12 @@ class TNPrepper():
 
         output_file = self.__setup_output(book_name, file_name)
 
+        def __existing_lines(path):
+            with open(path, mode='r', encoding='utf-8') as file:
+                return file.read().splitlines()[1:]
+
+        data = self.__splice_verse_range(output_file, list(data), lambda line: line.split('\t', 1)[0], __existing_lines)
+
         with open(output_file, mode='w', newline='', encoding='utf-8') as file:
             file.write('\t'.join(headers) + '\n')  # Write headers
 
@@ -266,6 +515,8 @@ class TNPrepper():
 
         output_file = self.__setup_output(book_name, file_name)
 
+        data = self.__splice_verse_range(output_file, list(data), lambda row: row.get(headers[0], ''), self._read_tsv)
+
         with open(output_file, mode='w', newline='', encoding='utf-8') as file:
             writer = csv.DictWriter(file, delimiter='\t', fieldnames=headers)
             writer.writeheader()
@@ -274,41 +525,106 @@ class TNPrepper():
         print(f'data written to {output_file}')
 
     def _write_report(self, data, message, book_name):
+        # Write the whole section at once, since several scripts may append to the report at the same time
+        section = f'{message}' + ''.join(f'{line}\n' for line in data)
         with open(f'output/{book_name}/report.md', 'a', encoding='utf-8') as report_file:
-            report_file.write(f'{message}')
-            for line in data:
-                report_file.write(f'{line}\n')
+            report_file.write(section)
 
 
 
 
 
+    # Merges each row into the previous one when both are in the same verse and its lexeme starts with the previous lexeme
+    def _merge_glosses(self, verse_data):
+        merged_rows = []
+        for row in verse_data:
+            reference, gloss, lexeme, morphology = row[:4]
+            chapter_verse = reference.rsplit(' ', 1)[-1]
+            while merged_rows:
+                previous_reference, previous_gloss, previous_lexeme, previous_morphology = merged_rows[-1]
+                if previous_reference.rsplit(' ', 1)[-1] != chapter_verse or not lexeme.startswith(previous_lexeme):
+                    break
+                merged_rows.pop()
+                gloss = f'{previous_gloss}…{gloss}'
+            merged_rows.append([reference, gloss, lexeme, morphology])
+        return merged_rows
+
+    # Keeps the rows in which "pattern" is found (searched in the whole tab-separated row)
+    def _filter_rows(self, rows, pattern):
+        compiled_pattern = re.compile(pattern)
+        filtered_rows = [row for row in rows if compiled_pattern.search('\t'.join(row))]
+
+        # An empty result has always been written as one empty row
+        return filtered_rows or [['']]
+
+    # Returns the largest group (at least two) of "glosses" found together, without overlapping, in one sentence of "verse"
+    def _align_glosses(self, verse, glosses, min_gap=1, possessive=False):
+        start_time = time.time()
+        stats = self.alignment_stats
+        stats['verses'] += 1
+        stats['most_glosses'] = max(stats['most_glosses'], len(glosses))
+
+        # Guard against pathological verses; their rows are simply not combined
+        if len(glosses) > self.max_verse_glosses:
+            stats['guarded'] += 1
+            print(f'Not aligning {len(glosses)} glosses in one verse (MAX_VERSE_GLOSSES is {self.max_verse_glosses})')
+            return set()
+
+        # Positions of the rows that have each gloss
+        rows_by_gloss = {}
+        for index, gloss in enumerate(glosses):
+            if '…' not in gloss:
+                rows_by_gloss.setdefault(gloss, []).append(index)
+
+        delimiters = [match.start() for match in re.finditer(r'[;.?:!]', verse)]
+        sentences = {}
+        for gloss in rows_by_gloss:
+            search_form = re.sub(' s ', '’s ', gloss) if possessive else gloss
+            # A lookahead finds overlapping occurrences too
+            for match in re.finditer(rf'(?=({re.escape(search_form)}))', verse, re.IGNORECASE):
+                start, end = match.span(1)
+                sentence = bisect.bisect_left(delimiters, start)
+                if end == start or bisect.bisect_left(delimiters, end) != sentence:
+                    continue
+                sentences.setdefault(sentence, []).append((end, start, gloss))
+
+        # The largest group wins; between groups of the same size, the one with the earliest rows
+        best_group = []
+        for sentence in sorted(sentences):
+            group = []
+            last_end = None
+            for end, start, gloss in sorted(sentences[sentence]):
+                used = sum(1 for index in group if glosses[index] == gloss)
+                if used == len(rows_by_gloss[gloss]):
+                    continue
+                if last_end is not None and start < last_end + min_gap:
+                    continue
+                group.append(rows_by_gloss[gloss][used])
+                last_end = end
+            if (len(group), [-index for index in sorted(group)]) > (len(best_group), [-index for index in sorted(best_group)]):
+                best_group = group
+
+        stats['seconds'] += time.time() - start_time
+        if len(best_group) < 2:
+            return set()
+        stats['combined'] += 1
+        return {glosses[index] for index in best_group}
+
+    # Prints how many verses _align_glosses looked at, combined, and skipped
+    def _report_alignment(self):
+        stats = self.alignment_stats
+        print(f"Aligned glosses in {stats['verses']} verses ({stats['combined']} combined, {stats['guarded']} over MAX_VERSE_GLOSSES, "
+              f"at most {stats['most_glosses']} glosses in a verse) in {stats['seconds']:.2f}s")
+
     # SupportReference specific functions
     ## figs-go
     def _figs_go(self, verse_data):
         # Write all collected data to the output file only if there are abstract nouns found
         modified_verse_data = list()
         if verse_data:
-            # Join all lines into a single string for search and replace
-            all_text = '\n'.join(['\t'.join(line) for line in verse_data])
-
-            # Define the search and replace pattern
-            search_pattern = r'.+? (\d+:\d+)\t(.+?)\t(.+?)\t.+\n(.+? \1\t)(.+?\t\3.+)'
-            replace_with = r'\4\2…\5'
-
-            # Apply search and replace until no changes are detected
-            while True:
-                new_text = re.sub(search_pattern, replace_with, all_text)
-                if new_text == all_text:
-                    break
-                all_text = new_text
-            all_text = re.sub(r'(.+\b(go|goes|gone|going|went|come|comes|coming|came|take|takes|taken|taking|took|bring|brings|bringing|brought)\b)', r'~\1', all_text)
-            all_text = re.sub(r'\n[^~].+', r'', all_text)
-            all_text = re.sub(r'^[^~].+', r'', all_text)
-            all_text = re.sub(r'^\n', r'', all_text)
-            all_text = re.sub(r'~', r'', all_text)
-            # Split the modified string back into lines
-            modified_verse_data = [line.split('\t') for line in all_text.split('\n')]
+            # Merge the glosses of the same word, then keep only forms of go, come, take, and bring
+            modified_verse_data = self._merge_glosses(verse_data)
+            modified_verse_data = self._filter_rows(modified_verse_data, r'.\b(go|goes|gone|going|went|come|comes|coming|came|take|takes|taken|taking|took|bring|brings|bringing|brought)\b')
 
         return modified_verse_data
 
@@ -396,26 +712,9 @@ class TNPrepper():
     def _figs_passive(self, verse_data):
         modified_verse_data = list()
         if verse_data:
-            # Join all lines into a single string for search and replace
-            all_text = '\n'.join(['\t'.join(line) for line in verse_data])
-
-            # Define the search and replace pattern
-            search_pattern = r'.+? (\d+:\d+)\t(.+?)\t(.+?)\t.+\n(.+? \1\t)(.+?\t\3.+)'
-            replace_with = r'\4\2…\5'
-
-            # Apply search and replace until no changes are detected
-            while True:
-                new_text = re.sub(search_pattern, replace_with, all_text)
-                if new_text == all_text:
-                    break
-                all_text = new_text
-            all_text = re.sub(r'(.+\b(am|are|is|was|were|be|being|been)\b.+\b.*?(arisen|awoke|been|borne|beaten|become|begun|bent|bet|bound|bitten|bled|blown|broken|brought|built|burst|bought|caught|chosen|come|cost|crept|cut|dealt|dug|dived|done|drawn|dreamed|dreamt|drunk|driven|eaten|fallen|fed|felt|fought|found|fitted|fit|fled|flung|flown|forbidden|forgotten|forgot|forgiven|frozen|got|gotten|given|gone|grown|hanged|hung|had|heard|hidden|hit|held|hurt|kept|kneeled|knelt|knitted|known|laid|led|left|lent|let|lain|lied|lighted|lit|lost|made|meant|met|paid|pled|proved|proven|put|quit|read|ridden|rung|risen|run|said|seen|sought|sold|sent|set|sewed|sewn|shaken|shone|shined|shot|showed|shown|shrunk|shut|sung|sunk|sat|slain|slept|slid|slit|spoken|spent|spun|spat|spit|split|spread|sprung|stood|stolen|stuck|stung|stunk|stridden|struck|strung|sworn|swept|swollen|swum|swung|taken|taught|torn|told|thought|thrown|understood|waked up|woken up|worn|wed|wept|welcomed|wet|won|wrung|written|ed|en)\b.+)', r'~\1', all_text)
-            all_text = re.sub(r'\n[^~].+', r'', all_text)
-            all_text = re.sub(r'^[^~].+', r'', all_text)
-            all_text = re.sub(r'^\n', r'', all_text)
-            all_text = re.sub(r'~', r'', all_text)
-            # Split the modified string back into lines
-            modified_verse_data = [line.split('\t') for line in all_text.split('\n')]
+            # Merge the glosses of the same word, then keep only English passive forms
+            modified_verse_data = self._merge_glosses(verse_data)
+            modified_verse_data = self._filter_rows(modified_verse_data, r'.\b(am|are|is|was|were|be|being|been)\b.+\b.*?(arisen|awoke|been|borne|beaten|become|begun|bent|bet|bound|bitten|bled|blown|broken|brought|built|burst|bought|caught|chosen|come|cost|crept|cut|dealt|dug|dived|done|drawn|dreamed|dreamt|drunk|driven|eaten|fallen|fed|felt|fought|found|fitted|fit|fled|flung|flown|forbidden|forgotten|forgot|forgiven|frozen|got|gotten|given|gone|grown|hanged|hung|had|heard|hidden|hit|held|hurt|kept|kneeled|knelt|knitted|known|laid|led|left|lent|let|lain|lied|lighted|lit|lost|made|meant|met|paid|pled|proved|proven|put|quit|read|ridden|rung|risen|run|said|seen|sought|sold|sent|set|sewed|sewn|shaken|shone|shined|shot|showed|shown|shrunk|shut|sung|sunk|sat|slain|slept|slid|slit|spoken|spent|spun|spat|spit|split|spread|sprung|stood|stolen|stuck|stung|stunk|stridden|struck|strung|sworn|swept|swollen|swum|swung|taken|taught|torn|told|thought|thrown|understood|waked up|woken up|worn|wed|wept|welcomed|wet|won|wrung|written|ed|en)\b.+')
 
         return modified_verse_data
 
@@ -426,23 +725,22 @@ class TNPrepper():
         Pual = []
         Other = []
 
-        # Define the regex patterns
-        niphal_pattern = r'.+\tHe,.*?VN.+'
-        qal_passive_pattern = r'.+\tHe,.*?(Vqs|VQ).+'
-        hophal_pattern = r'.+\tHe,.*?(VH).+'
-        pual_pattern = r'.+\tHe,.*?(VP).+'
-
-        # Process each line to categorize
+        # Process each line to categorize by the stem and type of its Hebrew verb
         for line in modified_verse_data:
             # Join the columns into a single string
             line_str = '\t'.join(line)
-            if re.search(niphal_pattern, line_str):
+
+            language, segments = MorphIndex.parse_morphology(line[-1]) if len(line) > 1 else ('', [])
+            verbs = [segment for segment in segments if segment['pos'] == 'V'] if language == 'He' else []
+            stems = {verb.get('stem') for verb in verbs}
+
+            if 'N' in stems:
                 Niphal.append(line_str)
-            elif re.search(qal_passive_pattern, line_str):
+            elif 'Q' in stems or any(verb.get('stem') == 'q' and verb.get('type') == 's' for verb in verbs):
                 Qal_passive.append(line_str)
-            elif re.search(hophal_pattern, line_str):
+            elif 'H' in stems:
                 Hophal.append(line_str)
-            elif re.search(pual_pattern, line_str):
+            elif 'P' in stems:
                 Pual.append(line_str)
             else:
                 Other.append(line_str)
@@ -489,12 +787,11 @@ class TNPrepper():
         custom_words_to_remove = ["and", "but", "then", "in", "now", "Yahweh", "Israel"]
         # Function to fetch words from a URL
         def __extract_words_from_url(url):
-            response = requests.get(url)
-            if response.status_code == 200:
-                html_content = response.text
+            html_content = self._get_file_content(url)
+            if html_content:
                 return __extract_words_from_html(html_content)
             else:
-                print(f"Failed to retrieve the page. Status code: {response.status_code}")
+                print(f"Failed to retrieve the page: {url}")
                 return []
 
         # Function to extract words from HTML content
@@ -584,73 +881,51 @@ class TNPrepper():
     # figs-abstractnouns
     def _figs_abstractnouns(self, verse_data, ab_nouns):
         def __combine_glosses(verse_data):
-            # Define the search and replace pattern
-            search_pattern = r'([^\n]*\d+:\d+)\t([^\n]+?)\t([^\n]+?)\t(.+?)\n(\1\t)([^\n]+?)(\t\3[^\n]+)'
-            replace_with = r'\1\t\2…\6\t\3\t\4'
-
-            combined_data = []
-            for verse in verse_data:
-                # Join elements in each inner list into a single string
-                combined_verse = '\t'.join(verse)
-                combined_data.append(combined_verse)
-            combined_data = '\n'.join(combined_data)
-
-            # Apply search and replace until no changes are detected
-            while True:
-                new_text = re.sub(search_pattern, replace_with, combined_data, flags=re.DOTALL)
-                if new_text == combined_data:
-                    break
-                combined_data = new_text
-
-            combined_data = combined_data.split('\n')
+            # Each row is merged into the first kept row of its verse whose lexeme its own lexeme starts with
+            def __combine_verse(rows):
+                kept_rows = []
+                for row in rows:
+                    for kept_row in kept_rows:
+                        if row[2].startswith(kept_row[2]):
+                            kept_row[1] = f'{kept_row[1]}…{row[1]}'
+                            break
+                    else:
+                        kept_rows.append(row)
+                return kept_rows
 
-            return combined_data
+            for reference, rows in groupby(verse_data, key=lambda row: row[0]):
+                for row in __combine_verse([list(row) for row in rows]):
+                    yield '\t'.join(row)
 
         def __find_abnouns(combined_data, ab_nouns):
-            found_instances = []
-            patterns = {}
-            for ab_noun in ab_nouns:
-                if ' ' in ab_noun:
-                    ab_noun1, ab_noun2 = ab_noun.split(' ', 1)
-                    patterns[ab_noun] = re.compile(rf'.+?\t.*?\b{ab_noun1}\b.*?\b{ab_noun2}\b.*?\t.+', re.IGNORECASE)
-                else:
-                    patterns[ab_noun] = re.compile(rf'.+?\t.*?\b{ab_noun}\b.*?\t.+', re.IGNORECASE)
+            # All abstract nouns are searched for in a single pass over each line
+            matcher = LexiconMatcher(ab_nouns)
 
             for line in combined_data:
-                for ab_noun, pattern in patterns.items():
-                    matches = pattern.findall(line)
-                    if matches:
-                        for match in matches:
-                            # Append to verse_data with lexeme, verse reference, and ab_noun
-                            found_instances.append(f'{match}\t{ab_noun}\n')
-            return found_instances
+                # Abstract nouns are searched for between the reference and the morphology
+                first_tab = line.find('\t', 1)
+                last_tab = line.rfind('\t', 0, len(line) - 1)
+                if first_tab == -1 or last_tab <= first_tab:
+                    continue
+                for ab_noun in matcher.find(line[first_tab + 1:last_tab]):
+                    # Append to verse_data with lexeme, verse reference, and ab_noun
+                    yield f'{line}\t{ab_noun}\n'
 
         def __delete_repeats(found_instances):
+            # Consecutive rows for the same reference, glosses, lexeme, and morphology keep only the last one
+            modified_verse_data = []
+            previous_key = None
+            for line in found_instances:
+                line = line.rstrip('\n')
+                key = line.rsplit('\t', 1)[0]
+                if modified_verse_data and key == previous_key:
+                    modified_verse_data[-1] = line
+                else:
+                    modified_verse_data.append(line)
+                previous_key = key
 
-            # Apply regex replacements repeatedly
-            def apply_replacements(text, patterns):
-                while True:
-                    new_text = text
-                    for pattern, replacement in patterns:
-                        new_text = re.sub(pattern, replacement, new_text)
-                    if new_text == text:
-                        break
-                    text = new_text
-                return text
-
-            # Define the patterns and replacements
-            replacements = [
-                (r'([^\n]+?\d)(\t)([^\n\t]+)(\t)([^\n\t]+\t[^\n\t]+)(\t)([^\n\t]+)\n(\1\2\3\4\5\t[^\n\t]+)', r'\8')
-            ]
-
-            # Join the verse_data list into a single string
-            verse_data_str = ''.join(found_instances)
-
-            # Apply the replacements
-            verse_data_str = apply_replacements(verse_data_str, replacements)
-
-            # Split back into a list
-            modified_verse_data = verse_data_str.split('\n')
+            # The rows have always ended with an empty line
+            modified_verse_data.append('')
 
             return modified_verse_data
 
@@ -720,24 +995,97 @@ class TNPrepper():
 
     # LLM query stuff
 
-    # Function to wait between queries
-    def __wait_between_queries(self, seconds):
-        print(f"Waiting for {seconds} seconds...")
-        time.sleep(seconds)
+    # Runs the prompt chain "process_prompt" for every chapter, concurrently or in batches, and returns the responses in chapter order
+        # "checkpoint_name" names the script (and prompt chain) whose checkpoint is written and resumed
+    def _dispatch_chapters(self, chapters, process_prompt, checkpoint_name):
+        chapter_contents = ["\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses]) for verses in chapters.values()]
+        # Not every script keeps its book in self.book_name; those that do may be running another book than BOOK_NAME
+        book_name = getattr(self, 'book_name', None) or os.getenv('BOOK_NAME', '')
+        checkpoint = Checkpoint(f"{self.output_base_dir}/{book_name}/checkpoints/{checkpoint_name}.jsonl", name=checkpoint_name)
+
+        stage_gate = None if self.llm_batch.enabled else StageGate(self.llm_concurrency)
+
+        def __process_chapter(chapter, chapter_content):
+            finished, response = checkpoint.get(chapter, chapter_content)
+            if not finished:
+                self.chain_state.gate = stage_gate
+                self.chain_state.stage = 0
+                try:
+                    response = process_prompt(chapter_content)
+                finally:
+                    self.chain_state.gate = None
+                if response:
+                    checkpoint.add(chapter, chapter_content, response)
+            return response
+
+        def __process_chain(chapter, chapter_content):
+            with self.llm_batch.chain():
+                return __process_chapter(chapter, chapter_content)
+
+        async def __dispatch():
+            concurrency = max(1, len(chapter_contents) if self.llm_batch.enabled else self.llm_pipeline_depth)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            # The default executor may have fewer threads than that
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+
+            async def __process(chapter, chapter_content):
+                async with semaphore:
+                    return await asyncio.to_thread(__process_chain if self.llm_batch.enabled else __process_chapter, chapter, chapter_content)
+
+            return await asyncio.gather(*[__process(chapter, chapter_content) for chapter, chapter_content in zip(chapters, chapter_contents)])
+
+        # In batch mode, a batch is only sent once every chapter waits for a response
+        if self.llm_batch.enabled:
+            self.llm_batch.expect_chains(len(chapter_contents))
+
+        start_time = time.time()
+        responses = asyncio.run(__dispatch())
+        print(f'Processed {len(chapter_contents)} chapters in {time.time() - start_time:.1f}s '
+              f'({checkpoint.resumed} resumed, {rate_limiter.throttled_seconds:.1f}s waiting for the rate limit)')
+        if stage_gate and stage_gate.stats:
+            print(f'Requests by stage: {stage_gate.report()}')
+        if self.prompt_cache_stats['prompt_tokens']:
+            cached_share = self.prompt_cache_stats['cached_tokens'] / self.prompt_cache_stats['prompt_tokens']
+            print(f"Prompt tokens: {self.prompt_cache_stats['prompt_tokens']} in {self.prompt_cache_stats['requests']} requests, "
+                  f"{self.prompt_cache_stats['cached_tokens']} cached ({cached_share:.0%})")
+        return responses
+
+    # Returns the stage of the next request of the chain running on this thread (None outside of a chain)
+    def _next_chain_stage(self):
+        if getattr(self.chain_state, 'gate', None) is None:
+            return None
+        stage = self.chain_state.stage
+        self.chain_state.stage += 1
+        return stage
+
+    # Holds a request slot of the chain running on this thread for a request of "stage"
+    @contextmanager
+    def _request_slot(self, stage):
+        gate = getattr(self.chain_state, 'gate', None)
+        if gate is None or stage is None:
+            yield
+            return
+        with gate.slot(stage):
+            yield
 
     # Function to query the LLM
     def _query_llm(self, context, prompt):
         combined_prompt = f"Chapter:\n{context}\n\nPrompt:\n{prompt}"
+        system_prompt = ("I want to write translation notes for translation issues in the Bible."
+                         "These translation notes will include chapter and verse, an explanation of the translation issue, an alternate way to translate the idea without using the figure of speech, and the words from the Bible translation that need to be replaced to include the alternate translation."
+                         "In order to accomplish this goal, I want you to provide me with the precise data I request. You should not provide explanations and interpretation unless you are specifically asked to do so.")
+        temperature = 0.4
         response = None
+        from_cache = False
 
-        try:
-            chat_completion = self.groq_client.chat.completions.create(
+        def __request():
+            # The rate limiter does the retrying, so the client should not
+            raw_response = groq_rate_limiter.send(lambda: self.groq_client.with_options(max_retries=0).chat.completions.with_raw_response.create(
                 messages=[
                     {
                         "role": "system",
-                        "content": "I want to write translation notes for translation issues in the Bible."
-                        "These translation notes will include chapter and verse, an explanation of the translation issue, an alternate way to translate the idea without using the figure of speech, and the words from the Bible translation that need to be replaced to include the alternate translation."
-                        "In order to accomplish this goal, I want you to provide me with the precise data I request. You should not provide explanations and interpretation unless you are specifically asked to do so."
+                        "content": system_prompt
                     },
                     {
                         "role": "user",
@@ -745,10 +1093,15 @@ class TNPrepper():
                     }
                 ],
                 model=self.groq_model,
-                temperature = 0.4
+                temperature = temperature
 
-            )
-            response = chat_completion.choices[0].message.content.strip()
+            ), tokens=len(self.tokenizer.encode(system_prompt)) + len(self.tokenizer.encode(combined_prompt)))
+            chat_completion = raw_response.parse()
+            return chat_completion.choices[0].message.content.strip()
+
+        try:
+            cache_key = self.llm_cache.key('groq', self.groq_model, system_prompt, context, prompt, temperature)
+            response, from_cache = self.llm_cache.fetch(cache_key, __request, provider='groq', model=self.groq_model)
 
         except Exception as e:
             print(f"Request failed: {e}")
@@ -757,34 +1110,65 @@ class TNPrepper():
         finally:
             print(combined_prompt)
             print(f'Response: {response}')
+            if from_cache:
+                print('(cached response)')
             print('---')
 
-            # Waiting, to stay below our request limit (30 reqs/minute)
-            self.__wait_between_queries(2)
-
             return response
 
-    def _query_openai(self, context, prompt):
+    # The system prompt and the chapter come first, so that OpenAI caches them as a prefix shared by every prompt about a chapter
+    def _query_openai(self, context, prompt, response_format=None):
         combined_prompt = f"Chapter:\n{context}\n\nPrompt:\n{prompt}"
+        system_prompt = ("I want to write translation notes for translation issues in the Bible. These translation notes will include chapter and verse, "
+                         "an explanation of the translation issue, an alternate way to translate the idea without using the figure of speech, and the words from the Bible translation "
+                         "that need to be replaced to include the alternate translation. In order to accomplish this goal, I want you to provide me with the precise data I request. "
+                         "You should not provide explanations and interpretation unless you are specifically asked to do so.")
+        temperature = 0.4
         response = None
+        from_cache = False
+        stage = self._next_chain_stage()
+        cached_tokens = None
+        response_token_count = 0
+
+        def __request():
+            nonlocal cached_tokens
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Chapter:\n{context}"},
+                {"role": "user", "content": f"Prompt:\n{prompt}"}
+            ]
+            options = {'response_format': response_format} if response_format else {}
+
+            # Inside a chapter prompt chain in batch mode, the request waits for the next batch
+            if self.llm_batch.in_chain():
+                return self.llm_batch.request(dict({'model': self.model, 'messages': messages, 'temperature': temperature}, **options))
+
+            # The rate limiter does the retrying, so the client should not
+            with self._request_slot(stage):
+                raw_response = rate_limiter.send(lambda: client.with_options(max_retries=0).chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    **options
+                ), tokens=len(self.tokenizer.encode(system_prompt)) + len(self.tokenizer.encode(combined_prompt)))
+            completion = raw_response.parse()
+            usage = getattr(completion, 'usage', None)
+            if usage:
+                rate_limiter.record(usage.completion_tokens)
+                cached_tokens = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None) or 0
+                with self.stats_lock:
+                    self.prompt_cache_stats['requests'] += 1
+                    self.prompt_cache_stats['prompt_tokens'] += usage.prompt_tokens or 0
+                    self.prompt_cache_stats['cached_tokens'] += cached_tokens
+            return completion.choices[0].message.content
 
         try:
-            completion = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "I want to write translation notes for translation issues in the Bible. These translation notes will include chapter and verse, "
-                    "an explanation of the translation issue, an alternate way to translate the idea without using the figure of speech, and the words from the Bible translation "
-                    "that need to be replaced to include the alternate translation. In order to accomplish this goal, I want you to provide me with the precise data I request. "
-                    "You should not provide explanations and interpretation unless you are specifically asked to do so."},
-                    {"role": "user", "content": combined_prompt}
-                ],
-                temperature=0.4
-            )
-
-            response_content = completion.choices[0].message.content
-            response = response_content
+            # A structured response is not the same as a TSV response to the same prompt
+            cache_key = self.llm_cache.key('openai', self.model, system_prompt, context, [prompt, response_format] if response_format else prompt, temperature)
+            response, from_cache = self.llm_cache.fetch(cache_key, __request, provider='openai', model=self.model)
 
-        except openai.error.OpenAIError as e:
+        # Not only API errors: the cache and everything around the request can fail too
+        except Exception as e:
             print(f"Failed to get response for prompt: {prompt}")
             print(f"Exception: {e}")
 
@@ -800,10 +1184,108 @@ class TNPrepper():
                 response_token_count = len(response_tokens)
                 print(f"Token count for the response: {response_token_count}")
             print(f'Total tokens: ', query_token_count + response_token_count)
+            if cached_tokens is not None:
+                print(f'Cached prompt tokens: {cached_tokens}')
+            if from_cache:
+                print('(cached response)')
             print('---')
 
             return response
 
+    # Asks "prompt" for a table with the columns "headers" and returns the response ({"rows": [[value, ...], ...]})
+    def _query_rows(self, context, prompt, headers):
+        return self._query_openai(context, f'{prompt}\n\n{self._rows_instruction(len(headers))}', response_format=self._rows_format(len(headers)))
+
+    # Returns the end of a table prompt, which asks for the rows as JSON
+    @staticmethod
+    def _rows_instruction(column_count):
+        return ('Return the table as JSON in this form: {"rows": [["value 1", "value 2", ...], ...]}, '
+                f'with one list of exactly {column_count} text values for each row, in the order given above. '
+                'Do not include a header row or any explanation. If there are no rows, return {"rows": []}.')
+
+    # Returns the response_format of a table prompt with "column_count" values per row (any number if None),
+        # or None with STRUCTURED_OUTPUT=0. Tables with the same number of columns share one schema, and so
+        # the cached prompt prefix of a chapter.
+    def _rows_format(self, column_count=None):
+        if not self.structured_output:
+            return None
+        row_schema = {'type': 'array', 'items': {'type': 'string'}}
+        if column_count:
+            row_schema.update(minItems=column_count, maxItems=column_count)
+        return {
+            'type': 'json_schema',
+            'json_schema': {
+                'name': 'rows',
+                'strict': True,
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'rows': {
+                            'type': 'array',
+                            'items': row_schema
+                        }
+                    },
+                    'required': ['rows'],
+                    'additionalProperties': False
+                }
+            }
+        }
+
+    # True if "row" has a text value for each column (and a chapter and verse, if it has a reference)
+    def __valid_row(self, row, headers):
+        if not isinstance(row, dict) or set(row) != set(headers):
+            return False
+        if not all(isinstance(row[header], str) for header in headers):
+            return False
+        return 'Reference' not in row or self._reference_key(row['Reference']) is not None
+
+    # Returns the rows of one response as (values, text) pairs: the lists of a JSON response, or the tab-separated lines of a TSV response
+    @staticmethod
+    def _response_rows(response):
+        # A JSON response without the schema may come in a code block
+        text = re.sub(r'^\s*```(?:json)?\s*|\s*```\s*$', '', response)
+        try:
+            structured_response = json.loads(text)
+        except ValueError:
+            structured_response = None
+        if isinstance(structured_response, dict) and isinstance(structured_response.get('rows'), list):
+            return [(row if isinstance(row, list) else None, json.dumps(row, ensure_ascii=False)) for row in structured_response['rows']]
+
+        # Lines without a tab are not rows (e.g. "None" or a sentence before the table)
+        return [(line.split('\t'), line) for line in response.split('\n') if '\t' in line]
+
+    # Returns the rows of the responses to a table prompt as dicts; rows that do not fit the columns go to report.md
+    def _parse_rows(self, responses, headers):
+        return self._fit_rows([candidate for response in responses if response for candidate in self._response_rows(response)], headers)
+
+    # Returns the rows of "candidates" ((values, text) pairs) that fit the columns "headers" as dicts; the others go to report.md
+    def _fit_rows(self, candidates, headers):
+        rows = []
+        malformed_rows = []
+        for values, row_text in candidates:
+            # A header row is not a row
+            if values is not None and [str(value).strip() for value in values] == list(headers):
+                continue
+            row = dict(zip(headers, values)) if values is not None and len(values) == len(headers) else None
+            if self.__valid_row(row, headers):
+                # A tab or line break in a value would break the TSV files
+                rows.append({header: re.sub(r'[\t\r\n]+', ' ', row[header]) for header in headers})
+            else:
+                malformed_rows.append(row_text)
+
+        if malformed_rows:
+            print(f"{len(malformed_rows)} of {len(rows) + len(malformed_rows)} rows did not fit the columns {', '.join(headers)} and were not used:")
+            self._report_rows(malformed_rows, f'that did not fit the columns {", ".join(headers)}')
+        return rows
+
+    # Prints rows of a response that were not used and adds them to report.md
+    def _report_rows(self, row_texts, description):
+        for row_text in row_texts:
+            print(f'  {row_text}')
+        book_name = getattr(self, 'book_name', None) or os.getenv('BOOK_NAME')
+        if book_name and os.path.isdir(f'output/{book_name}'):
+            self._write_report(row_texts, f'\n## Rows of {type(self).__name__} {description}\n', book_name)
+
     ## Combine name notes together (use at the end of ATs_snippets.py)
     def _combine_names(self, ai_notes):
         # Join all lines into a single string
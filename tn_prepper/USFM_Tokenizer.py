@@ -0,0 +1,110 @@
+import re
+import codecs
+
+
+class USFMTokenizer():
+    # Markers that the tokenizer understands, all anchored at a backslash
+    chapter_verse_pattern = re.compile(r'\\([cv])[ \t]+(\d+)([^\s\\]*)')
+    zaln_start_pattern = re.compile(r'\\zaln-s[ \t]*\|([^\\]*)\\\*')
+    zaln_end_pattern = re.compile(r'\\zaln-e\\\*')
+    word_pattern = re.compile(r'\\w ([^|\\]*)(?:\|([^\\]*))?\\w\*')
+    marker_pattern = re.compile(r'\\(\+?[A-Za-z0-9-]+)(\\\*|\*| )?')
+    attribute_pattern = re.compile(r'([\w-]+)="([^"]*)"')
+
+    def __init__(self, chunk_size=65536):
+        # Number of characters read from a file at a time
+        self.chunk_size = chunk_size
+
+    # Yields pieces of decoded text from a string, bytes, or a (text or binary) file object
+    def __read(self, source):
+        if isinstance(source, str):
+            yield source
+            return
+        if isinstance(source, bytes):
+            yield source.decode('utf-8')
+            return
+
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        while True:
+            piece = source.read(self.chunk_size)
+            if not piece:
+                break
+            if isinstance(piece, bytes):
+                piece = decoder.decode(piece)
+            if piece:
+                yield piece
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+    def __attributes(self, text):
+        return dict(self.attribute_pattern.findall(text))
+
+    # Tries to read the marker that starts at "start"; returns (event, end) or None if the buffer is too short
+    def __parse_marker(self, buffer, start, eof):
+        # Markers and their attributes never span lines, so wait until the whole line is buffered
+        if not eof and buffer.find('\n', start) == -1:
+            return None
+
+        for pattern in (self.chapter_verse_pattern, self.zaln_start_pattern, self.zaln_end_pattern, self.word_pattern, self.marker_pattern):
+            match = pattern.match(buffer, start)
+            if not match:
+                continue
+
+            if pattern is self.chapter_verse_pattern:
+                return (match.group(1), int(match.group(2)), None), match.end()
+            if pattern is self.zaln_start_pattern:
+                return ('zaln-s', None, self.__attributes(match.group(1))), match.end()
+            if pattern is self.zaln_end_pattern:
+                return ('zaln-e', None, None), match.end()
+            if pattern is self.word_pattern:
+                return ('w', match.group(1), self.__attributes(match.group(2) or '')), match.end()
+
+            # Any other marker; closing markers keep their asterisk (e.g. "f*", "ts*")
+            name = match.group(1)
+            if match.group(2) in ('*', '\\*'):
+                name += '*'
+            return ('marker', name, None), match.end()
+
+        # A lone backslash is just text
+        return ('text', '\\', None), start + 1
+
+    # Yields (kind, value, attributes) events in document order:
+    #   ('c', chapter number, None), ('v', verse number, None),
+    #   ('zaln-s', None, {'x-strong': ..., 'x-lemma': ..., 'x-morph': ..., 'x-occurrence': ..., 'x-content': ...}),
+    #   ('zaln-e', None, None), ('w', word, {'x-occurrence': ...}),
+    #   ('marker', name, None) for every other marker, and ('text', text, None) for the text between markers.
+    # Only the current piece of input and one unfinished marker are held in memory.
+    def tokenize(self, source):
+        buffer = ''
+        pos = 0
+        eof = False
+        pieces = self.__read(source)
+
+        while True:
+            backslash = buffer.find('\\', pos)
+
+            if backslash == -1:
+                # Nothing but text left in the buffer
+                if eof:
+                    if pos < len(buffer):
+                        yield ('text', buffer[pos:], None)
+                    return
+            else:
+                parsed = self.__parse_marker(buffer, backslash, eof)
+                if parsed:
+                    event, end = parsed
+                    if backslash > pos:
+                        yield ('text', buffer[pos:backslash], None)
+                    yield event
+                    pos = end
+                    continue
+
+            # Read more input, dropping what has already been consumed
+            piece = next(pieces, None)
+            buffer = buffer[pos:]
+            pos = 0
+            if piece is None:
+                eof = True
+            else:
+                buffer += piece
@@ -2,13 +2,15 @@ from TNPrepper import TNPrepper
 from groq import Groq
 import os
 import csv
-import requests
 import re
 import spacy
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
 class Unknowns(TNPrepper):
+    # Columns of the rows the last prompt asks for
+    row_headers = ['Reference', 'Explanation', 'Snippet', 'Alternate Translation']
+
     def __init__(self, book_name):
         super().__init__()
 
@@ -20,16 +22,16 @@ class Unknowns(TNPrepper):
         prompt = (
             "You have been given a chapter from the Bible. Identify any individual words that refer to objects or things that would be unfamiliar to people in other cultures.\n"
             "Do not include proper nouns such as names of people (e.g., 'David'), places (e.g., 'Lebanon', 'Zion'), or specific entities (e.g., 'Temple', 'Ark of the Covenant'). Proper nouns are typically capitalized and refer to unique entities, whereas common nouns refer to general items or concepts.\n" 
-            "As your answer, you will provide a TSV table with exactly four tab-separated values. If there are multiple unfamiliar words in a verse, include a separate row in the able for each one.\n"
+            "As your answer, you will provide a table with exactly four values in each row. If there are multiple unfamiliar words in a verse, include a separate row in the table for each one.\n"
             "\n(1) The first column will provide the chapter and verse where the unknown word is found. Do not include the book name. Make sure that you identify the verse where the word is found."
             "\n(2) The second column will provide an explanation of the unknown word. The explanation should be in this exact form: 'The word or phrase **[unknown word]** refers to [explanation]. If your readers would not be familiar with [unknown word], you could refer to a similar [class of unknown word] in your culture, or you could use a general expression.' Replace the words in brackets with the appropriate information from the verse and context. Only use double asterisks when you quote exactly from the verse."
             "\n(3) The third column will provide an exact quote from the verse. This quote will be the section of the verse that would need to be rephrased to express the idea without using the unknown word."
-            "\n(4) The fourth column will provide a way to express the exact quote from the fourth value in a more general way, without using the unknown word."
+            "\n(4) The fourth column will provide a way to express the exact quote from the third column in a more general way, without using the unknown word."
             "\nBe sure that the items in each row are consistent in how they understand the unknown word.\n"
-            "Also, make sure that each row contains exactly four tab-separated values."
+            "Also, make sure that each row contains exactly four values."
         )
 
-        return self._query_openai(chapter_content, prompt)
+        return self._query_rows(chapter_content, prompt, self.row_headers)
     
     def _transform_response(self, mod_ai_data):
         if mod_ai_data:
@@ -71,12 +73,11 @@ class Unknowns(TNPrepper):
 
         # Function to fetch words from a URL
         def __extract_words_from_url(url):
-            response = requests.get(url)
-            if response.status_code == 200:
-                html_content = response.text
+            html_content = self._get_file_content(url)
+            if html_content:
                 return __extract_words_from_html(html_content)
             else:
-                print(f"Failed to retrieve the page. Status code: {response.status_code}")
+                print(f"Failed to retrieve the page: {url}")
                 return []
 
         scraped_names_1 = __extract_words_from_url(url_1)
@@ -115,6 +116,9 @@ class Unknowns(TNPrepper):
         # Load verse texts from TSV
         verse_texts = self._read_tsv(self.verse_text)
 
+        # Keep only the verses in VERSE_RANGE, if one is set
+        verse_texts = self._filter_verse_range(verse_texts)
+
         # Check the stage and limit verse_texts if in development stage
         if os.getenv('STAGE') == 'dev':
             verse_texts = verse_texts[:5]
@@ -129,31 +133,14 @@ class Unknowns(TNPrepper):
                 chapters[chapter] = []
             chapters[chapter].append(verse)
 
-        # Process each chapter for personification
-        ai_data = []
-        for chapter_key, verses in chapters.items():
-            # Combine verses into chapter context
-            chapter_content = "\n".join([f"{verse['Reference']} {verse['Verse']}" for verse in verses])
-            response = self.__process_prompt(chapter_content)
-            if response:
-                ai_data.append(response.split('\n'))
-        
-        # Flatten the list of lists into a single list of dictionaries
-        mod_ai_data = []
-        for row_list in ai_data:
-            for row in row_list:
-                columns = row.split('\t')
-                if len(columns) == 4:
-                    row_dict = {
-                        'Reference': columns[0],
-                        'Explanation': columns[1],
-                        'Snippet': columns[2],
-                        'Alternate Translation': columns[3]
-                    }
-                    mod_ai_data.append(row_dict)
+        # Process the chapters concurrently; the responses come back in chapter order
+        responses = self._dispatch_chapters(chapters, self.__process_prompt, checkpoint_name='Unknowns')
+
+        # The rows of all chapters, checked against the columns (see _parse_rows)
+        mod_ai_data = self._parse_rows(responses, self.row_headers)
 
         # Write the results to a new TSV file
-        headers = ['Reference', 'Explanation', 'Snippet', 'Alternate Translation']
+        headers = self.row_headers
         file_name = 'ai_unknowns.tsv'
         data = mod_ai_data
         self._write_fieldnames_to_tsv(book_name, file_name, data, headers)